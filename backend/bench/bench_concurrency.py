@@ -0,0 +1,181 @@
+"""
+Read latency during write bursts (SQLite concurrency mode, see database.py).
+
+Seeds a synthetic library, starts the app and runs a read mix (book pages, filters, bookshelf,
+stats, search) twice: alone, then while writer clients send bursts of book updates and batch
+registrations. With SQLITE_TUNING=1 (WAL, read-only pool, one serialized writer) read latency
+should stay flat and no write should fail with "database is locked".
+--compare-legacy repeats the run with SQLITE_TUNING=0 (one default engine) on a fresh copy.
+
+Usage (from backend/):
+    python bench/bench_concurrency.py --books 20000
+    python bench/bench_concurrency.py --books 20000 --compare-legacy --output concurrency.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_upstreams  # noqa: E402
+import suite  # noqa: E402
+import synthetic  # noqa: E402
+
+READ_SCENARIOS = ("books_page", "books_filtered", "bookshelf", "stats", "search")
+
+# Books registered by one POST /books/batch write
+BATCH_SIZE = 20
+
+
+def _read_mix(rng, i):
+    factory, _ = suite.SCENARIOS[READ_SCENARIOS[i % len(READ_SCENARIOS)]]
+    return factory(rng, i)
+
+
+async def write_bursts(base_url: str, args, stop: asyncio.Event, seed: int) -> dict:
+    """
+    Until stop is set: a burst of --burst-size writes from --write-concurrency clients, then --burst-pause idle.
+    Three in four writes update a seeded book, the rest register BATCH_SIZE titled books (no lookups).
+    """
+    rng = random.Random(seed)
+    counter = itertools.count()
+    semaphore = asyncio.Semaphore(args.write_concurrency)
+    latencies, statuses = [], Counter()
+
+    async def send(client):
+        i = next(counter)
+        if i % 4 == 3:
+            books = [
+                {"isbn": synthetic.unknown_isbn(2_000_000 + i * BATCH_SIZE + k), "title": f"{synthetic.series_name(i)} {k + 1}"}
+                for k in range(BATCH_SIZE)
+            ]
+            method, path, body = "POST", "/books/batch", {"books": books}
+        else:
+            isbn = synthetic.isbn13(rng.randrange(args.books))
+            method, path, body = "PUT", f"/books/{isbn}", {"status": rng.choice(synthetic.STATUSES), "location": rng.choice(synthetic.LOCATIONS)}
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                await response.aread()
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=args.write_concurrency, max_keepalive_connections=args.write_concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.gather(*(send(client) for _ in range(args.burst_size)))
+            try:
+                await asyncio.wait_for(stop.wait(), args.burst_pause)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = time.perf_counter() - started
+    return suite.summarize(latencies, statuses, elapsed)
+
+
+async def reads_during_writes(base_url: str, args) -> tuple:
+    stop = asyncio.Event()
+    writer = asyncio.create_task(write_bursts(base_url, args, stop, args.seed + 2))
+    reads = await suite.drive(base_url, _read_mix, args.requests, args.concurrency, args.seed + 1)
+    stop.set()
+    return reads, await writer
+
+
+def run_mode(args, tuning: bool, workdir: str) -> dict:
+    env = suite.app_environment(workdir, args)
+    env["SQLITE_TUNING"] = "1" if tuning else "0"
+    # Writes carry titles, nothing is looked up; the providers point at a closed port
+    env.update(fake_upstreams.urls(f"http://127.0.0.1:{fake_upstreams.free_port()}"))
+    suite.seed_library(env, args.books, args.seed)
+
+    port = fake_upstreams.free_port()
+    log_path = os.path.join(workdir, "app.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        app = suite.start_app(env, port, log)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            # Warm up connections and caches so both phases start from the same state
+            asyncio.run(suite.drive(base_url, _read_mix, args.concurrency * 2, args.concurrency, args.seed))
+            alone = asyncio.run(suite.drive(base_url, _read_mix, args.requests, args.concurrency, args.seed + 1))
+            during, writes = asyncio.run(reads_during_writes(base_url, args))
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+
+    with open(log_path, encoding="utf-8") as log:
+        locked = sum(line.count("database is locked") for line in log)
+    result = {"reads_alone": alone, "reads_during_writes": during, "writes": writes, "database_locked_log_lines": locked}
+    for p in ("p50", "p95", "p99"):
+        before, after = alone["latency_ms"][p], during["latency_ms"][p]
+        result[f"read_{p}_ratio"] = round(after / before, 2) if before else None
+    return result
+
+
+def _print(name: str, result: dict):
+    print(f"{name}:")
+    for phase in ("reads_alone", "reads_during_writes", "writes"):
+        summary = result[phase]
+        latency = summary["latency_ms"]
+        print(f"  {phase:20} {summary['requests']:6} req  {summary['throughput_rps']:8.1f} req/s  "
+              f"p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  p99 {latency['p99']:8.2f} ms  "
+              f"errors {summary['errors']}  {summary['status_codes']}")
+    print(f"  read latency during writes / alone: p50 x{result['read_p50_ratio']}  p95 x{result['read_p95_ratio']}  "
+          f"p99 x{result['read_p99_ratio']};  'database is locked' in log: {result['database_locked_log_lines']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure read latency during write bursts")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=2000, help="Read requests per phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="Read clients")
+    parser.add_argument("--write-concurrency", type=int, default=8, help="Writer clients")
+    parser.add_argument("--burst-size", type=int, default=40, help="Writes per burst")
+    parser.add_argument("--burst-pause", type=float, default=0.2, help="Seconds between bursts")
+    parser.add_argument("--compare-legacy", action="store_true", help="Also run with SQLITE_TUNING=0")
+    parser.add_argument("--output", default="concurrency_results.json")
+    args = parser.parse_args()
+    # Read by suite.app_environment
+    args.metadata_cache = False
+    args.client_rate_limits = False
+
+    results = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": suite._git_commit(),
+            "cpu_count": os.cpu_count(),
+            **{key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "modes": {},
+    }
+    modes = [("tuned", True)] + ([("legacy", False)] if args.compare_legacy else [])
+    for name, tuning in modes:
+        workdir = tempfile.mkdtemp(prefix=f"library-concurrency-{name}-")
+        try:
+            results["modes"][name] = run_mode(args, tuning, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        _print(name, results["modes"][name])
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
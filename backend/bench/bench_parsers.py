@@ -0,0 +1,101 @@
+"""
+Micro-benchmarks for the response parsers and the merge in utils.py, and the title pipeline.
+
+Usage (from backend/):
+    python bench/bench_parsers.py [--repeat 5] [--json parsers.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import utils  # noqa: E402
+import title_parser  # noqa: E402
+import synthetic  # noqa: E402
+from bench_title_parser import AUTHORS, CACHED_FUNCTIONS, expand, load_corpus, pipeline  # noqa: E402
+
+SAMPLE_SIZE = 2000
+
+
+def _time(func, items, repeat: int) -> dict:
+    """
+    Best of repeat runs of func over items, per item.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {"ops": len(items), "us_per_op": round(best * 1e6 / len(items), 3), "ops_per_sec": round(len(items) / best)}
+
+
+def _lookup(isbn_and_payloads, existing_series):
+    """
+    The waterfall's merge for one ISBN once all three providers answered.
+    """
+    isbn, openbd, rakuten, google = isbn_and_payloads
+    return utils.merge_book_data(
+        utils.parse_openbd_response(openbd),
+        lambda: utils.parse_rakuten_response(rakuten),
+        lambda: utils.parse_google_response(isbn, google),
+        existing_series,
+    )
+
+
+def run(repeat: int = 5) -> dict:
+    isbns = [synthetic.unknown_isbn(index) for index in range(SAMPLE_SIZE)]
+    openbd = [synthetic.openbd_payload(isbn) for isbn in isbns]
+    rakuten = [{"count": 1, "Items": [synthetic.rakuten_item(isbn)]} for isbn in isbns]
+    google = [{"totalItems": 1, "items": [synthetic.google_item(isbn)]} for isbn in isbns]
+    # OpenBD records without cover and series send the merge through Rakuten and Google too
+    for payload in openbd[::2]:
+        payload[0]["summary"].update(cover="", series="")
+    existing_series = title_parser.SeriesTrie(sorted({synthetic.upstream_book(isbn)["series"] for isbn in isbns}))
+
+    entries = expand(load_corpus(os.path.join(BENCH_DIR, "title_corpus.txt")))
+    titles = [(title, series, AUTHORS[i % len(AUTHORS)]) for i, (title, series) in enumerate(entries)]
+
+    def clear_caches():
+        for func in CACHED_FUNCTIONS:
+            func.cache_clear()
+
+    def title_pipeline_cold(item):
+        clear_caches()
+        pipeline(title_parser, item[0], item[1], None, item[2])
+
+    results = {
+        "parse_openbd_response": _time(utils.parse_openbd_response, openbd, repeat),
+        "parse_rakuten_response": _time(utils.parse_rakuten_response, rakuten, repeat),
+        "parse_google_response": _time(lambda data: utils.parse_google_response("", data), google, repeat),
+        "merge_book_data": _time(lambda item: _lookup(item, existing_series), list(zip(isbns, openbd, rakuten, google)), repeat),
+        "title_pipeline_cold": _time(title_pipeline_cold, titles, repeat),
+        "title_pipeline_cached": _time(lambda item: pipeline(title_parser, item[0], item[1], None, item[2]), titles, repeat),
+        "extract_volume_number": _time(utils.extract_volume_number.__wrapped__, [title for title, _, _ in titles], repeat),
+    }
+    clear_caches()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the provider response parsers and the title pipeline")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    for name, result in results.items():
+        print(f"  {name:24} {result['us_per_op']:9.2f} us/op  ({result['ops_per_sec']:,} ops/s)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Title parser benchmark.
+
+Checks that title_parser returns exactly what the previous implementation
+(bench/reference_title_utils.py) returned for every title in the corpus and its variants,
+then times both.
+
+Usage (from backend/):
+    python bench/bench_title_parser.py [--repeat 20] [--corpus bench/title_corpus.txt]
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import title_parser  # noqa: E402
+import reference_title_utils as reference  # noqa: E402
+
+CACHED_FUNCTIONS = [
+    title_parser.extract_volume_number, title_parser.clean_title, title_parser.normalize_title,
+    title_parser.clean_series_title, title_parser.series_from_api_title,
+    title_parser.clean_author_name, title_parser.extract_subtitle,
+]
+
+AUTHORS = [
+    "伏瀬", "佐島, 勤, 1964-", "鎌池和馬/はいむらきよたか", "川原, 礫，1974–",
+    "丸山くがね KADOKAWA", "理不尽な孫の手 ", "香月美夜/椎名優", "",
+]
+
+
+def load_corpus(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            title, _, series = line.partition("\t")
+            entries.append((title, series or None))
+    return entries
+
+
+def expand(entries):
+    """
+    Corpus titles plus the decorations the APIs use for the same book.
+    """
+    expanded = list(entries)
+    for title, series in entries:
+        expanded.append((title.replace(" ", "　"), series))
+        expanded.append((f"{title} = Light Novel Edition", series))
+        expanded.append((f"GC NOVELS {title}", None))
+        expanded.append((title.translate(str.maketrans("0123456789.", "０１２３４５６７８９．")), series))
+    return expanded
+
+
+def pipeline(module, title, series_from_api, existing_series, author):
+    """
+    Same steps the lookup runs for one book (base data + finalize_book_data).
+    """
+    normalized = module.normalize_title(title)
+    volume = module.extract_volume_number(normalized)
+    series = module.extract_series_title(normalized, series_from_api, existing_series)
+    return (
+        normalized,
+        volume,
+        series,
+        module.clean_title(title),
+        module.clean_series_title(series_from_api) if series_from_api else None,
+        module.clean_author_name(author),
+        module.format_book_title(normalized, series, volume),
+    )
+
+
+def check_identical(entries, existing_series):
+    mismatches = []
+    series_trie = title_parser.SeriesTrie(existing_series)
+    for i, (title, series_from_api) in enumerate(entries):
+        author = AUTHORS[i % len(AUTHORS)]
+        for existing in (None, existing_series, series_trie):
+            expected = pipeline(reference, title, series_from_api, existing and list(existing), author)
+            actual = pipeline(title_parser, title, series_from_api, existing, author)
+            if expected != actual:
+                mismatches.append((title, series_from_api, existing is not None, expected, actual))
+
+            parsed = title_parser.parse_title(title, series_from_api, existing)
+            if parsed.display_title != expected[-1] or parsed.volume_number != expected[1]:
+                mismatches.append((title, series_from_api, existing is not None, expected, parsed))
+    return mismatches
+
+
+def run(module, entries, existing_series, repeat, clear_cache):
+    timings = []
+    for _ in range(repeat):
+        if clear_cache:
+            for func in CACHED_FUNCTIONS:
+                func.cache_clear()
+        start = time.perf_counter()
+        for i, (title, series_from_api) in enumerate(entries):
+            pipeline(module, title, series_from_api, existing_series, AUTHORS[i % len(AUTHORS)])
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the title parser against the previous implementation")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "title_corpus.txt"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    entries = expand(load_corpus(args.corpus))
+    # Series already in the library, as main.py passes them to the lookup
+    existing_series = sorted({reference.clean_title(reference.normalize_title(t)) for t, _ in entries} - {""})
+
+    mismatches = check_identical(entries, existing_series)
+    if mismatches:
+        print(f"{len(mismatches)} mismatches:")
+        for title, series_from_api, with_existing, expected, actual in mismatches[:20]:
+            print(f"  {title!r} (api series {series_from_api!r}, existing={with_existing})")
+            print(f"    reference: {expected}")
+            print(f"    new:       {actual}")
+        sys.exit(1)
+    print(f"Identical results for {len(entries)} titles ({len(existing_series)} existing series)")
+
+    series_trie = title_parser.SeriesTrie(existing_series)
+    for label, existing in (("no existing series", None), ("with existing series", existing_series)):
+        # The app passes existing series as a prefix index (series_index.py)
+        indexed = series_trie if existing else None
+        before = run(reference, entries, existing, args.repeat, clear_cache=False)
+        cold = run(title_parser, entries, indexed, args.repeat, clear_cache=True)
+        warm = run(title_parser, entries, indexed, args.repeat, clear_cache=False)
+        per_title = 1e6 / len(entries)
+        print(f"\n{label}:")
+        print(f"  reference          {before * per_title:8.1f} us/title")
+        print(f"  compiled (cold)    {cold * per_title:8.1f} us/title  ({before / cold:.1f}x)")
+        print(f"  compiled (cached)  {warm * per_title:8.1f} us/title  ({before / warm:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Local stand-ins for the OpenBD, Rakuten Books and Google Books APIs.
+
+Answers are generated from the ISBN (bench/synthetic.py), so they are the same on every run.
+Latency, server errors, 429s and "not found" are injected per provider:
+
+    python bench/fake_upstreams.py --port 8765 --fault latency_ms=40 --fault rakuten.rate_limit_rate=0.1
+
+then point the app at it with
+    OPENBD_API_URL=http://127.0.0.1:8765/openbd/v1/get
+    RAKUTEN_BOOKS_API_URL=http://127.0.0.1:8765/rakuten/BooksBook/Search/20170404
+    GOOGLE_BOOKS_API_URL=http://127.0.0.1:8765/google/books/v1/volumes
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+PROVIDERS = ("openbd", "rakuten", "google")
+
+DEFAULT_FAULTS = {
+    "latency_ms": 0.0,       # Mean added response time
+    "jitter_ms": 0.0,        # Uniform +/- around the mean
+    "error_rate": 0.0,       # Share of requests answered with HTTP 503
+    "rate_limit_rate": 0.0,  # Share of requests answered with HTTP 429
+    "retry_after": 1,        # Retry-After header of the 429s (seconds)
+    "not_found_rate": 0.0,   # Share of ISBNs the provider doesn't know (stable per ISBN)
+}
+
+PATHS = {
+    "openbd": "/openbd/v1/get",
+    "rakuten": "/rakuten/BooksBook/Search/20170404",
+    "google": "/google/books/v1/volumes",
+}
+
+
+def parse_faults(specs: list, faults: dict = None) -> dict:
+    """
+    ["latency_ms=20", "rakuten.rate_limit_rate=0.2"] -> {provider: {setting: value}}.
+    A setting without a provider prefix applies to every provider.
+    """
+    faults = faults or {provider: dict(DEFAULT_FAULTS) for provider in PROVIDERS}
+    for spec in specs or []:
+        key, _, value = spec.partition("=")
+        provider, _, name = key.rpartition(".")
+        if name not in DEFAULT_FAULTS or (provider and provider not in PROVIDERS):
+            raise ValueError(f"Unknown fault setting: {key}")
+        for target in [provider] if provider else PROVIDERS:
+            faults[target][name] = type(DEFAULT_FAULTS[name])(value)
+    return faults
+
+
+def urls(base_url: str) -> dict:
+    """
+    Environment for the app to use the stand-ins at base_url.
+    """
+    return {
+        "OPENBD_API_URL": base_url + PATHS["openbd"],
+        "RAKUTEN_BOOKS_API_URL": base_url + PATHS["rakuten"],
+        "GOOGLE_BOOKS_API_URL": base_url + PATHS["google"],
+    }
+
+
+def _search_isbns(query: str, count: int) -> list:
+    start = int.from_bytes(hashlib.blake2b(query.encode(), digest_size=4).digest(), "big")
+    return [synthetic.unknown_isbn(start + i) for i in range(count)]
+
+
+def _cover_image() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 430), (120, 140, 180)).save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def create_app(faults: dict, seed: int = 0, base_url: str = synthetic.COVER_BASE) -> FastAPI:
+    app = FastAPI(title="Fake upstream providers")
+    rng = random.Random(seed)
+    served = Counter()
+    cover = _cover_image()
+
+    async def inject(provider: str, isbn: str = None):
+        """
+        Wait the configured latency, then return the error response to send, or None to answer normally.
+        """
+        config = faults[provider]
+        delay = config["latency_ms"] + rng.uniform(-config["jitter_ms"], config["jitter_ms"])
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        draw = rng.random()
+        if draw < config["rate_limit_rate"]:
+            served[(provider, "rate_limited")] += 1
+            return JSONResponse({"error": "too_many_requests"}, status_code=429,
+                                headers={"Retry-After": str(config["retry_after"])})
+        if draw < config["rate_limit_rate"] + config["error_rate"]:
+            served[(provider, "error")] += 1
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        if isbn and synthetic.known_fraction(isbn, provider) < config["not_found_rate"]:
+            served[(provider, "not_found")] += 1
+            return False
+        served[(provider, "ok")] += 1
+        return None
+
+    @app.get(PATHS["openbd"])
+    async def openbd(isbn: str):
+        isbns = isbn.split(",")
+        records = []
+        for one in isbns:
+            failure = await inject("openbd", one)
+            if failure:
+                return failure
+            records.extend([None] if failure is False else synthetic.openbd_payload(one, base_url))
+        return records
+
+    @app.get(PATHS["rakuten"])
+    async def rakuten(request: Request):
+        params = request.query_params
+        isbn = params.get("isbn")
+        failure = await inject("rakuten", isbn)
+        if failure:
+            return failure
+        if isbn:
+            items = [] if failure is False else [synthetic.rakuten_item(isbn, base_url)]
+        else:
+            isbns = _search_isbns(params.get("title", ""), int(params.get("hits", 20)))
+            items = [synthetic.rakuten_item(one, base_url) for one in isbns]
+        return {"count": len(items), "page": 1, "hits": len(items), "Items": items}
+
+    @app.get(PATHS["google"])
+    async def google(q: str, maxResults: int = 10):
+        isbn = q[len("isbn:"):] if q.startswith("isbn:") else None
+        failure = await inject("google", isbn)
+        if failure:
+            return failure
+        if isbn:
+            items = [] if failure is False else [synthetic.google_item(isbn, base_url)]
+        else:
+            items = [synthetic.google_item(one, base_url) for one in _search_isbns(q, maxResults)]
+        return {"kind": "books#volumes", "totalItems": len(items), "items": items}
+
+    @app.get("/covers/{name}")
+    def get_cover(name: str):
+        served[("covers", "ok")] += 1
+        return Response(cover, media_type="image/jpeg")
+
+    @app.get("/_stats")
+    def stats():
+        result = {provider: {} for provider in PROVIDERS + ("covers",)}
+        for (provider, outcome), count in served.items():
+            result[provider][outcome] = count
+        return result
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeUpstreams:
+    """
+    The fake servers running on a background thread:
+
+        with FakeUpstreams(faults) as upstreams:
+            env.update(urls(upstreams.base_url))
+    """
+
+    def __init__(self, faults: dict = None, port: int = None, seed: int = 0):
+        self.port = port or free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(create_app(faults or parse_faults([]), seed, self.base_url), host="127.0.0.1", port=self.port,
+                                log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name="fake-upstreams", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Fake upstream servers did not start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake OpenBD/Rakuten/Google servers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fault", action="append", default=[], metavar="[PROVIDER.]SETTING=VALUE",
+                        help=f"Settings: {', '.join(DEFAULT_FAULTS)}")
+    args = parser.parse_args()
+
+    try:
+        faults = parse_faults(args.fault)
+    except ValueError as e:
+        parser.error(str(e))
+    base_url = f"http://127.0.0.1:{args.port}"
+    for name, value in urls(base_url).items():
+        print(f"{name}={value}")
+    uvicorn.run(create_app(faults, args.seed, base_url), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import re
+
+# Title parsing functions as they were before title_parser.py (uncompiled regexes).
+# Kept only as the reference the benchmark checks the compiled engine against.
+
+VOLUME_PATTERNS = [
+    # Japanese patterns
+    r'[（(](\d+(?:\.\d+)?)[)）]',          # （1）, (8.5) - number only in parentheses
+    r'第(\d+(?:\.\d+)?)[巻話集号]',         # 第1巻, 第8.5巻
+    r'(\d+(?:\.\d+)?)[巻話集号]$',          # 1巻, 8.5巻 (at end)
+    r'[Vv][Oo][Ll]\.?\s*(\d+(?:\.\d+)?)',  # Vol.1, Vol.8.5
+    r'[#＃](\d+(?:\.\d+)?)',               # #1, #8.5
+    r'[【\[](\d+(?:\.\d+)?)[】\]]',         # 【1】, [8.5]
+    r'(?<!\d)\.\s*(\d+(?:\.\d+)?)',        # . 5, . 8.5 (with space or not) - Lower priority to avoid matching .5 in 13.5
+    r'\s+(\d+(?:\.\d+)?)$',                # "Title 1", "Title 8.5" (number at end)
+    r'\s+(\d{1,3}(?:\.\d+)?)\s+',          # "Title 1 Subtitle" (number in middle, max 3 digits)
+]
+
+def extract_volume_number(title: str) -> float | None:
+    """
+    Extract volume number from a book title.
+    Returns None if no volume number is found.
+    Supports integers and floats (e.g., 8.5).
+    """
+    if not title:
+        return None
+    
+    # Normalize full-width characters for easier matching
+    # Convert full-width numbers and dots to half-width
+    table = str.maketrans({
+        '０': '0', '１': '1', '２': '2', '３': '3', '４': '4',
+        '５': '5', '６': '6', '７': '7', '８': '8', '９': '9',
+        '．': '.', '。': '.'
+    })
+    normalized_title = title.translate(table)
+    
+    for pattern in VOLUME_PATTERNS:
+        match = re.search(pattern, normalized_title)
+        if match:
+            try:
+                return float(match.group(1))
+            except (ValueError, IndexError):
+                continue
+    return None
+
+def clean_title(title: str) -> str:
+    """
+    Clean a book title to extract series name only.
+    Removes volume numbers, subtitles (both Japanese and English), and side story keywords.
+    """
+    if not title:
+        return title
+    
+    cleaned = title
+    
+    # Remove common label prefixes
+    labels = ['GC NOVELS']
+    for label in labels:
+        cleaned = cleaned.replace(label, '')
+        
+    # Remove volume number at the start (e.g. "10 Series Title")
+    cleaned = re.sub(r'^\s*\d+\s+', '', cleaned)
+    
+    # Remove English subtitle patterns (= followed by English text)
+    cleaned = re.sub(r'\s*[=＝]\s*[A-Za-z].*$', '', cleaned)
+    
+    # Remove Japanese subtitles in parentheses (like 入学編 上, 夏休み編+1)
+    cleaned = re.sub(r'\s*[（(][^）)]+[)）]\s*', '', cleaned)
+    
+    # Remove square bracket patterns like ［上］, ［下］, [上], [下]
+    cleaned = re.sub(r'\s*[［\[][上中下前後][］\]]\s*', '', cleaned)
+    
+    # Remove side story keywords and everything after
+    # APPEND, SS, etc.
+    side_story_keywords = [
+        r'\s*APPEND.*$',
+        r'\s*SS.*$',
+        r'\s*Side\s*Story.*$',
+        r'\s*外伝.*$',
+    ]
+    for pattern in side_story_keywords:
+        cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE)
+
+    # Remove volume number patterns and everything after them
+    # This assumes that anything after the volume number is a subtitle
+    patterns_to_remove = [
+        r'\.\s*\d+.*$',                     # .1 ... -> remove all after
+        r'\s*第\d+[巻話集号].*$',            # 第1巻 ...
+        r'\s+\d+[巻話集号].*$',             # 1巻 ...
+        r'\s+\d+\s+.*$',                    # 1 Subtitle (digit followed by space and text)
+        r'\s*[Vv][Oo][Ll]\.?\s*\d+.*$',     # Vol.1 ...
+        r'\s*[#＃]\d+.*$',                  # #1 ...
+        r'\s*[【\[]\d+[】\]].*$',            # 【1】 ...
+    ]
+    
+    for pattern in patterns_to_remove:
+        cleaned = re.sub(pattern, '', cleaned)
+        
+    # Also handle the case where the number is at the very end (already covered by regexes above if modified, but let's be safe)
+    # The above regexes with .*$ should cover it.
+    
+    # Special case: "Title 15" (Digit at end or followed by text)
+    # Be careful not to cut "1984" or "2001 Space Odyssey"
+    # But for series extraction, usually a trailing number is a volume.
+    cleaned = re.sub(r'\s+\d+$', '', cleaned) 
+    
+    # Clean up extra whitespace
+    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    
+    # Remove trailing punctuation
+    cleaned = re.sub(r'[\s\.\-－―:：]+$', '', cleaned).strip()
+    
+    return cleaned
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a book title for display.
+    Removes English subtitles but keeps volume numbers and Japanese subtitles.
+    Also removes duplicate content that may appear in titles.
+    """
+    if not title:
+        return title
+    
+    normalized = title
+    
+    # Step 1: Remove English subtitles (anything after = sign)
+    # Pattern: = followed by mostly English text
+    normalized = re.sub(r'\s*[=＝]\s*[A-Za-z].*$', '', normalized)
+    
+    # Step 2: Remove duplicated text (e.g., "APPEND1 APPEND1" -> "APPEND1")
+    # Find repeating patterns
+    words = normalized.split()
+    seen = []
+    result_words = []
+    for word in words:
+        # Check if this word/phrase was just seen (handle "APPEND1 APPEND1")
+        if word not in seen or word.isdigit():
+            result_words.append(word)
+            seen.append(word)
+        # Reset seen list if word is significantly different (not a repeat)
+        if len(seen) > 3:
+            seen = seen[-3:]
+    normalized = ' '.join(result_words)
+    
+    # Step 4: Clean up extra whitespace
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    
+    # Step 5: Clean trailing punctuation
+    normalized = re.sub(r'[\s\.\-－―:：]+$', '', normalized).strip()
+    
+    return normalized
+
+def clean_series_title(series_title: str) -> str:
+    """
+    Clean a series title by removing trailing volume numbers.
+    For example: "新約とある魔術の禁書目録10" -> "新約とある魔術の禁書目録"
+    """
+    if not series_title:
+        return series_title
+    
+    # Remove trailing digits (volume numbers)
+    cleaned = re.sub(r'\s*\d+(?:\.\d+)?$', '', series_title)
+    
+    # Remove trailing volume markers like 巻, 話, etc.
+    cleaned = re.sub(r'\s*第?\d+[巻話集号]?$', '', cleaned)
+    
+    return cleaned.strip()
+
+def extract_series_title(title: str, series_from_api: str = None, existing_series: list = None) -> str:
+    """
+    Get series title: 
+    1. First try to match against existing series in the database
+    2. If no match, prefer API-provided series name
+    3. Fall back to cleaned title
+    
+    Args:
+        title: The book title to extract series from
+        series_from_api: Series name provided by API (may be label name)
+        existing_series: List of existing series titles from the database
+    """
+    # Always try to clean the title first to get a candidate series name
+    cleaned = clean_title(title)
+    
+    # Try to match against existing series first (if provided)
+    if existing_series:
+        # Filter out obviously invalid series names before sorting
+        valid_series = []
+        for series in existing_series:
+            # Skip if series is too short (likely garbage data)
+            if len(series) < 3:
+                continue
+            
+            # Skip if series is the same as or very close to the title (garbage data)
+            if series == title or series == cleaned:
+                continue
+            
+            # Skip if series length is more than 80% of title (likely full title as series)
+            if len(series) > len(title) * 0.8:
+                continue
+            
+            # Skip if series contains side-story indicators (these shouldn't be base series)
+            side_story_keywords = ["番外編", "外伝", "短編", "特典", "SS", "スピンオフ"]
+            has_side_story = any(kw in series for kw in side_story_keywords)
+            if has_side_story:
+                continue
+                
+            valid_series.append(series)
+        
+        # Sort by length descending to match longest first (more specific)
+        sorted_series = sorted(valid_series, key=len, reverse=True)
+        
+        for series in sorted_series:
+            # Check if title starts with this series name
+            if title.startswith(series) or cleaned.startswith(series):
+                # Found a matching existing series!
+                return series
+    
+    # If API provided a series title, check if it's better
+    if series_from_api:
+        # Labels that should NOT be used as series titles
+        label_keywords = [
+            "文庫", "コミックス", "BOOKS", "ノベルズ", "ノベルス", 
+            "GC NOVELS", "GCノベルズ", "GC ノベルズ", "ＧＣノベルズ",
+            "電撃文庫", "角川文庫", "講談社文庫", "集英社文庫",
+            "MF文庫", "GA文庫", "ファンタジア文庫", "スニーカー文庫",
+            "富士見ファンタジア", "HJ文庫", "オーバーラップ文庫",
+        ]
+        
+        # Check if series_from_api contains any label keyword
+        is_label = False
+        for keyword in label_keywords:
+            if keyword in series_from_api:
+                is_label = True
+                break
+        
+        if not is_label:
+            # Also reject if series_from_api is very short (likely just a label abbreviation)
+            if not (len(series_from_api) <= 10 and series_from_api == series_from_api.upper()):
+                # Clean any trailing volume numbers from the API series
+                cleaned_api_series = clean_series_title(series_from_api)
+                if cleaned_api_series:
+                    return cleaned_api_series
+        
+    return cleaned
+
+def clean_author_name(author_str: str) -> str:
+    """
+    Clean up author name string.
+    Removes birth years, publisher names, and secondary authors (illustrators) if separated by /.
+    """
+    if not author_str:
+        return author_str
+    
+    cleaned = author_str
+    
+    # Take only the first author if multiple are separated by /
+    if '/' in cleaned:
+        cleaned = cleaned.split('/')[0]
+        
+    # Remove birth year patterns like ",1975-" or " 1975-"
+    # Include various dash types and allow trailing whitespace
+    cleaned = re.sub(r'[,，\s]*\d{4}[-−–—]?\s*$', '', cleaned)
+    
+    # Replace commas with space (Handle "Surname, Name" format)
+    cleaned = cleaned.replace(',', ' ').replace('，', ' ')
+    
+    # Remove specific publisher names that might get mixed in (heuristic)
+    # This list can be expanded
+    publishers = ['マイクロマガジン社', 'KADOKAWA', '講談社', '集英社', '小学館']
+    for pub in publishers:
+        cleaned = cleaned.replace(pub, '')
+        
+    # Clean up extra whitespace
+    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+        
+    return cleaned
+
+def format_book_title(title: str, series_title: str, volume_number: float | None) -> str:
+    """
+    Format book title to a standard format: "{Series} {Volume} {Subtitle}"
+    Removes decorations from volume number and cleans up subtitle.
+    """
+    if not title or not series_title:
+        return title
+        
+    # Extract subtitle by removing series name
+    subtitle = title.replace(series_title, "")
+    
+    # Normalize full-width for cleaning
+    table = str.maketrans({
+        '０': '0', '１': '1', '２': '2', '３': '3', '４': '4',
+        '５': '5', '６': '6', '７': '7', '８': '8', '９': '9',
+        '．': '.', '。': '.'
+    })
+    cleaned_subtitle = subtitle.translate(table)
+    
+    # Remove volume number from subtitle if it exists
+    if volume_number is not None:
+        vol_str = str(volume_number)
+        if vol_str.endswith(".0"):
+            vol_str = str(int(volume_number))
+        
+        # Remove exact volume number
+        cleaned_subtitle = re.sub(rf'\b{vol_str}\b', '', cleaned_subtitle)
+        
+        # Remove patterns like (10), . 5, etc.
+        patterns = [
+            r'\.\s*\d+(?:\.\d+)?',
+            r'[（(]\d+(?:\.\d+)?[)）]',
+            r'第\d+(?:\.\d+)?[巻話集号]',
+            r'\d+(?:\.\d+)?[巻話集号]',
+            r'[Vv][Oo][Ll]\.?\s*\d+(?:\.\d+)?',
+            r'[#＃]\d+(?:\.\d+)?',
+            r'[【\[]\d+(?:\.\d+)?[】\]]',
+            r'\s+\d+(?:\.\d+)?$', # Trailing number
+            r'GC NOVELS' # Label name
+        ]
+        for p in patterns:
+            cleaned_subtitle = re.sub(p, '', cleaned_subtitle)
+
+    # Clean up whitespace and punctuation
+    cleaned_subtitle = re.sub(r'^[\s\.\-－:：]+', '', cleaned_subtitle)
+    cleaned_subtitle = re.sub(r'[\s\.\-－:：]+$', '', cleaned_subtitle)
+    
+    # Remove empty parentheses
+    cleaned_subtitle = re.sub(r'[（(]\s*[)）]', '', cleaned_subtitle)
+    # Remove leftover "13." type patterns inside parentheses if any
+    cleaned_subtitle = re.sub(r'[（(]\s*\d+\.\s*[)）]', '', cleaned_subtitle)
+    
+    cleaned_subtitle = cleaned_subtitle.strip()
+    
+    # Construct new title
+    new_title = series_title
+    
+    if volume_number is not None:
+        vol_display = str(volume_number)
+        if vol_display.endswith(".0"):
+            vol_display = str(int(volume_number))
+        new_title += f" {vol_display}"
+        
+    if cleaned_subtitle:
+        new_title += f" {cleaned_subtitle}"
+        
+    return new_title
@@ -0,0 +1,60 @@
+"""
+Fill the database at DATABASE_URL with a synthetic library (bench/synthetic.py).
+
+Usage (from backend/):
+    DATABASE_URL=sqlite:////tmp/bench/library.db python bench/seed.py --books 10000 [--seed 0]
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import main as app  # noqa: E402,F401  (creates the tables and the search index)
+from database import SessionLocal, Book  # noqa: E402
+from tags import add_book_tags  # noqa: E402
+import bookshelf  # noqa: E402
+import stats  # noqa: E402
+import synthetic  # noqa: E402
+
+BATCH_SIZE = 2000
+
+
+def seed(books: int, seed_value: int = 0) -> float:
+    """
+    Insert the books, their tags, series and stat counters. Returns the time it took.
+    """
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        if db.query(Book.isbn).first() is not None:
+            raise SystemExit("The database already has books; seed an empty one")
+        columns = set(Book.__table__.c.keys())
+        for start in range(0, books, BATCH_SIZE):
+            rows = [synthetic.book(index, books, seed_value) for index in range(start, min(start + BATCH_SIZE, books))]
+            db.execute(Book.__table__.insert(), [
+                {column: row.get(column) for column in columns} for row in rows
+            ])
+            add_book_tags(db, {row["isbn"]: row["tags"] for row in rows if row["tags"]})
+        bookshelf.rebuild_series(db)
+        stats.rebuild_stats(db)
+        db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a database with synthetic books")
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    elapsed = seed(args.books, args.seed)
+    print(f"Seeded {args.books} books in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Benchmark suite: API endpoints under concurrent load against local upstream stand-ins,
+plus the parser micro-benchmarks (bench/bench_parsers.py).
+
+Each run seeds a fresh SQLite database with a synthetic library, starts the fake OpenBD/Rakuten/Google
+servers (bench/fake_upstreams.py) and the app (uvicorn), then sends --requests requests per scenario
+with --concurrency clients and records p50/p95/p99 latency and throughput. Everything is seeded,
+so runs with the same arguments are comparable.
+
+Usage (from backend/):
+    python bench/suite.py --books 10000 --output results.json
+    python bench/suite.py --books 100000 --concurrency 32 --fault latency_ms=80 --fault rakuten.rate_limit_rate=0.2
+    python bench/suite.py --scenarios books_page,search --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import bench_parsers  # noqa: E402
+import fake_upstreams  # noqa: E402
+import synthetic  # noqa: E402
+
+ENRICHMENT_DRAIN_TIMEOUT = 120
+
+
+def _books_page(rng, i):
+    sort = rng.choice(["created_desc", "title_asc", "series_asc", "author_asc"])
+    return "GET", f"/books?limit=50&sort={sort}", None
+
+
+def _books_filtered(rng, i):
+    if rng.random() < 0.5:
+        return "GET", f"/books?status={rng.choice(synthetic.STATUSES)}&limit=100", None
+    return "GET", f"/books?tag={rng.choice(synthetic.TAGS)}&limit=100", None
+
+
+def _search(rng, i):
+    return "GET", f"/books/search?q={rng.choice(synthetic.WORDS)}", None
+
+
+def _lookup(rng, i):
+    return "GET", f"/lookup/isbn/{synthetic.unknown_isbn(i)}", None
+
+
+def _search_title(rng, i):
+    return "GET", f"/search/title?query={rng.choice(synthetic.WORDS)}", None
+
+
+def _register(rng, i):
+    return "POST", "/books", {"isbn": synthetic.unknown_isbn(1_000_000 + i)}
+
+
+# name -> (request factory, share of --requests). Scenarios run in this order; writes come last.
+SCENARIOS = {
+    "books_page": (_books_page, 1.0),
+    "books_filtered": (_books_filtered, 1.0),
+    "books_list_fields": (lambda rng, i: ("GET", "/books?fields=list", None), 0.1),
+    "books_all": (lambda rng, i: ("GET", "/books", None), 0.1),
+    "search": (_search, 1.0),
+    "bookshelf": (lambda rng, i: ("GET", "/bookshelf", None), 1.0),
+    "stats": (lambda rng, i: ("GET", "/stats", None), 1.0),
+    "tags": (lambda rng, i: ("GET", "/tags", None), 1.0),
+    "series": (lambda rng, i: ("GET", "/series", None), 1.0),
+    "lookup": (_lookup, 1.0),
+    "search_title": (_search_title, 1.0),
+    "register": (_register, 1.0),
+}
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    p-th percentile of sorted values (linear interpolation between closest ranks).
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(latencies: list, statuses: Counter, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for code, count in statuses.items() if not isinstance(code, int) or code >= 500),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items(), key=str)},
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+async def drive(base_url: str, factory, requests: int, concurrency: int, seed: int) -> dict:
+    """
+    Send requests built by factory from concurrency clients; returns the summary.
+    """
+    rng = random.Random(seed)
+    plan = [factory(rng, i) for i in range(requests)]
+    latencies, statuses = [], Counter()
+    next_request = iter(plan)
+
+    async def client_loop(client):
+        for method, path, body in next_request:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                await response.aread()
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, elapsed)
+
+
+def app_environment(workdir: str, args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'library.db')}",
+        "METADATA_CACHE_PATH": os.path.join(workdir, "metadata_cache.db"),
+        "METADATA_CACHE_ENABLED": "1" if args.metadata_cache else "0",
+        "PROVIDER_STATE_PATH": os.path.join(workdir, "provider_state.db"),
+        "COVER_STORE_DIR": os.path.join(workdir, "covers"),
+        # Covers are served by the local fake upstream
+        "COVER_ALLOW_PRIVATE_HOSTS": "1",
+        "OPENBD_MIRROR_ENABLED": "0",
+        "RAKUTEN_APP_ID": env.get("RAKUTEN_APP_ID", "bench"),
+        # Failed enrichment jobs retry within the run instead of 30s later
+        "ENRICHMENT_RETRY_BASE": "1",
+        "ENRICHMENT_POLL_INTERVAL": "1",
+    })
+    if not args.client_rate_limits:
+        # Only the fake servers' 429s limit the lookups, not the app's own token buckets
+        for provider in ("OPENBD", "RAKUTEN", "GOOGLE_BOOKS"):
+            env[f"{provider}_RATE"] = env[f"{provider}_BURST"] = "1000"
+    return env
+
+
+def start_app(env: dict, port: int, log) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/enrichment/status", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The app did not start")
+
+
+def wait_for_enrichment(base_url: str, timeout: float = ENRICHMENT_DRAIN_TIMEOUT) -> dict:
+    """
+    Wait until the enrichment queue is empty (registrations are looked up in the background).
+    """
+    started = time.perf_counter()
+    while True:
+        jobs = httpx.get(f"{base_url}/enrichment/status").json()["jobs"]
+        elapsed = time.perf_counter() - started
+        if not (jobs.get("queued") or jobs.get("running")) or elapsed > timeout:
+            return {"drain_seconds": round(elapsed, 2), "jobs": jobs}
+        time.sleep(0.1)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_library(env: dict, books: int, seed: int) -> float:
+    """
+    Seed the app's database (env DATABASE_URL) in a subprocess; returns the seconds it took.
+    """
+    print(f"Seeding {books} books...")
+    seeded = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(BENCH_DIR, "seed.py"), "--books", str(books), "--seed", str(seed)],
+                   cwd=BACKEND_DIR, env=env, check=True)
+    return time.perf_counter() - seeded
+
+
+def run_load(args, faults: dict, workdir: str) -> dict:
+    env = app_environment(workdir, args)
+    seed_seconds = seed_library(env, args.books, args.seed)
+
+    results = {"seed_seconds": round(seed_seconds, 2), "endpoints": {}}
+    with fake_upstreams.FakeUpstreams(faults, seed=args.seed) as upstreams:
+        env.update(fake_upstreams.urls(upstreams.base_url))
+        port = fake_upstreams.free_port()
+        log_path = os.path.join(workdir, "app.log")
+        log = open(log_path, "w", encoding="utf-8")
+        print(f"App output: {log_path}")
+        app = start_app(env, port, log)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            for index, name in enumerate(args.scenarios):
+                factory, share = SCENARIOS[name]
+                requests = max(args.concurrency, int(args.requests * share))
+                result = asyncio.run(drive(base_url, factory, requests, args.concurrency, args.seed + index))
+                results["endpoints"][name] = result
+                latency = result["latency_ms"]
+                print(f"  {name:18} {result['requests']:6} req  {result['throughput_rps']:8.1f} req/s  "
+                      f"p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  p99 {latency['p99']:8.2f} ms  "
+                      f"errors {result['errors']}")
+            if "register" in args.scenarios:
+                results["enrichment"] = wait_for_enrichment(base_url)
+                print(f"  enrichment queue drained in {results['enrichment']['drain_seconds']}s: "
+                      f"{results['enrichment']['jobs']}")
+            results["upstreams"] = httpx.get(f"{upstreams.base_url}/_stats").json()
+            results["providers"] = httpx.get(f"{base_url}/providers/status").json()
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+            log.close()
+    return results
+
+
+def compare(current: dict, baseline_path: str):
+    """
+    Print the change of each endpoint's percentiles and throughput against an earlier results file.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+7.1f}%" if new is not None and old else "      -"
+
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_commit')}):")
+    for name, result in current.get("endpoints", {}).items():
+        old = baseline.get("endpoints", {}).get(name)
+        if old:
+            print(f"  {name:18} p50 {change(result['latency_ms']['p50'], old['latency_ms']['p50'])}  "
+                  f"p95 {change(result['latency_ms']['p95'], old['latency_ms']['p95'])}  "
+                  f"p99 {change(result['latency_ms']['p99'], old['latency_ms']['p99'])}  "
+                  f"throughput {change(result['throughput_rps'], old['throughput_rps'])}")
+    for name, result in current.get("parsers", {}).items():
+        old = baseline.get("parsers", {}).get(name)
+        if old:
+            print(f"  {name:24} {change(result['us_per_op'], old['us_per_op'])} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API load benchmarks and the parser micro-benchmarks")
+    parser.add_argument("--books", type=int, default=1000, help="Size of the synthetic library (1k-100k)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of scenarios")
+    parser.add_argument("--fault", action="append", default=[], metavar="[PROVIDER.]SETTING=VALUE",
+                        help=f"Fake upstream behaviour; settings: {', '.join(fake_upstreams.DEFAULT_FAULTS)}")
+    parser.add_argument("--metadata-cache", action="store_true", help="Keep the metadata cache on during the load")
+    parser.add_argument("--client-rate-limits", action="store_true", help="Keep the app's provider rate limits")
+    parser.add_argument("--parser-repeat", type=int, default=5)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-parsers", action="store_true")
+    parser.add_argument("--workdir", help="Keep the database and state files here instead of a temporary directory")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    try:
+        faults = fake_upstreams.parse_faults(args.fault)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "books": args.books,
+            "seed": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "metadata_cache": args.metadata_cache,
+            "client_rate_limits": args.client_rate_limits,
+            "faults": faults,
+        },
+    }
+
+    if not args.skip_parsers:
+        print("Parser micro-benchmarks...")
+        results["parsers"] = bench_parsers.run(args.parser_repeat)
+        for name, result in results["parsers"].items():
+            print(f"  {name:24} {result['us_per_op']:9.2f} us/op")
+
+    if not args.skip_load:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="library-bench-")
+        if args.workdir:
+            os.makedirs(workdir, exist_ok=True)
+            if os.path.exists(os.path.join(workdir, "library.db")):
+                parser.error(f"{workdir} already has a library.db; use an empty directory")
+        try:
+            results.update(run_load(args, faults, workdir))
+        finally:
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+# Deterministic synthetic library shared by the seeder, the fake upstream servers and the load driver.
+# Everything derives from (seed, index) or from the ISBN, so two runs with the same arguments
+# see the same books, the same upstream answers and the same request sequence.
+
+STATUSES = ["unread", "unread", "unread", "reading", "done", "done", "done", "wishlist", "ordered", "paused"]
+LABELS = ["電撃文庫", "角川スニーカー文庫", "MF文庫J", "ガガガ文庫", "ジャンプコミックス", "講談社文庫", "新潮文庫", "GA文庫"]
+LOCATIONS = ["本棚A", "本棚B", "書斎", "寝室", "段ボール1", None, None]
+BORROWERS = ["田中", "佐藤", "鈴木", "高橋"]
+TAGS = [
+    "ファンタジー", "SF", "ミステリー", "恋愛", "ホラー", "歴史", "青春", "異世界", "学園", "バトル",
+    "日常", "お気に入り", "再読", "積読", "電子版あり", "アニメ化", "完結", "映画化", "短編集", "受賞作",
+]
+WORDS = [
+    "魔法", "剣", "王国", "学園", "探偵", "宇宙", "竜", "少女", "騎士", "迷宮",
+    "時計", "夏", "星", "記憶", "旅", "約束", "影", "図書館", "革命", "猫",
+]
+SURNAMES = ["山田", "川原", "伏見", "鎌池", "西尾", "宮部", "東野", "有川", "米澤", "森見", "長月", "丸山"]
+GIVEN_NAMES = ["太郎", "礫", "つかさ", "和馬", "維新", "みゆき", "圭吾", "浩", "穂信", "登美彦", "達平", "くがね"]
+
+# Where the fake upstreams' cover URLs point (fake_upstreams.py serves /covers/<isbn>.jpg)
+COVER_BASE = "http://127.0.0.1:8765"
+
+# Books per series on average (the rest are standalone)
+SERIES_SIZE = 8
+STANDALONE_RATIO = 0.2
+
+
+def isbn13(number: int) -> str:
+    """
+    Valid Japanese ISBN-13 (978-4 prefix) for a sequence number.
+    """
+    body = f"9784{number % 10 ** 8:08d}"
+    total = sum(int(digit) * (1 if i % 2 == 0 else 3) for i, digit in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def series_name(index: int) -> str:
+    rng = random.Random(index)
+    return f"{rng.choice(WORDS)}の{rng.choice(WORDS)}{index}"
+
+
+def author_name(index: int) -> str:
+    return f"{SURNAMES[index % len(SURNAMES)]}{GIVEN_NAMES[index // len(SURNAMES) % len(GIVEN_NAMES)]}{index // 144 or ''}"
+
+
+def book(index: int, books: int, seed: int = 0) -> dict:
+    """
+    The index-th book of a library of the given size: columns as stored in the books table.
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    series_count = max(1, int(books * (1 - STANDALONE_RATIO)) // SERIES_SIZE)
+    created_at = datetime(2023, 1, 1) + timedelta(minutes=index * 3 + rng.randint(0, 2))
+
+    if rng.random() < STANDALONE_RATIO:
+        series, volume = None, None
+        title = f"{rng.choice(WORDS)}と{rng.choice(WORDS)}の{rng.choice(WORDS)}"
+        author = author_name(rng.randrange(max(1, series_count)))
+    else:
+        series_index = rng.randrange(series_count)
+        series, volume = series_name(series_index), float(rng.randint(1, SERIES_SIZE * 2))
+        title = f"{series} {int(volume)}"
+        author = author_name(series_index)
+
+    status = rng.choice(STATUSES)
+    values = {
+        "isbn": isbn13(index),
+        "title": title,
+        "authors": author,
+        "publisher": "架空書房",
+        "published_date": created_at.strftime("%Y%m%d"),
+        "description": "、".join(rng.sample(WORDS, 4)) + "をめぐる物語。",
+        "cover_url": None,
+        "status": status,
+        "location": rng.choice(LOCATIONS),
+        "series_title": series,
+        "label": rng.choice(LABELS),
+        "volume_number": volume,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "reading_start_date": created_at + timedelta(days=3) if status in ("reading", "done", "paused") else None,
+        "reading_end_date": created_at + timedelta(days=10) if status == "done" else None,
+        "tags": ",".join(rng.sample(TAGS, rng.randint(0, 3))) or None,
+        "rating": str(rng.randint(1, 5)) if status == "done" else None,
+        "is_series_representative": False,
+    }
+    if rng.random() < 0.02:
+        values["lent_to"] = rng.choice(BORROWERS)
+        values["lent_date"] = created_at + timedelta(days=20)
+        values["due_date"] = created_at + timedelta(days=34)
+    return values
+
+
+def unknown_isbn(index: int) -> str:
+    """
+    ISBNs outside any seeded library (lookups and registrations during the load test).
+    """
+    return isbn13(90_000_000 + index)
+
+
+def _digest(isbn: str) -> int:
+    return int.from_bytes(hashlib.blake2b(isbn.encode(), digest_size=8).digest(), "big")
+
+
+def upstream_book(isbn: str, cover_base: str = COVER_BASE) -> dict:
+    """
+    What the fake upstreams know about an ISBN (same answer every time).
+    """
+    digest = _digest(isbn)
+    series = series_name(digest % 5000)
+    volume = digest // 5000 % 30 + 1
+    return {
+        "isbn": isbn,
+        "title": f"{series} {volume}",
+        "series": series,
+        "author": author_name(digest % 700),
+        "publisher": "架空書房",
+        "label": LABELS[digest % len(LABELS)],
+        "pubdate": f"20{digest % 24:02d}-{digest % 12 + 1:02d}-01",
+        "description": "、".join(WORDS[(digest >> shift) % len(WORDS)] for shift in (3, 7, 11)) + "をめぐる物語。",
+        "cover": f"{cover_base}/covers/{isbn}.jpg",
+    }
+
+
+def known_fraction(isbn: str, provider: str) -> float:
+    """
+    Stable value in [0, 1) per ISBN and provider, compared with a not-found rate.
+    """
+    return _digest(f"{provider}:{isbn}") % 10_000 / 10_000
+
+
+def openbd_payload(isbn: str, cover_base: str = COVER_BASE) -> list:
+    book = upstream_book(isbn, cover_base)
+    return [{
+        "summary": {
+            "isbn": isbn, "title": book["title"], "series": book["label"], "author": book["author"],
+            "publisher": book["publisher"], "pubdate": book["pubdate"].replace("-", ""), "cover": book["cover"],
+        },
+        "onix": {"CollateralDetail": {"TextContent": [{"TextType": "03", "Text": book["description"]}]}},
+    }]
+
+
+def rakuten_item(isbn: str, cover_base: str = COVER_BASE) -> dict:
+    book = upstream_book(isbn, cover_base)
+    year, month, _ = book["pubdate"].split("-")
+    return {"Item": {
+        "isbn": isbn, "title": book["title"], "seriesName": book["series"], "author": book["author"],
+        "publisherName": book["publisher"], "salesDate": f"{year}年{month}月", "itemCaption": book["description"],
+        "largeImageUrl": book["cover"], "mediumImageUrl": book["cover"],
+    }}
+
+
+def google_item(isbn: str, cover_base: str = COVER_BASE) -> dict:
+    book = upstream_book(isbn, cover_base)
+    return {"volumeInfo": {
+        "title": book["title"], "authors": [book["author"]], "publisher": book["publisher"],
+        "publishedDate": book["pubdate"], "description": book["description"],
+        "industryIdentifiers": [{"type": "ISBN_13", "identifier": isbn}],
+        "imageLinks": {"thumbnail": book["cover"]},
+    }}
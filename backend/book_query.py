@@ -0,0 +1,123 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import func, or_, and_
+from database import Book, LIKE_ESCAPE, like_contains
+from tags import parse_tags, tag_filter
+
+# Sort keys for GET /books (same names as the frontend's SortOption)
+# Each maps to (sort column expression, descending)
+SORT_KEYS = {
+    "created_desc": (Book.created_at, True),
+    "created_asc": (Book.created_at, False),
+    "title_asc": (Book.title, False),
+    "author_asc": (func.coalesce(Book.authors, ""), False),
+    "series_asc": (func.coalesce(Book.series_title, ""), False),
+    "volume_asc": (func.coalesce(Book.volume_number, 0), False),
+}
+DEFAULT_SORT = "created_desc"
+
+# Columns that can be requested with ?fields=
+PROJECTABLE_FIELDS = {column.name for column in Book.__table__.columns}
+
+# Every column, in BookResponse order (the default GET /books projection)
+BOOK_FIELDS = [column.name for column in Book.__table__.columns]
+
+# Slim column set for list views (no description/notes)
+LIST_FIELDS = [
+    "isbn", "title", "authors", "cover_url", "status", "location", "series_title",
+    "label", "created_at", "tags", "lent_to", "volume_number", "is_series_representative",
+]
+
+
+def apply_book_filters(query, status: str = None, series: str = None, tag: str = None,
+                       location: str = None, lent_to: str = None, author: str = None,
+                       tag_mode: str = "and"):
+    """
+    Apply GET /books filters to a query on Book.
+    tag may hold several comma-separated tags, combined with tag_mode ("and" / "or").
+    """
+    if status:
+        query = query.filter(Book.status == status)
+    if series:
+        query = query.filter(Book.series_title == series)
+    if tag:
+        query = tag_filter(query, parse_tags(tag), tag_mode)
+    if location:
+        query = query.filter(Book.location == location)
+    if lent_to:
+        query = query.filter(Book.lent_to == lent_to)
+    if author:
+        query = query.filter(Book.authors.ilike(like_contains(author), escape=LIKE_ESCAPE))
+    return query
+
+
+def parse_fields(fields: str):
+    """
+    Parse the ?fields= parameter. Returns None for "all fields".
+    Raises ValueError for unknown field names.
+    """
+    if not fields:
+        return None
+    if fields == "list":
+        return list(LIST_FIELDS)
+
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # ISBN is the key the client needs to address a book
+    if "isbn" not in names:
+        names.insert(0, "isbn")
+    return names
+
+
+def encode_cursor(sort: str, value, isbn: str) -> str:
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    payload = json.dumps({"s": sort, "v": value, "k": isbn}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    """
+    Decode a cursor produced by encode_cursor. Returns (sort value, isbn).
+    Raises ValueError if it is malformed or was issued for a different sort.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        value = payload["v"]
+        if isinstance(value, dict) and "dt" in value:
+            value = datetime.fromisoformat(value["dt"])
+        isbn = payload["k"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if payload.get("s") != sort:
+        raise ValueError("Cursor was issued for a different sort order")
+    return value, isbn
+
+
+def apply_sort_and_cursor(query, sort: str, cursor: str = None):
+    """
+    Order the query by the sort key (ISBN as tie-breaker) and start after the cursor row.
+    """
+    column, descending = SORT_KEYS[sort]
+    if cursor:
+        value, isbn = decode_cursor(cursor, sort)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, Book.isbn < isbn)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, Book.isbn > isbn)))
+
+    if descending:
+        return query.order_by(column.desc(), Book.isbn.desc())
+    return query.order_by(column.asc(), Book.isbn.asc())
+
+
+def sort_column(sort: str):
+    """
+    Sort column labelled "_sort_value", selected alongside the rows so the next cursor can be built.
+    """
+    column, _ = SORT_KEYS[sort]
+    return column.label("_sort_value")
@@ -0,0 +1,184 @@
+from datetime import datetime
+from sqlalchemy import case, func, or_, select
+from database import Book, Series, lock_keys
+from title_parser import PLACEHOLDER_TITLE
+
+# Materialized series table behind GET /bookshelf.
+# Every write to books calls refresh_series() for the series it touched, in the same transaction,
+# which re-aggregates just those series (an indexed lookup on books.series_title). Reading the
+# bookshelf is then one scan of the series table: its cost follows the number of series,
+# not the number of books.
+
+# Shelf for books without a series title (same name the bookshelf view used)
+OTHER = "Other"
+
+
+def series_key(series_title: str) -> str:
+    return series_title or OTHER
+
+
+def _series_filter(titles: set):
+    named = [title for title in titles if title != OTHER]
+    clauses = [Book.series_title.in_(named)] if named else []
+    if OTHER in titles:
+        clauses += [Book.series_title.is_(None), Book.series_title == "", Book.series_title == OTHER]
+    return or_(*clauses)
+
+
+def _aggregate(db, where, status: str = None) -> list:
+    """
+    (series, count, min volume, max volume, read count, representative isbn/title/cover) per series matching where.
+    Representative: the book marked as such, else the lowest volume, else the first registered.
+    Books waiting for their metadata with only the placeholder title are on no shelf until it arrives
+    (if the lookup fails they go to the OTHER shelf).
+    """
+    key = func.coalesce(func.nullif(Book.series_title, ""), OTHER)
+    conditions = [condition for condition in (where, Book.status == status if status else None) if condition is not None]
+    conditions.append(or_(
+        Book.enrichment_status.is_distinct_from("pending"), Book.title.is_distinct_from(PLACEHOLDER_TITLE)
+    ))
+
+    totals = (
+        select(
+            key.label("series"),
+            func.count(Book.isbn).label("volume_count"),
+            func.min(Book.volume_number).label("min_volume"),
+            func.max(Book.volume_number).label("max_volume"),
+            func.sum(case((Book.status == "done", 1), else_=0)).label("read_count"),
+        )
+        .where(*conditions)
+        .group_by(key)
+        .subquery()
+    )
+    ranked = (
+        select(
+            key.label("series"),
+            Book.isbn,
+            Book.title,
+            Book.cover_url,
+            func.row_number().over(
+                partition_by=key,
+                order_by=(
+                    func.coalesce(Book.is_series_representative, False).desc(),
+                    Book.volume_number.is_(None),
+                    Book.volume_number,
+                    Book.created_at,
+                    Book.isbn,
+                ),
+            ).label("rank"),
+        )
+        .where(*conditions)
+        .subquery()
+    )
+    query = (
+        select(totals, ranked.c.isbn, ranked.c.title, ranked.c.cover_url)
+        .join(ranked, (ranked.c.series == totals.c.series) & (ranked.c.rank == 1))
+    )
+    return db.execute(query).all()
+
+
+def refresh_series(db, series_titles):
+    """
+    Recompute the series rows for the given series titles (old and new ones of the changed books).
+    Call before commit, after the book changes are added to the session.
+    """
+    titles = {series_key(title) for title in series_titles}
+    if not titles:
+        return
+    # Concurrent writers to the same series recompute it one after the other (PostgreSQL; SQLite serializes writes)
+    lock_keys(db, "series", titles)
+    db.flush()
+
+    rows = {row.series: row for row in _aggregate(db, _series_filter(titles))}
+    existing = {series.title: series for series in db.query(Series).filter(Series.title.in_(titles)).all()}
+    now = datetime.now()
+    for title in titles:
+        row = rows.get(title)
+        series = existing.get(title)
+        if row is None:
+            if series is not None:
+                db.delete(series)
+            continue
+        values = {
+            "volume_count": row.volume_count,
+            "min_volume": row.min_volume,
+            "max_volume": row.max_volume,
+            "read_count": row.read_count or 0,
+            "representative_isbn": row.isbn,
+            "representative_title": row.title,
+            "cover_url": row.cover_url,
+        }
+        if series is None:
+            db.add(Series(title=title, updated_at=now, **values))
+        elif any(getattr(series, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(series, name, value)
+            series.updated_at = now
+
+
+def rebuild_series(db):
+    """
+    Recompute the whole series table (first run, or after changes made outside the app).
+    """
+    db.query(Series).delete(synchronize_session=False)
+    now = datetime.now()
+    db.add_all(
+        Series(
+            title=row.series,
+            volume_count=row.volume_count,
+            min_volume=row.min_volume,
+            max_volume=row.max_volume,
+            read_count=row.read_count or 0,
+            representative_isbn=row.isbn,
+            representative_title=row.title,
+            cover_url=row.cover_url,
+            updated_at=now,
+        )
+        for row in _aggregate(db, None)
+    )
+
+
+def init_series_table(session_factory):
+    """
+    Fill the series table on first run (existing libraries).
+    """
+    db = session_factory()
+    try:
+        if db.query(Series.title).first() is None and db.query(Book.isbn).first() is not None:
+            rebuild_series(db)
+            db.commit()
+    finally:
+        db.close()
+
+
+def _shelf(title, volume_count, min_volume, max_volume, read_count, isbn, representative_title, cover_url, updated_at):
+    return {
+        "series_title": title,
+        "volume_count": volume_count,
+        "min_volume": min_volume,
+        "max_volume": max_volume,
+        "read_count": read_count or 0,
+        "representative_isbn": isbn,
+        "representative_title": representative_title,
+        "cover_url": cover_url,
+        "updated_at": updated_at,
+    }
+
+
+def get_shelves(db, status: str = None) -> list:
+    """
+    Shelves (one per series) sorted by title with "Other" last.
+    With a status filter the aggregates are computed on the fly for books of that status.
+    """
+    if status:
+        shelves = [_shelf(*row, None) for row in _aggregate(db, None, status=status)]
+    else:
+        shelves = [
+            _shelf(
+                series.title, series.volume_count, series.min_volume, series.max_volume, series.read_count,
+                series.representative_isbn, series.representative_title, series.cover_url, series.updated_at,
+            )
+            for series in db.query(Series).all()
+        ]
+    shelves.sort(key=lambda shelf: (shelf["series_title"] == OTHER, shelf["series_title"]))
+    return shelves
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import io
+import ipaddress
+import json
+import os
+import re
+import socket
+import time
+from urllib.parse import urljoin, urlsplit
+import http_client
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow not installed: every size is served as the original image
+    Image = None
+
+# Local cover store. Each cover is downloaded once and stored under its SHA-256:
+#   objects/ab/cd/<sha256>.orig        original bytes as served by the provider
+#   objects/ab/cd/<sha256>-<size>.jpg  resized variants (generated once, right after download)
+#   refs/<isbn>.json                   which object belongs to an ISBN and the URL it came from
+# Identical images (the same "no image" placeholder for many books) are stored once.
+COVER_STORE_DIR = os.getenv("COVER_STORE_DIR", "./db/covers")
+
+# Variant name -> max width in pixels (height follows the aspect ratio)
+COVER_SIZES = {
+    "spine": 48,
+    "thumb": 160,
+    "card": 320,
+}
+COVER_JPEG_QUALITY = int(os.getenv("COVER_JPEG_QUALITY", "82"))
+COVER_MAX_BYTES = int(os.getenv("COVER_MAX_BYTES", str(5 * 1024 * 1024)))
+COVER_FETCH_TIMEOUT = float(os.getenv("COVER_FETCH_TIMEOUT", "10"))
+
+# Browser cache lifetime for /covers/{isbn}; requests carrying ?v= are treated as immutable
+COVER_MAX_AGE = int(os.getenv("COVER_MAX_AGE", str(30 * 24 * 3600)))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# A cover that couldn't be downloaded is retried after this many seconds
+COVER_RETRY_AFTER = int(os.getenv("COVER_RETRY_AFTER", str(24 * 3600)))
+
+# Cover URLs come from clients: only http(s) to public addresses is fetched, redirects included
+# (checked again at every hop). COVER_ALLOW_PRIVATE_HOSTS=1 lifts the address check (local test servers).
+COVER_ALLOW_PRIVATE_HOSTS = os.getenv("COVER_ALLOW_PRIVATE_HOSTS", "0") == "1"
+COVER_MAX_REDIRECTS = 5
+
+# ISBN-10/13, with or without hyphens; anything else never reaches the file system
+ISBN_RE = re.compile(r"^[0-9Xx-]{10,17}$")
+
+_locks = {}
+
+
+class CoverNotFound(Exception):
+    pass
+
+
+def _object_path(digest: str, size: str = None) -> str:
+    name = f"{digest}.orig" if size is None else f"{digest}-{size}.jpg"
+    return os.path.join(COVER_STORE_DIR, "objects", digest[:2], digest[2:4], name)
+
+
+def _ref_path(isbn: str) -> str:
+    if not ISBN_RE.match(isbn or ""):
+        raise CoverNotFound(f"Invalid ISBN: {isbn!r}")
+    return os.path.join(COVER_STORE_DIR, "refs", f"{isbn}.json")
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_ref(isbn: str):
+    try:
+        with open(_ref_path(isbn), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError, CoverNotFound):
+        return None
+
+
+def _write_ref(isbn: str, ref: dict):
+    _write_atomic(_ref_path(isbn), json.dumps(ref).encode("utf-8"))
+
+
+def _resize(data: bytes, width: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=COVER_JPEG_QUALITY, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+def _store(data: bytes) -> str:
+    """
+    Store original bytes and their size variants (skipped when already present). Returns the digest.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if not os.path.exists(_object_path(digest)):
+        _write_atomic(_object_path(digest), data)
+    if Image is not None:
+        for size, width in COVER_SIZES.items():
+            path = _object_path(digest, size)
+            if os.path.exists(path):
+                continue
+            try:
+                _write_atomic(path, _resize(data, width))
+            except Exception as e:
+                # Not a decodable image: the original is served for every size
+                print(f"Error resizing cover {digest}: {e}")
+                break
+    return digest
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_url(url: str):
+    """
+    Refuse URLs that aren't http(s) or whose host resolves to a private, loopback or otherwise
+    non-public address (the server would be fetching from its own network on the client's behalf).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CoverNotFound(f"Unsupported cover URL: {url}")
+    if COVER_ALLOW_PRIVATE_HOSTS:
+        return
+    try:
+        infos = await asyncio.to_thread(socket.getaddrinfo, parts.hostname, parts.port or 0, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as e:
+        raise CoverNotFound(f"Cover host can't be resolved: {e}")
+    if not infos or not all(_is_public(info[4][0]) for info in infos):
+        raise CoverNotFound(f"Cover host is not a public address: {parts.hostname}")
+
+
+async def _download(url: str) -> tuple:
+    """
+    Fetch an image, following redirects one at a time (each target is checked) and reading the body
+    in chunks so a response larger than COVER_MAX_BYTES is abandoned without being downloaded.
+    """
+    client = http_client.get_client()
+    for _ in range(COVER_MAX_REDIRECTS + 1):
+        await check_url(url)
+        async with client.stream("GET", url, timeout=COVER_FETCH_TIMEOUT, follow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers.get("location", ""))
+                continue
+            if response.status_code != 200:
+                raise CoverNotFound(f"Cover download returned {response.status_code}")
+            content_type = response.headers.get("content-type", "").split(";")[0].strip()
+            if not content_type.startswith("image/"):
+                raise CoverNotFound(f"Cover URL did not return an image ({content_type or 'no content type'})")
+            if int(response.headers.get("content-length") or 0) > COVER_MAX_BYTES:
+                raise CoverNotFound("Cover image is too large")
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data.extend(chunk)
+                if len(data) > COVER_MAX_BYTES:
+                    raise CoverNotFound("Cover image is too large")
+            return bytes(data), content_type
+    raise CoverNotFound("Too many redirects")
+
+
+async def ensure_cover(isbn: str, cover_url: str) -> dict:
+    """
+    Return the stored cover reference for a book, downloading it first if needed
+    (first request, cover_url changed, or a failed download is due for a retry).
+    Raises CoverNotFound when there is no usable cover.
+    """
+    if not cover_url:
+        raise CoverNotFound("Book has no cover URL")
+    _ref_path(isbn)
+
+    ref = read_ref(isbn)
+    if ref and ref.get("url") == cover_url and _ref_usable(ref):
+        return _checked(ref)
+
+    lock = _locks.setdefault(isbn, asyncio.Lock())
+    async with lock:
+        # Another request may have fetched it while we waited
+        ref = read_ref(isbn)
+        if ref and ref.get("url") == cover_url and _ref_usable(ref):
+            return _checked(ref)
+
+        try:
+            data, content_type = await _download(cover_url)
+            digest = await asyncio.to_thread(_store, data)
+            ref = {"url": cover_url, "sha256": digest, "content_type": content_type, "fetched_at": time.time()}
+        except Exception as e:
+            print(f"Error fetching cover for ISBN {isbn}: {e}")
+            ref = {"url": cover_url, "sha256": None, "error": str(e), "fetched_at": time.time()}
+        _write_ref(isbn, ref)
+        _locks.pop(isbn, None)
+        return _checked(ref)
+
+
+def _ref_usable(ref: dict) -> bool:
+    if ref.get("sha256"):
+        return os.path.exists(_object_path(ref["sha256"]))
+    return time.time() - ref.get("fetched_at", 0) < COVER_RETRY_AFTER
+
+
+def _checked(ref: dict) -> dict:
+    if not ref.get("sha256"):
+        raise CoverNotFound(ref.get("error") or "Cover not available")
+    return ref
+
+
+def cover_file(ref: dict, size: str) -> tuple:
+    """
+    (path, media type, ETag) of the requested variant; the original when the variant doesn't exist.
+    """
+    digest = ref["sha256"]
+    if size != "original":
+        path = _object_path(digest, size)
+        if os.path.exists(path):
+            return path, "image/jpeg", f'"{digest[:32]}-{size}"'
+    return _object_path(digest), ref.get("content_type", "image/jpeg"), f'"{digest[:32]}"'
+
+
+def cache_control(versioned: bool) -> str:
+    if versioned:
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={COVER_MAX_AGE}"
+
+
+async def warm_covers(books: list):
+    """
+    Download and resize covers of newly registered books ([(isbn, cover_url), ...]) in the background.
+    """
+    for isbn, cover_url in books:
+        if not cover_url:
+            continue
+        try:
+            await ensure_cover(isbn, cover_url)
+        except CoverNotFound:
+            pass
+
+
+def remove_cover_ref(isbn: str):
+    """
+    Forget the cover of a deleted book. Objects stay, another ISBN may share them.
+    """
+    try:
+        os.remove(_ref_path(isbn))
+    except (OSError, CoverNotFound):
+        pass
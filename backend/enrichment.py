@@ -0,0 +1,261 @@
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, and_
+from database import SessionLocal, ReadSessionLocal, Book, EnrichmentJob
+from utils import combine_book_data
+from title_parser import PLACEHOLDER_TITLE
+from bookshelf import refresh_series
+import covers
+import http_client
+import series_index
+import stats
+
+# Background metadata enrichment.
+# POST /books commits a book without metadata right away (placeholder title, enrichment_status "pending")
+# and queues a job in the enrichment_jobs table. Workers on the app's event loop claim jobs, run the
+# provider lookup, fill in what the user didn't set, warm the cover and tell connected clients.
+# Jobs are leased, so a job held by a worker that died is picked up again once the lease runs out,
+# also by another worker process sharing the database.
+
+# "background": POST /books returns at once and metadata arrives later; "inline": lookup during the request
+ENRICHMENT_MODE = os.getenv("ENRICHMENT_MODE", "background")
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "2"))
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "6"))
+
+# Retry delays grow from RETRY_BASE to RETRY_MAX (seconds), jittered
+RETRY_BASE = float(os.getenv("ENRICHMENT_RETRY_BASE", "30"))
+RETRY_MAX = float(os.getenv("ENRICHMENT_RETRY_MAX", str(6 * 3600)))
+
+LEASE = timedelta(seconds=int(os.getenv("ENRICHMENT_LEASE", "120")))
+POLL_INTERVAL = float(os.getenv("ENRICHMENT_POLL_INTERVAL", "5"))
+
+# Title stored until the metadata arrives (same as a registration nothing was found for)
+PENDING_TITLE = PLACEHOLDER_TITLE
+
+# Columns the lookup never writes
+BOOKKEEPING_COLUMNS = {"isbn", "created_at", "updated_at", "enrichment_status"}
+
+_workers = []
+_wakeup = None
+_loop = None
+_subscribers = set()
+
+
+def enqueue(db, isbn: str):
+    """
+    Queue a lookup for the book (in the caller's transaction). An already queued job is run again now.
+    """
+    job = db.query(EnrichmentJob).filter(
+        EnrichmentJob.isbn == isbn,
+        EnrichmentJob.status.in_(["queued", "running"])
+    ).first()
+    if job:
+        if job.status == "queued":
+            job.run_after = datetime.now()
+    else:
+        db.add(EnrichmentJob(isbn=isbn, status="queued", attempts=0, run_after=datetime.now()))
+
+
+def notify():
+    """
+    Wake idle workers (after committing new jobs). Safe to call from any thread.
+    """
+    if _loop is not None and _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def claim_job():
+    """
+    Take the next due job: queued and due, or running with an expired lease. Returns (id, isbn, attempts) or None.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.now()
+        due = or_(
+            and_(EnrichmentJob.status == "queued", EnrichmentJob.run_after <= now),
+            and_(EnrichmentJob.status == "running", EnrichmentJob.locked_until < now),
+        )
+        candidates = db.query(EnrichmentJob.id).filter(due).order_by(EnrichmentJob.run_after).limit(5).all()
+        for (job_id,) in candidates:
+            # Conditional update: only one worker (thread or process) wins the job
+            claimed = db.query(EnrichmentJob).filter(EnrichmentJob.id == job_id, due).update({
+                EnrichmentJob.status: "running",
+                EnrichmentJob.locked_until: now + LEASE,
+                EnrichmentJob.attempts: EnrichmentJob.attempts + 1,
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                job = db.get(EnrichmentJob, job_id)
+                return job.id, job.isbn, job.attempts
+        return None
+    finally:
+        db.close()
+
+
+def complete_job(job_id: int, isbn: str, fetched_data: dict):
+    """
+    Fill the book from the lookup result and close the job.
+    Fields the user set in the meantime are kept. Returns the cover URL, or None if the book is gone.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(EnrichmentJob, job_id)
+        book = db.get(Book, isbn)
+        if book is None:
+            db.delete(job)
+            db.commit()
+            return None
+
+        placeholder = book.title == PENDING_TITLE
+        user_data = {
+            column.name: getattr(book, column.name)
+            for column in Book.__table__.columns
+            if column.name not in BOOKKEEPING_COLUMNS and getattr(book, column.name) not in (None, "")
+        }
+        if placeholder:
+            user_data.pop("title", None)
+        book_data = combine_book_data(user_data, fetched_data)
+
+        old_series = book.series_title
+        old_stats = stats.snapshot(book)
+        for key, value in book_data.items():
+            if key not in Book.__table__.columns or key in BOOKKEEPING_COLUMNS or value is None:
+                continue
+            if placeholder or getattr(book, key) in (None, ""):
+                setattr(book, key, value)
+        book.enrichment_status = None
+        refresh_series(db, {old_series, book.series_title})
+        stats.record(db, before=[old_stats], after=[book])
+        # Finished jobs are not kept
+        db.delete(job)
+        db.commit()
+        series_index.series_changed(old_series, book.series_title)
+        return book.cover_url
+    finally:
+        db.close()
+
+
+def fail_job(job_id: int, isbn: str, attempts: int, error: str) -> str:
+    """
+    Schedule a retry with backoff, or give up after ENRICHMENT_MAX_ATTEMPTS. Returns the new job status.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(EnrichmentJob, job_id)
+        job.last_error = error
+        job.locked_until = None
+        if attempts >= ENRICHMENT_MAX_ATTEMPTS:
+            job.status = "failed"
+            book = db.get(Book, isbn)
+            if book is not None:
+                book.enrichment_status = "failed"
+                # No longer waiting: the book goes to its shelf (OTHER for a placeholder)
+                refresh_series(db, [book.series_title])
+        else:
+            delay = min(RETRY_MAX, RETRY_BASE * (2 ** (attempts - 1)))
+            job.status = "queued"
+            job.run_after = datetime.now() + timedelta(seconds=random.uniform(delay / 2, delay))
+        db.commit()
+        return job.status
+    finally:
+        db.close()
+
+
+def _existing_series():
+    db = ReadSessionLocal()
+    try:
+        return series_index.get_series_index(db)
+    finally:
+        db.close()
+
+
+async def run_job(job_id: int, isbn: str, attempts: int):
+    error = "No metadata found"
+    fetched_data = None
+    try:
+        existing_series = await asyncio.to_thread(_existing_series)
+        fetched_data = await http_client.fetch_book_data_async(isbn, existing_series)
+    except Exception as e:
+        error = str(e)
+
+    if fetched_data and fetched_data.get("title"):
+        cover_url = await asyncio.to_thread(complete_job, job_id, isbn, fetched_data)
+        publish({"type": "enriched", "isbn": isbn, "enrichment_status": "done"})
+        if cover_url:
+            await covers.warm_covers([(isbn, cover_url)])
+        return
+
+    status = await asyncio.to_thread(fail_job, job_id, isbn, attempts, error)
+    print(f"Enrichment of ISBN {isbn} failed (attempt {attempts}): {error}")
+    if status == "failed":
+        publish({"type": "enriched", "isbn": isbn, "enrichment_status": "failed"})
+
+
+async def _worker():
+    while True:
+        # Cleared before looking, so a job queued while we look still wakes us
+        _wakeup.clear()
+        try:
+            job = await asyncio.to_thread(claim_job)
+        except Exception as e:
+            print(f"Error claiming enrichment job: {e}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await run_job(*job)
+        except Exception as e:
+            print(f"Error running enrichment job {job}: {e}")
+
+
+def start_workers():
+    """
+    Start the worker pool on the running event loop (app startup).
+    """
+    global _wakeup, _loop
+    if _workers or ENRICHMENT_WORKERS <= 0:
+        return
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    for _ in range(ENRICHMENT_WORKERS):
+        _workers.append(asyncio.ensure_future(_worker()))
+
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+def subscribe() -> asyncio.Queue:
+    queue = asyncio.Queue(maxsize=100)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    _subscribers.discard(queue)
+
+
+def publish(event: dict):
+    """
+    Send an event to every connected GET /books/events client (call on the event loop).
+    """
+    for queue in list(_subscribers):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that stopped reading catches up through GET /books/changes
+            pass
+
+
+def queue_stats(db) -> dict:
+    counts = db.query(EnrichmentJob.status, func.count(EnrichmentJob.id)).group_by(EnrichmentJob.status).all()
+    return {"mode": ENRICHMENT_MODE, "workers": len(_workers), "jobs": dict(counts)}
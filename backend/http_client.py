@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+import httpx
+import metadata_cache
+import metrics
+import openbd_mirror
+import provider_client
+import singleflight
+from utils import (
+    OPENBD_API_URL, GOOGLE_BOOKS_API_URL, RAKUTEN_BOOKS_API_URL,
+    LOOKUP_MODE, LOOKUP_DEADLINE, PROVIDER_TIMEOUTS, lookup_key,
+    parse_openbd_response, parse_rakuten_response, parse_google_response,
+    openbd_found, rakuten_found, google_found,
+    base_book_data, needs_rakuten_data, merge_rakuten_data,
+    needs_google_data, merge_google_data, finalize_book_data,
+)
+
+# Async counterpart of the provider fetchers in utils.py.
+# All endpoints share one AsyncClient, so connections to OpenBD/Rakuten/Google stay alive between
+# requests and a slow upstream only parks a coroutine instead of a threadpool worker.
+# The metadata cache and the OpenBD mirror are SQLite files: they are read and written on a worker
+# thread (asyncio.to_thread), never on the event loop.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+_client = None
+_background_tasks = set()
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared AsyncClient, creating it on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(5.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@singleflight.coalesce("openbd")
+@metrics.traced("openbd")
+async def fetch_openbd_data_async(isbn: str, deadline: float = None):
+    """
+    Fetch book data from OpenBD API (async, cached, local mirror first).
+    """
+    data = await asyncio.to_thread(openbd_mirror.lookup, isbn)
+    if data is None:
+        data = await asyncio.to_thread(metadata_cache.get, "openbd", isbn)
+    if data is metadata_cache.MISS:
+        data = await provider_client.get_json_async(
+            get_client(), "openbd", OPENBD_API_URL, {"isbn": isbn},
+            timeout=PROVIDER_TIMEOUTS["openbd"], deadline=deadline
+        )
+        if data is None:
+            return None
+        await asyncio.to_thread(metadata_cache.put, "openbd", isbn, data if openbd_found(data) else None)
+
+    return parse_openbd_response(data)
+
+
+@singleflight.coalesce("rakuten")
+@metrics.traced("rakuten")
+async def fetch_rakuten_books_data_async(isbn: str, deadline: float = None):
+    """
+    Fetch book data from Rakuten Books API (async, cached).
+    Waits for rate limit tokens and retries stop early when the deadline (time.monotonic()) would pass.
+    """
+    data = await asyncio.to_thread(metadata_cache.get, "rakuten", isbn)
+    if data is metadata_cache.MISS:
+        app_id = os.environ.get("RAKUTEN_APP_ID")
+        if not app_id:
+            print("RAKUTEN_APP_ID not set, skipping Rakuten Books API")
+            return None
+
+        data = await rakuten_get({"applicationId": app_id, "isbn": isbn}, deadline)
+        if data is None:
+            return None
+        await asyncio.to_thread(metadata_cache.put, "rakuten", isbn, data if rakuten_found(data) else None)
+
+    return parse_rakuten_response(data)
+
+
+async def rakuten_get(params: dict, deadline: float = None, timeout: float = None):
+    """
+    GET the Rakuten Books search API (rate limited, retried, behind the circuit breaker).
+    Returns the JSON body or None on failure.
+    """
+    return await provider_client.get_json_async(
+        get_client(), "rakuten", RAKUTEN_BOOKS_API_URL, params,
+        timeout=timeout or PROVIDER_TIMEOUTS["rakuten"], deadline=deadline
+    )
+
+
+@singleflight.coalesce("google")
+@metrics.traced("google")
+async def fetch_google_books_data_async(isbn: str, deadline: float = None):
+    """
+    Fetch book data from Google Books API (async, cached).
+    """
+    data = await asyncio.to_thread(metadata_cache.get, "google", isbn)
+    if data is metadata_cache.MISS:
+        data = await google_get({"q": f"isbn:{isbn}"}, deadline=deadline)
+        if data is None:
+            return None
+        await asyncio.to_thread(metadata_cache.put, "google", isbn, data if google_found(data) else None)
+
+    return parse_google_response(isbn, data)
+
+
+async def google_get(params: dict, timeout: float = None, deadline: float = None):
+    """
+    GET the Google Books volumes API. Returns the JSON body or None on failure.
+    """
+    return await provider_client.get_json_async(
+        get_client(), "google", GOOGLE_BOOKS_API_URL, params,
+        timeout=timeout or PROVIDER_TIMEOUTS["google"], deadline=deadline
+    )
+
+
+@singleflight.coalesce("book", key=lookup_key)
+async def fetch_book_data_async(isbn: str, existing_series: list = None, mode: str = None, deadline: float = None):
+    """
+    Async version of utils.fetch_book_data with the same merge precedence.
+    In "concurrent" mode all providers are started at once; in "waterfall" mode Rakuten and Google
+    are only called when the merged record still has gaps.
+    """
+    mode = mode or LOOKUP_MODE
+    started = time.perf_counter()
+    try:
+        with metrics.span("lookup", isbn=isbn, mode=mode):
+            return await _lookup_async(isbn, existing_series, mode, deadline or LOOKUP_DEADLINE)
+    finally:
+        metrics.observe("lookup_duration_seconds", time.perf_counter() - started, mode=mode)
+
+
+async def _lookup_async(isbn: str, existing_series, mode: str, deadline: float):
+    deadline_at = time.monotonic() + deadline
+    concurrent = mode == "concurrent"
+
+    # Books in the local OpenBD mirror: other providers only fill gaps, or aren't asked at all
+    local_data = parse_openbd_response(await asyncio.to_thread(openbd_mirror.lookup, isbn))
+    if local_data is not None:
+        if openbd_mirror.MIRROR_ONLY:
+            return finalize_book_data(base_book_data(local_data), existing_series)
+        concurrent = False
+
+    def start(coro):
+        return asyncio.ensure_future(coro)
+
+    openbd_task = start(fetch_openbd_data_async(isbn, deadline_at))
+    rakuten_task = start(fetch_rakuten_books_data_async(isbn, deadline_at)) if concurrent else None
+    google_task = start(fetch_google_books_data_async(isbn, deadline_at)) if concurrent else None
+
+    async def result_of(task, provider):
+        try:
+            return await asyncio.wait_for(task, timeout=max(0, deadline_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            print(f"{provider} lookup for ISBN {isbn} missed the {deadline}s deadline")
+        except Exception as e:
+            print(f"Error fetching from {provider}: {e}")
+        return None
+
+    try:
+        book_data = base_book_data(await result_of(openbd_task, "OpenBD"))
+
+        if needs_rakuten_data(book_data):
+            rakuten_task = rakuten_task or start(fetch_rakuten_books_data_async(isbn, deadline_at))
+            book_data = merge_rakuten_data(book_data, await result_of(rakuten_task, "Rakuten"))
+
+        if needs_google_data(book_data):
+            google_task = google_task or start(fetch_google_books_data_async(isbn, deadline_at))
+            book_data = merge_google_data(book_data, await result_of(google_task, "Google Books"))
+    finally:
+        # Let lookups the merge did not need finish in the background so their answers still land in the cache
+        for task in (rakuten_task, google_task):
+            if task is not None and not task.done():
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+
+    return finalize_book_data(book_data, existing_series)
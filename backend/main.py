@@ -1,15 +1,52 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from typing import List, Optional
 from pydantic import BaseModel
-from database import Base, engine, get_db, Book
-from utils import fetch_book_data
-import requests
+from database import engine, read_engine, get_db, get_read_db, schema_lock, SessionLocal, Book, Series, EnrichmentJob
+from book_query import (
+    SORT_KEYS, DEFAULT_SORT, apply_book_filters, apply_sort_and_cursor,
+    BOOK_FIELDS, parse_fields, sort_column, encode_cursor,
+)
+from utils import fetch_book_data, combine_book_data
+import re
+from search import init_search_index, search_books
+from bookshelf import OTHER, init_series_table, refresh_series, get_shelves
+from tags import sync_book_tags, remove_book_tags, tag_facets
+from sync import (
+    make_sync_token, parse_sync_token, record_deletion, clear_deletion, prune_tombstones,
+    get_changes, library_version, make_etag, last_modified,
+)
+import metadata_cache
+import migrations
+import openbd_mirror
+import singleflight
+import provider_client
+import series_index
+import covers
+import enrichment
+import transfer
+import stats
+import http_client
+import metrics
+import profiling
+import response_encoding
+import asyncio
+import json
 import os
 
 # Initialize Database
-Base.metadata.create_all(bind=engine)
+metrics.instrument_engine(engine)
+if read_engine is not engine:
+    metrics.instrument_engine(read_engine)
+# Workers starting together take turns (PostgreSQL), so schema changes and first-run backfills run once
+with schema_lock(engine):
+    migrations.migrate(engine)
+    init_search_index(engine)
+    init_series_table(SessionLocal)
+    stats.init_stats(SessionLocal)
 
 app = FastAPI(title="Home Library API")
 
@@ -25,8 +62,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Token", "ETag", "Last-Modified", "Server-Timing", "X-Trace"],
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Latency and DB query count per route for GET /metrics.
+    Requests with the X-Debug-Trace header get their trace spans back in X-Trace / Server-Timing.
+    """
+    trace = metrics.TRACE_ENABLED and metrics.TRACE_HEADER in request.headers
+    token = metrics.begin_request(trace)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        route = request.scope.get("route")
+        headers = metrics.end_request(token, request.method, route.path if route else "unmatched", status_code)
+    response.headers.update(headers)
+    return response
+
+@app.on_event("startup")
+async def start_enrichment_workers():
+    enrichment.start_workers()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await enrichment.stop_workers()
+    await http_client.close_client()
+
 from datetime import datetime
 
 # Pydantic Models
@@ -90,6 +155,7 @@ class BookResponse(BaseModel):
     series_title: Optional[str] = None
     label: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
     purchased_date: Optional[datetime] = None
     reading_start_date: Optional[datetime] = None
     reading_end_date: Optional[datetime] = None
@@ -101,138 +167,365 @@ class BookResponse(BaseModel):
     due_date: Optional[datetime] = None
     volume_number: Optional[float] = None
     is_series_representative: Optional[bool] = None
+    enrichment_status: Optional[str] = None
 
     class Config:
         from_attributes = True
 
-def get_existing_series(db: Session) -> list:
-    """Get list of distinct series titles from the database."""
-    series_rows = db.query(Book.series_title).filter(
-        Book.series_title.isnot(None),
-        Book.series_title != ''
-    ).distinct().all()
-    
-    return [s[0] for s in series_rows if s[0]]
+class BookBatchCreate(BaseModel):
+    isbns: List[str] = []
+    books: List[BookCreate] = []
+
+class BookBatchItemResult(BaseModel):
+    isbn: str
+    status: str  # created, duplicate, failed
+    detail: Optional[str] = None
+    book: Optional[BookResponse] = None
+
+class BookBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    failed: int
+    results: List[BookBatchItemResult]
+
+class BookChangesResponse(BaseModel):
+    token: str
+    full_resync: bool
+    upserted: List[BookResponse]
+    deleted: List[str]
+
+# Max number of metadata lookups running at once for one batch
+BATCH_LOOKUP_CONCURRENCY = int(os.getenv("BATCH_LOOKUP_CONCURRENCY", "8"))
+
+def get_existing_series(db: Session):
+    """Get the existing series titles (prefix index) to match new titles against."""
+    return series_index.get_series_index(db)
+
+def build_book_data(book_in: BookCreate, fetched_data: Optional[dict]) -> dict:
+    """
+    Combine user input with metadata fetched from external APIs.
+    Normalizes the title and derives volume number and series title.
+    """
+    return combine_book_data(book_in.dict(exclude_unset=True), fetched_data)
 
 @app.post("/books", response_model=BookResponse, status_code=status.HTTP_201_CREATED)
-def create_book(book_in: BookCreate, db: Session = Depends(get_db)):
-    from utils import normalize_title, extract_volume_number, clean_title
-    import re
-    
-    # Check if book already exists
-    existing_book = db.query(Book).filter(Book.isbn == book_in.isbn).first()
+def create_book(
+    book_in: BookCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    # Check if book already exists (on the read pool: the writer isn't held during the lookup below)
+    existing_book = read_db.query(Book.isbn).filter(Book.isbn == book_in.isbn).first()
     if existing_book:
         raise HTTPException(status_code=400, detail="Book already registered")
 
-    # Get existing series to match against
-    existing_series = get_existing_series(db)
-    
-    # Prepare book data
-    book_data = book_in.dict(exclude_unset=True)
-    
-    # If title is missing, try to fetch from external APIs
-    if not book_data.get("title"):
-        fetched_data = fetch_book_data(book_in.isbn, existing_series)
-        if fetched_data:
-            for key, value in fetched_data.items():
-                # Save API's series_title as label (it's usually publisher label like 電撃文庫)
-                if key == "series_title":
-                    if value and not book_data.get("label"):
-                        # Remove English part from label (e.g., "電撃文庫 = DENGEKI BUNKO" -> "電撃文庫")
-                        clean_label = re.sub(r'\s*[=＝]\s*[A-Za-z].*$', '', value).strip()
-                        book_data["label"] = clean_label
-                    continue
-                if key not in book_data or not book_data[key]:
-                    book_data[key] = value
-        else:
-            if "title" not in book_data:
-                book_data["title"] = "Unknown Title"
-    
-    # Always normalize title (remove English subtitles like "= The irregular...")
-    if book_data.get("title"):
-        book_data["title"] = normalize_title(book_data["title"])
-    
-    # Always extract volume number from title
-    if book_data.get("title"):
-        volume = extract_volume_number(book_data["title"])
-        if volume:
-            book_data["volume_number"] = volume
-    
-    # Only extract series title from title if not already provided by user
-    if book_data.get("title") and not book_data.get("series_title"):
-        book_data["series_title"] = clean_title(book_data["title"])
-    
-    # Note: Title format unification is disabled because each book may have unique subtitles
-    # The series_title is used for grouping, while title preserves individual book info
-    # 
-    # Try to match title format with existing books in the same series
-    # if book_data.get("series_title"):
-    #     existing_series_books = db.query(Book).filter(
-    #         Book.series_title == book_data["series_title"]
-    #     ).all()
-    #     
-    #     if existing_series_books:
-    #         # Get the title format pattern from an existing book
-    #         sample_title = existing_series_books[0].title
-    #         sample_volume = existing_series_books[0].volume_number
-    #         
-    #         if sample_title and sample_volume and book_data.get("volume_number"):
-    #             # Extract the format pattern (e.g., "魔法科高校の劣等生. {num}" or "魔法科高校の劣等生 ({num})")
-    #             new_volume = book_data["volume_number"]
-    #             
-    #             # Try different patterns to match the existing format
-    #             patterns = [
-    #                 (rf'\.\s*{sample_volume}(\s*\([^)]+\))?$', f'. {new_volume}'),  # "Title. 1 (Subtitle)"
-    #                 (rf'[（(]{sample_volume}[)）]', f'({new_volume})'),  # "Title (1)"
-    #                 (rf'第{sample_volume}[巻話集号]', f'第{new_volume}巻'),  # "Title 第1巻"
-    #                 (rf'\s+{sample_volume}\s*$', f' {new_volume}'),  # "Title 1"
-    #             ]
-    #             
-    #             for pattern, replacement in patterns:
-    #                 if re.search(pattern, sample_title):
-    #                     # Apply the same format to the new title
-    #                     base_title = book_data["series_title"]
-    #                     # Extract subtitle if exists in original
-    #                     subtitle_match = re.search(rf'{sample_volume}\s*(\([^)]+\))', sample_title)
-    #                     subtitle_suffix = ""
-    #                     if subtitle_match:
-    #                         # Try to keep the subtitle format
-    #                         pass  # For now, just use the number
-    #                     
-    #                     new_title = re.sub(pattern, replacement, sample_title)
-    #                     new_title = re.sub(rf'{sample_volume}', str(new_volume), new_title, count=1)
-    #                     book_data["title"] = new_title
-    #                     break
+    # If title is missing, try to fetch from external APIs (or leave it to the enrichment workers)
+    fetched_data = None
+    if not book_in.title and enrichment.ENRICHMENT_MODE == "inline":
+        fetched_data = fetch_book_data(book_in.isbn, get_existing_series(read_db))
+    read_db.close()
+
+    book_data = build_book_data(book_in, fetched_data)
+    pending = not book_in.title and not fetched_data
+    if pending:
+        book_data["enrichment_status"] = "pending"
 
     new_book = Book(**book_data)
-    db.add(new_book)
-    db.commit()
-    db.refresh(new_book)
+    try:
+        db.add(new_book)
+        sync_book_tags(db, new_book.isbn, new_book.tags)
+        clear_deletion(db, [new_book.isbn])
+        if pending:
+            enrichment.enqueue(db, new_book.isbn)
+        refresh_series(db, [new_book.series_title])
+        stats.record(db, after=[new_book])
+        db.commit()
+    except IntegrityError:
+        # Registered by a concurrent request since the check above
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Book already registered")
+    series_index.series_added(new_book.series_title)
+    if pending:
+        enrichment.notify()
+    background_tasks.add_task(covers.warm_covers, [(new_book.isbn, new_book.cover_url)])
     return new_book
 
+@app.post("/books/batch", response_model=BookBatchResponse)
+async def create_books_batch(
+    batch_in: BookBatchCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    """
+    Register many books in one request (continuous scan, series bulk registration).
+    Everything is inserted in a single transaction. Books without a title are queued for
+    background enrichment (ENRICHMENT_MODE=inline: looked up concurrently first). Returns a result per item.
+    """
+    items = [BookCreate(isbn=isbn) for isbn in batch_in.isbns] + list(batch_in.books)
+    results = [None] * len(items)
+
+    # Duplicates: already in the library, or repeated within this batch
+    # (read on the read pool: the writer is only taken once the lookups are done)
+    requested_isbns = {item.isbn for item in items}
+    owned_isbns = await asyncio.to_thread(lambda: {
+        row[0] for row in read_db.query(Book.isbn).filter(Book.isbn.in_(requested_isbns)).all()
+    } if requested_isbns else set())
+    seen_isbns = set()
+    pending = []
+    for index, item in enumerate(items):
+        if item.isbn in owned_isbns or item.isbn in seen_isbns:
+            results[index] = BookBatchItemResult(isbn=item.isbn, status="duplicate", detail="Book already registered")
+        else:
+            seen_isbns.add(item.isbn)
+            pending.append(index)
+
+    inline = enrichment.ENRICHMENT_MODE == "inline"
+    # Get existing series to match against (once for the whole batch)
+    existing_series = await asyncio.to_thread(get_existing_series, read_db) if inline else None
+    read_db.close()
+
+    # Fetch metadata for items without a title, a bounded number at a time
+    semaphore = asyncio.Semaphore(BATCH_LOOKUP_CONCURRENCY)
+
+    async def lookup(item: BookCreate):
+        if item.title or not inline:
+            return None
+        async with semaphore:
+            return await http_client.fetch_book_data_async(item.isbn, existing_series)
+
+    fetched = await asyncio.gather(*(lookup(items[index]) for index in pending), return_exceptions=True)
+
+    def insert_books() -> list:
+        """
+        The write part, on a worker thread: waiting for the (single) writer connection mustn't block the event loop.
+        """
+        created_books = []
+        for index, fetched_data in zip(pending, fetched):
+            item = items[index]
+            if isinstance(fetched_data, Exception):
+                print(f"Error fetching book data for ISBN {item.isbn}: {fetched_data}")
+                fetched_data = None
+            try:
+                # Savepoint per item so one bad row doesn't abort the whole batch
+                with db.begin_nested():
+                    book_data = build_book_data(item, fetched_data)
+                    queued = not item.title and not fetched_data
+                    if queued:
+                        book_data["enrichment_status"] = "pending"
+                    new_book = Book(**book_data)
+                    db.add(new_book)
+                    db.flush()
+                    sync_book_tags(db, new_book.isbn, new_book.tags)
+                    if queued:
+                        enrichment.enqueue(db, new_book.isbn)
+                created_books.append((index, new_book))
+            except (SQLAlchemyError, TypeError, ValueError) as e:
+                results[index] = BookBatchItemResult(isbn=item.isbn, status="failed", detail=str(e))
+
+        clear_deletion(db, [new_book.isbn for _, new_book in created_books])
+        refresh_series(db, {new_book.series_title for _, new_book in created_books})
+        stats.record(db, after=[new_book for _, new_book in created_books])
+
+        # Serialize before commit so the rows don't have to be reloaded afterwards
+        for index, new_book in created_books:
+            results[index] = BookBatchItemResult(
+                isbn=new_book.isbn,
+                status="created",
+                book=BookResponse.model_validate(new_book)
+            )
+
+        db.commit()
+        return created_books
+
+    created_books = await asyncio.to_thread(insert_books)
+    for _, new_book in created_books:
+        series_index.series_added(new_book.series_title)
+    enrichment.notify()
+    background_tasks.add_task(
+        covers.warm_covers, [(r.book.isbn, r.book.cover_url) for r in results if r.status == "created"]
+    )
+
+    return BookBatchResponse(
+        created=sum(1 for r in results if r.status == "created"),
+        duplicates=sum(1 for r in results if r.status == "duplicate"),
+        failed=sum(1 for r in results if r.status == "failed"),
+        results=results
+    )
+
 @app.get("/books", response_model=List[BookResponse])
-def read_books(status: Optional[str] = None, db: Session = Depends(get_db)):
+def read_books(
+    request: Request,
+    status: Optional[str] = None,
+    series: Optional[str] = None,
+    tag: Optional[str] = None,
+    tag_mode: str = Query("and", pattern="^(and|or)$"),
+    location: Optional[str] = None,
+    lent_to: Optional[str] = None,
+    author: Optional[str] = None,
+    sort: str = DEFAULT_SORT,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    List books with optional filters, sorting and keyset pagination.
+    With limit set, the cursor for the next page is returned in the X-Next-Cursor header.
+    fields=isbn,title,... (or fields=list for the slim list-view columns) returns only those columns.
+    tag=a,b matches books with all listed tags (tag_mode=or: any of them).
+    format=ndjson streams one book per line instead of a JSON array.
+    Responses carry an ETag (304 when unchanged) and an X-Sync-Token for GET /books/changes.
+
+    Rows are read as column tuples and encoded directly (no BookResponse per row), gzip/br compressed
+    when the client accepts it: the full library is the largest response the app sends.
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}")
+    try:
+        field_names = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Take the token before reading so changes made during the read are picked up by the next sync
+    headers = {"X-Sync-Token": make_sync_token()}
+    version = library_version(db)
+    headers["ETag"] = make_etag(version, request.url.query)
+    modified = last_modified(version)
+    if modified:
+        headers["Last-Modified"] = modified
+    if headers["ETag"] in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+
+    field_names = field_names or BOOK_FIELDS
     try:
-        query = db.query(Book)
-        if status:
-            query = query.filter(Book.status == status)
-        return query.all()
+        query = db.query(*[Book.__table__.c[name] for name in field_names], sort_column(sort))
+        query = apply_book_filters(query, status, series, tag, location, lent_to, author, tag_mode)
+        query = apply_sort_and_cursor(query, sort, cursor)
+
+        if limit:
+            rows = query.limit(limit + 1).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        else:
+            rows = query.all()
+            has_more = False
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error reading books: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    if has_more:
+        last = rows[-1]._mapping
+        headers["X-Next-Cursor"] = encode_cursor(sort, last["_sort_value"], last["isbn"])
+
+    items = response_encoding.rows_as_dicts(rows, field_names)
+    accept_encoding = request.headers.get("accept-encoding")
+    if format == "ndjson":
+        return response_encoding.ndjson_response(items, accept_encoding, headers)
+    return response_encoding.json_response(items, accept_encoding, headers)
+
+@app.get("/books/search")
+def search_library(
+    q: str,
+    status: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Full-text search over the local library (title, authors, series, label, notes, description, tags).
+    Results are ranked and matched parts are wrapped in <mark> tags.
+    """
+    return search_books(db, q, status=status, limit=limit, offset=offset)
+
+@app.get("/books/changes", response_model=BookChangesResponse)
+def read_book_changes(since: str, db: Session = Depends(get_read_db)):
+    """
+    Books added/updated and ISBNs deleted since the sync token from the last fetch.
+    Use the returned token for the next call. full_resync=true means the client must reload GET /books.
+    """
+    try:
+        since_moment = parse_sync_token(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return get_changes(db, since_moment)
+
+@app.get("/books/events")
+async def book_events(request: Request):
+    """
+    Server-sent events: "enriched" when background enrichment of a book finished or gave up.
+    Clients fetch the updated rows through GET /books/changes.
+    """
+    queue = enrichment.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            enrichment.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@app.post("/books/{isbn}/enrich", response_model=BookResponse)
+def enrich_book(isbn: str, db: Session = Depends(get_db)):
+    """
+    Queue a background metadata lookup for a book again (e.g. after enrichment failed).
+    """
+    book = db.query(Book).filter(Book.isbn == isbn).first()
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    db.query(EnrichmentJob).filter(
+        EnrichmentJob.isbn == isbn, EnrichmentJob.status == "failed"
+    ).delete(synchronize_session=False)
+    enrichment.enqueue(db, isbn)
+    book.enrichment_status = "pending"
+    refresh_series(db, [book.series_title])
+    db.commit()
+    enrichment.notify()
+    return book
+
+@app.get("/enrichment/status")
+def get_enrichment_status(db: Session = Depends(get_read_db)):
+    """
+    Background enrichment mode, number of workers and jobs per state.
+    """
+    return enrichment.queue_stats(db)
+
 @app.put("/books/{isbn}", response_model=BookResponse)
-def update_book(isbn: str, book_update: BookUpdate, db: Session = Depends(get_db)):
+def update_book(isbn: str, book_update: BookUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     book = db.query(Book).filter(Book.isbn == isbn).first()
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     
+    old_series = book.series_title
+    old_stats = stats.snapshot(book)
     update_data = book_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(book, key, value)
+    if "tags" in update_data:
+        sync_book_tags(db, isbn, book.tags)
+    refresh_series(db, {old_series, book.series_title})
+    stats.record(db, before=[old_stats], after=[book])
     
     db.commit()
-    db.refresh(book)
+    series_index.series_changed(old_series, book.series_title)
+    if "cover_url" in update_data:
+        background_tasks.add_task(covers.warm_covers, [(book.isbn, book.cover_url)])
     return book
 
 @app.delete("/books/{isbn}", status_code=status.HTTP_204_NO_CONTENT)
@@ -241,42 +534,176 @@ def delete_book(isbn: str, db: Session = Depends(get_db)):
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
+    series = book.series_title
+    old_stats = stats.snapshot(book)
+    remove_book_tags(db, isbn)
     db.delete(book)
+    record_deletion(db, isbn)
+    prune_tombstones(db)
+    refresh_series(db, [series])
+    stats.record(db, before=[old_stats])
     db.commit()
+    series_index.series_removed(series)
+    covers.remove_cover_ref(isbn)
+
+@app.get("/covers/{isbn}")
+async def get_cover(
+    isbn: str,
+    request: Request,
+    size: str = Query("thumb", pattern="^(spine|thumb|card|original)$"),
+    v: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Cover image of a book from the local cover store (downloaded once from cover_url).
+    size: spine (48px wide), thumb (160px), card (320px) or original.
+    Add v=<anything that changes with the cover, e.g. updated_at> to get an immutable cache entry.
+    """
+    # Database work goes to a worker thread: async routes mustn't block the event loop
+    book = await asyncio.to_thread(lambda: db.query(Book.cover_url).filter(Book.isbn == isbn).first())
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    try:
+        ref = await covers.ensure_cover(isbn, book.cover_url)
+    except covers.CoverNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    path, media_type, etag = covers.cover_file(ref, size)
+    headers = {"ETag": etag, "Cache-Control": covers.cache_control(bool(v))}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 @app.get("/lookup/isbn/{isbn}")
-def lookup_isbn(isbn: str, db: Session = Depends(get_db)):
+async def lookup_isbn(isbn: str, refresh: bool = False, db: Session = Depends(get_read_db)):
     """
     Lookup book information by ISBN using external APIs (Rakuten Books, Google Books)
+    Pass refresh=true to bypass the metadata cache for this ISBN.
     """
-    existing_series = get_existing_series(db)
-    book_data = fetch_book_data(isbn, existing_series)
+    if refresh:
+        await asyncio.to_thread(metadata_cache.invalidate, key=isbn)
+    existing_series = await asyncio.to_thread(get_existing_series, db)
+    book_data = await http_client.fetch_book_data_async(isbn, existing_series)
     if book_data:
         return book_data
     raise HTTPException(status_code=404, detail="Book not found")
 
+@app.get("/tags")
+def get_tag_facets(status: Optional[str] = None, limit: Optional[int] = Query(None, ge=1), db: Session = Depends(get_read_db)):
+    """
+    Get tags with the number of books for each (optionally within one status).
+    """
+    return {"tags": tag_facets(db, status=status, limit=limit)}
+
 @app.get("/series")
-def get_series_list(db: Session = Depends(get_db)):
+def get_series_list(db: Session = Depends(get_read_db)):
     """
     Get list of unique series titles from the database.
     """
-    series = db.query(Book.series_title).filter(
-        Book.series_title.isnot(None),
-        Book.series_title != ''
-    ).distinct().all()
+    series = db.query(Series.title).filter(Series.title != OTHER).all()
     
     # Extract and sort series titles
     series_list = sorted([s[0] for s in series if s[0]])
     return {"series": series_list}
 
+@app.get("/stats")
+def get_library_stats(top: int = Query(stats.DEFAULT_TOP, ge=1, le=100), db: Session = Depends(get_read_db)):
+    """
+    Library statistics from incrementally maintained counters: totals, per-status counts,
+    monthly added/started/finished histograms, top authors/series/labels/borrowers and lending.
+    """
+    return stats.get_stats(db, top=top)
+
+@app.get("/bookshelf")
+def get_bookshelf(status: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """
+    Books grouped by series, one shelf per series: volume count, min/max volume, read count and
+    the representative book (marked one, else lowest volume) with its cover.
+    Served from the series table; with status the shelves only count books of that status.
+    """
+    shelves = get_shelves(db, status=status)
+    return {"shelves": shelves, "total_books": sum(shelf["volume_count"] for shelf in shelves)}
+
+@app.get("/cache/metadata")
+def get_metadata_cache_stats():
+    """
+    Show how many provider responses are cached and how much space they use.
+    """
+    return metadata_cache.stats()
+
+@app.get("/cache/openbd-mirror")
+def get_openbd_mirror_stats():
+    """
+    Size and last import/refresh of the local OpenBD mirror (see openbd_mirror.py).
+    """
+    return openbd_mirror.stats()
+
+@app.get("/cache/coalescing")
+def get_coalescing_stats():
+    """
+    Show how many lookups joined an identical in-flight lookup instead of calling the APIs again.
+    """
+    return singleflight.stats()
+
+@app.get("/providers/status")
+def get_provider_status():
+    """
+    Rate limit tokens, circuit breaker state and request counters per external API.
+    """
+    return provider_client.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Request latency, DB queries, provider outcomes/latency and merge field sources (Prometheus text format).
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles")
+def list_request_profiles(request: Request):
+    """
+    Stored request profiles (newest first). Profile a request by sending the X-Profile header
+    while PROFILING_ENABLED=1.
+    """
+    if not profiling.authorized(request.headers.get(profiling.PROFILING_HEADER)):
+        raise HTTPException(status_code=403, detail="Profiling token required (set PROFILING_TOKEN)")
+    return {
+        "enabled": profiling.PROFILING_ENABLED,
+        "header": profiling.PROFILING_HEADER,
+        "sample_rate": profiling.PROFILING_SAMPLE_RATE,
+        "profiles": profiling.list_profiles(),
+    }
+
+@app.get("/admin/profiles/{profile_id}")
+def get_request_profile(profile_id: str, request: Request):
+    """
+    One profile: request, SQL statements with timings and the top functions by cumulative time.
+    """
+    if not profiling.authorized(request.headers.get(profiling.PROFILING_HEADER)):
+        raise HTTPException(status_code=403, detail="Profiling token required (set PROFILING_TOKEN)")
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@app.get("/admin/profiles/{profile_id}/pstats")
+def download_request_profile(profile_id: str, request: Request):
+    """
+    The raw cProfile data (open with pstats or snakeviz).
+    """
+    if not profiling.authorized(request.headers.get(profiling.PROFILING_HEADER)):
+        raise HTTPException(status_code=403, detail="Profiling token required (set PROFILING_TOKEN)")
+    path = profiling.pstats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
 @app.get("/test/compare-apis/{isbn}")
-def compare_apis(isbn: str, db: Session = Depends(get_db)):
+async def compare_apis(isbn: str, db: Session = Depends(get_read_db)):
     """
     Test endpoint to compare data from all three APIs for the same ISBN.
     Useful for development and debugging.
     """
-    from utils import fetch_rakuten_books_data, fetch_google_books_data, extract_volume_number, clean_title
-    
     results = {
         "isbn": isbn,
         "openbd": None,
@@ -285,57 +712,29 @@ def compare_apis(isbn: str, db: Session = Depends(get_db)):
         "merged": None
     }
     
-    # 1. OpenBD
-    try:
-        response = requests.get(f"https://api.openbd.jp/v1/get?isbn={isbn}")
-        if response.status_code == 200:
-            data = response.json()
-            if data and data[0]:
-                book_info = data[0]['summary']
-                results["openbd"] = {
-                    "title": book_info.get("title"),
-                    "authors": book_info.get("author"),
-                    "publisher": book_info.get("publisher"),
-                    "published_date": book_info.get("pubdate"),
-                    "cover_url": book_info.get("cover"),
-                    "series": book_info.get("series"),
-                }
-    except Exception as e:
-        results["openbd"] = {"error": str(e)}
-    
-    # 2. Rakuten
-    try:
-        rakuten_data = fetch_rakuten_books_data(isbn)
-        if rakuten_data:
-            results["rakuten"] = {
-                "title": rakuten_data.get("title"),
-                "authors": rakuten_data.get("authors"),
-                "publisher": rakuten_data.get("publisher"),
-                "published_date": rakuten_data.get("published_date"),
-                "cover_url": rakuten_data.get("cover_url"),
-                "series": rakuten_data.get("series_title"),
+    # 1. OpenBD, 2. Rakuten, 3. Google Books (queried at the same time)
+    provider_results = await asyncio.gather(
+        http_client.fetch_openbd_data_async(isbn),
+        http_client.fetch_rakuten_books_data_async(isbn),
+        http_client.fetch_google_books_data_async(isbn),
+        return_exceptions=True
+    )
+    for name, data in zip(["openbd", "rakuten", "google"], provider_results):
+        if isinstance(data, Exception):
+            results[name] = {"error": str(data)}
+        elif data:
+            results[name] = {
+                "title": data.get("title"),
+                "authors": data.get("authors"),
+                "publisher": data.get("publisher"),
+                "published_date": data.get("published_date"),
+                "cover_url": data.get("cover_url"),
+                "series": data.get("series_title"),
             }
-    except Exception as e:
-        results["rakuten"] = {"error": str(e)}
-    
-    # 3. Google Books
-    try:
-        google_data = fetch_google_books_data(isbn)
-        if google_data:
-            results["google"] = {
-                "title": google_data.get("title"),
-                "authors": google_data.get("authors"),
-                "publisher": google_data.get("publisher"),
-                "published_date": google_data.get("published_date"),
-                "cover_url": google_data.get("cover_url"),
-                "series": google_data.get("series_title"),
-            }
-    except Exception as e:
-        results["google"] = {"error": str(e)}
     
     # 4. Merged (what we actually use)
-    existing_series = get_existing_series(db)
-    merged = fetch_book_data(isbn, existing_series)
+    existing_series = await asyncio.to_thread(get_existing_series, db)
+    merged = await http_client.fetch_book_data_async(isbn, existing_series)
     if merged:
         # Check if series was matched against existing series
         series_title = merged.get("series_title")
@@ -355,46 +754,51 @@ def compare_apis(isbn: str, db: Session = Depends(get_db)):
     return results
 
 @app.get("/search/title")
-def search_by_title(query: str):
+async def search_by_title(query: str):
     """
     Search books by title using Rakuten Books and Google Books APIs
     """
     results = []
     seen_isbns = set()
 
-    # Rakuten Books API
+    # Query Rakuten Books and Google Books at the same time
     rakuten_app_id = os.getenv("RAKUTEN_APP_ID")
-    if rakuten_app_id:
+    rakuten_search = http_client.rakuten_get(
+        {"applicationId": rakuten_app_id, "title": query, "hits": 20}
+    ) if rakuten_app_id else asyncio.sleep(0)
+    google_search = http_client.google_get({"q": query, "maxResults": 20})
+    rakuten_response, google_response = await asyncio.gather(rakuten_search, google_search, return_exceptions=True)
+    # One provider failing doesn't fail the search: its results are just missing
+    if isinstance(rakuten_response, Exception):
+        print(f"Rakuten API error: {rakuten_response}")
+        rakuten_response = None
+    if isinstance(google_response, Exception):
+        print(f"Google Books API error: {google_response}")
+        google_response = None
+
+    # Rakuten Books API
+    if rakuten_response:
         try:
-            rakuten_url = "https://app.rakuten.co.jp/services/api/BooksBook/Search/20170404"
-            params = {"applicationId": rakuten_app_id, "title": query, "hits": 20}
-            response = requests.get(rakuten_url, params=params, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                for item in data.get("Items", []):
-                    book = item.get("Item", {})
-                    isbn = book.get("isbn")
-                    if isbn and isbn not in seen_isbns:
-                        seen_isbns.add(isbn)
-                        results.append({
-                            "isbn": isbn,
-                            "title": book.get("title", ""),
-                            "authors": book.get("author", ""),
-                            "publisher": book.get("publisherName", ""),
-                            "cover_url": book.get("largeImageUrl", ""),
-                            "description": book.get("itemCaption", "")
-                        })
+            for item in rakuten_response.get("Items", []):
+                book = item.get("Item", {})
+                isbn = book.get("isbn")
+                if isbn and isbn not in seen_isbns:
+                    seen_isbns.add(isbn)
+                    results.append({
+                        "isbn": isbn,
+                        "title": book.get("title", ""),
+                        "authors": book.get("author", ""),
+                        "publisher": book.get("publisherName", ""),
+                        "cover_url": book.get("largeImageUrl", ""),
+                        "description": book.get("itemCaption", "")
+                    })
         except Exception as e:
             print(f"Rakuten API error: {e}")
 
     # Google Books API
-    try:
-        google_url = "https://www.googleapis.com/books/v1/volumes"
-        params = {"q": query, "maxResults": 20}
-        response = requests.get(google_url, params=params, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            for item in data.get("items", []):
+    if google_response:
+        try:
+            for item in google_response.get("items", []):
                 volume_info = item.get("volumeInfo", {})
                 identifiers = volume_info.get("industryIdentifiers", [])
                 isbn = None
@@ -414,36 +818,61 @@ def search_by_title(query: str):
                         "cover_url": volume_info.get("imageLinks", {}).get("thumbnail", ""),
                         "description": volume_info.get("description", "")
                     })
-    except Exception as e:
-        print(f"Google Books API error: {e}")
+        except Exception as e:
+            print(f"Google Books API error: {e}")
 
     return results[:30]
 
+@app.post("/import")
+async def import_library(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson|booklog|bookmeter)$"),
+    on_duplicate: str = Query("skip", pattern="^(skip|update)$"),
+):
+    """
+    Bulk import from the request body: our CSV/NDJSON export, or a Booklog / Bookmeter CSV export.
+    Rows are inserted in batches; the response streams NDJSON progress lines and ends with a
+    {"type": "done", ...} report. Books without a title are queued for background enrichment.
+    """
+    upload = await transfer.receive_upload(request.stream())
+    return StreamingResponse(
+        transfer.import_books(upload, format, on_duplicate),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+@app.get("/export")
+def export_library(format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    """
+    Stream the whole library as CSV or NDJSON (re-importable through POST /import).
+    """
+    media_types = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+    filename = f"library-{datetime.now().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        transfer.export_books(format),
+        media_type=media_types[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @app.get("/books/find-series")
-def find_series(isbn: str, title: str, db: Session = Depends(get_db)):
+async def find_series(isbn: str, title: str, db: Session = Depends(get_read_db)):
     """
     Find books in the same series by searching Rakuten API
     """
     # Extract series name by removing volume numbers
-    import re
     series_base = re.sub(r'\s*[\(（]?\d+[\)）]?\s*$', '', title)
     series_base = re.sub(r'\s*第?\d+[巻話集号]?\s*$', '', series_base)
     series_base = re.sub(r'\s*vol\.?\s*\d+.*$', '', series_base, flags=re.IGNORECASE)
 
-    # Get owned ISBNs
-    owned_isbns = {book.isbn for book in db.query(Book).all()}
-
     results = []
     rakuten_app_id = os.getenv("RAKUTEN_APP_ID")
 
     if rakuten_app_id:
         try:
             # Search for series books
-            rakuten_url = "https://app.rakuten.co.jp/services/api/BooksBook/Search/20170404"
             params = {"applicationId": rakuten_app_id, "title": series_base, "hits": 50}
-            response = requests.get(rakuten_url, params=params, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
+            data = await http_client.rakuten_get(params)
+            if data:
                 for item in data.get("Items", []):
                     book = item.get("Item", {})
                     book_isbn = book.get("isbn")
@@ -465,12 +894,25 @@ def find_series(isbn: str, title: str, db: Session = Depends(get_db)):
                             "authors": book.get("author", ""),
                             "cover_url": book.get("largeImageUrl", ""),
                             "volume": volume,
-                            "already_owned": book_isbn in owned_isbns
                         })
         except Exception as e:
             print(f"Rakuten API error: {e}")
 
+    # Which of the found books are owned: an indexed lookup of just those ISBNs, on a worker thread
+    candidates = [book["isbn"] for book in results]
+    owned_isbns = await asyncio.to_thread(
+        lambda: {row[0] for row in db.query(Book.isbn).filter(Book.isbn.in_(candidates)).all()} if candidates else set()
+    )
+    for book in results:
+        book["already_owned"] = book["isbn"] in owned_isbns
+
     # Sort by volume number
     results.sort(key=lambda x: x["volume"])
 
     return {"books": results}
+
+# Request profiling hooks itself into every route, so it is installed last (only when enabled)
+if profiling.PROFILING_ENABLED:
+    profiling.install(app, engine)
+    if read_engine is not engine:
+        profiling.install_engine(read_engine)
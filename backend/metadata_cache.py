@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent cache of raw provider responses (OpenBD, Rakuten, Google Books).
+# Lives in its own SQLite file so it survives book deletion and never touches the library DB.
+CACHE_PATH = os.getenv("METADATA_CACHE_PATH", "./db/metadata_cache.db")
+CACHE_ENABLED = os.getenv("METADATA_CACHE_ENABLED", "1") != "0"
+CACHE_MAX_BYTES = int(os.getenv("METADATA_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Time-to-live per provider (seconds)
+PROVIDER_TTLS = {
+    "openbd": 30 * 24 * 3600,
+    "rakuten": 7 * 24 * 3600,
+    "google": 30 * 24 * 3600,
+}
+DEFAULT_TTL = 7 * 24 * 3600
+
+# "Not found" answers expire sooner, since new releases show up in the APIs after a while
+NEGATIVE_TTL = int(os.getenv("METADATA_CACHE_NEGATIVE_TTL", str(12 * 3600)))
+
+# Sentinel returned by get() when nothing usable is cached
+MISS = object()
+
+_lock = threading.Lock()
+_conn = None
+_total_bytes = 0
+
+
+def _get_conn():
+    global _conn, _total_bytes
+    if _conn is None:
+        directory = os.path.dirname(CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA busy_timeout=5000")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS provider_cache (
+                provider TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (provider, key)
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS ix_provider_cache_last_access ON provider_cache (last_access)")
+        _total_bytes = _conn.execute("SELECT COALESCE(SUM(size), 0) FROM provider_cache").fetchone()[0]
+    return _conn
+
+
+def get(provider: str, key: str):
+    """
+    Return the cached raw response for (provider, key).
+    Returns None for a cached "not found" answer and MISS if nothing valid is cached.
+    """
+    if not CACHE_ENABLED:
+        return MISS
+
+    now = time.time()
+    try:
+        with _lock:
+            conn = _get_conn()
+            row = conn.execute(
+                "SELECT payload, expires_at FROM provider_cache WHERE provider = ? AND key = ?",
+                (provider, key)
+            ).fetchone()
+            if row is None:
+                return MISS
+            payload, expires_at = row
+            if expires_at < now:
+                return MISS
+            conn.execute(
+                "UPDATE provider_cache SET last_access = ? WHERE provider = ? AND key = ?",
+                (now, provider, key)
+            )
+    except sqlite3.Error as e:
+        print(f"Metadata cache read error: {e}")
+        return MISS
+
+    return json.loads(payload) if payload is not None else None
+
+
+def put(provider: str, key: str, payload):
+    """
+    Store a raw provider response. Pass None to record a "not found" answer.
+    """
+    global _total_bytes
+    if not CACHE_ENABLED:
+        return
+
+    now = time.time()
+    if payload is None:
+        encoded = None
+        ttl = NEGATIVE_TTL
+    else:
+        encoded = json.dumps(payload, ensure_ascii=False)
+        ttl = PROVIDER_TTLS.get(provider, DEFAULT_TTL)
+    size = len(encoded.encode("utf-8")) if encoded is not None else 0
+    # Count the row overhead so negative entries are still bounded
+    size += len(provider) + len(key) + 32
+
+    try:
+        with _lock:
+            conn = _get_conn()
+            old = conn.execute(
+                "SELECT size FROM provider_cache WHERE provider = ? AND key = ?",
+                (provider, key)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO provider_cache (provider, key, payload, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, key, encoded, size, now + ttl, now)
+            )
+            _total_bytes += size - (old[0] if old else 0)
+            if _total_bytes > CACHE_MAX_BYTES:
+                _evict(conn, now)
+    except sqlite3.Error as e:
+        print(f"Metadata cache write error: {e}")
+
+
+def _evict(conn, now: float):
+    """
+    Drop expired rows, then least recently used rows until the cache is back under 90% of its budget.
+    Must be called with _lock held.
+    """
+    global _total_bytes
+    conn.execute("DELETE FROM provider_cache WHERE expires_at < ?", (now,))
+    # Other workers share the file, so re-read the real total instead of trusting the local counter
+    _total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM provider_cache").fetchone()[0]
+
+    target = int(CACHE_MAX_BYTES * 0.9)
+    while _total_bytes > target:
+        rows = conn.execute(
+            "SELECT rowid, size FROM provider_cache ORDER BY last_access LIMIT 100"
+        ).fetchall()
+        if not rows:
+            break
+        freed = 0
+        victims = []
+        for rowid, size in rows:
+            victims.append((rowid,))
+            freed += size
+            if _total_bytes - freed <= target:
+                break
+        conn.executemany("DELETE FROM provider_cache WHERE rowid = ?", victims)
+        _total_bytes -= freed
+
+
+def invalidate(provider: str = None, key: str = None):
+    """
+    Remove cached entries. With no arguments the whole cache is cleared.
+    """
+    global _total_bytes
+    clauses = []
+    params = []
+    if provider:
+        clauses.append("provider = ?")
+        params.append(provider)
+    if key:
+        clauses.append("key = ?")
+        params.append(key)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    try:
+        with _lock:
+            conn = _get_conn()
+            conn.execute(f"DELETE FROM provider_cache{where}", params)
+            _total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM provider_cache").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Metadata cache invalidate error: {e}")
+
+
+def stats() -> dict:
+    """
+    Summary of cache contents per provider.
+    """
+    with _lock:
+        conn = _get_conn()
+        rows = conn.execute("""
+            SELECT provider, COUNT(*), SUM(payload IS NULL), COALESCE(SUM(size), 0)
+            FROM provider_cache GROUP BY provider
+        """).fetchall()
+    return {
+        "max_bytes": CACHE_MAX_BYTES,
+        "total_bytes": sum(r[3] for r in rows),
+        "providers": {
+            provider: {"entries": count, "negative": negative or 0, "bytes": size}
+            for provider, count, negative, size in rows
+        },
+    }
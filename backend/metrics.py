@@ -0,0 +1,280 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Process-local metrics in the Prometheus text format (GET /metrics) and opt-in request traces.
+# Counters and histograms are plain dicts behind one lock, like the other in-process stats
+# (provider_client, singleflight); each worker process exposes its own.
+#
+# A request sent with the X-Debug-Trace header gets the spans recorded while serving it (provider
+# requests, rate-limit waits, backoffs, merge steps, DB totals) back in the X-Trace (JSON) and
+# Server-Timing response headers. Without the header, span() costs one context variable lookup.
+TRACE_ENABLED = os.getenv("DEBUG_TRACE_ENABLED", "1") != "0"
+TRACE_HEADER = "X-Debug-Trace"
+TRACE_MAX_SPANS = int(os.getenv("DEBUG_TRACE_MAX_SPANS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# name -> (type, help, label names, buckets)
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram", "Time to respond, per route template", ("method", "route", "status"), LATENCY_BUCKETS),
+    "http_request_db_queries": (
+        "histogram", "Database queries run while serving one request", ("route",), QUERY_COUNT_BUCKETS),
+    "db_query_duration_seconds": (
+        "histogram", "Database query execution time, per statement type", ("operation",), DB_BUCKETS),
+    "provider_request_duration_seconds": (
+        "histogram", "Time of one HTTP attempt to a metadata provider", ("provider", "status"), LATENCY_BUCKETS),
+    "provider_events_total": (
+        "counter", "Provider calls by outcome (success, rate_limited, server_error, timeout, retries, skipped_...)",
+        ("provider", "event"), None),
+    "lookup_duration_seconds": (
+        "histogram", "Full metadata lookup of one ISBN (all providers and the merge)", ("mode",), LATENCY_BUCKETS),
+    "lookup_field_source_total": (
+        "counter", "Fields of merged lookups, by the provider that filled them", ("field", "provider"), None),
+}
+
+# Book fields whose provenance is counted in the merge
+SOURCE_FIELDS = ("title", "authors", "publisher", "published_date", "cover_url", "description", "series_title")
+
+SQL_OPERATIONS = {"select", "insert", "update", "delete", "with", "pragma"}
+
+_lock = threading.Lock()
+_values = {}
+
+# Per-request state ({"queries", "db_seconds", "spans", "started"}), set by the HTTP middleware
+_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    key = (name, tuple(labels[label] for label in METRICS[name][2]))
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels):
+    buckets = METRICS[name][3]
+    key = (name, tuple(labels[label] for label in METRICS[name][2]))
+    with _lock:
+        state = _values.get(key)
+        if state is None:
+            # Per-bucket counts (not cumulative), then sum and count
+            state = _values[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _le(bound) -> str:
+    return f'le="{bound}"'
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _lock:
+        values = {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, label_values), value in sorted(values.items(), key=lambda item: item[0]):
+            if metric != name:
+                continue
+            if kind == "counter":
+                lines.append(f"{name}{_labels(label_names, label_values)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(label_names, label_values, _le(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(label_names, label_values, _le('+Inf'))} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(label_names, label_values)} {value[-2]}")
+            lines.append(f"{name}_count{_labels(label_names, label_values)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _values.clear()
+
+
+# --- Requests and traces ---
+
+def begin_request(trace: bool = False):
+    """
+    Start collecting for the current request (called by the HTTP middleware). Returns a token for end_request().
+    """
+    state = {"started": time.perf_counter(), "queries": 0, "db_seconds": 0.0, "spans": [] if trace else None}
+    return _request.set(state)
+
+
+def end_request(token, method: str, route: str, status: int) -> dict:
+    """
+    Record the request's latency and query count; returns the trace headers to add (empty without a trace).
+    """
+    state = _request.get()
+    _request.reset(token)
+    elapsed = time.perf_counter() - state["started"]
+    observe("http_request_duration_seconds", elapsed, method=method, route=route, status=str(status))
+    observe("http_request_db_queries", state["queries"], route=route)
+    if state["spans"] is None:
+        return {}
+
+    spans = state["spans"]
+    timing = [f'total;dur={elapsed * 1000:.1f}', f'db;dur={state["db_seconds"] * 1000:.1f};desc="{state["queries"]} queries"']
+    totals = {}
+    for span in spans:
+        totals[span["name"]] = totals.get(span["name"], 0) + span["duration_ms"]
+    timing += [f"{name.replace('.', '-')};dur={duration:.1f}" for name, duration in totals.items()]
+    trace = {
+        "route": route,
+        "duration_ms": round(elapsed * 1000, 2),
+        "db": {"queries": state["queries"], "duration_ms": round(state["db_seconds"] * 1000, 2)},
+        "spans": spans,
+    }
+    return {"Server-Timing": ", ".join(timing), "X-Trace": json.dumps(trace, ensure_ascii=True, separators=(",", ":"))}
+
+
+def tracing() -> bool:
+    state = _request.get()
+    return state is not None and state["spans"] is not None
+
+
+def record_span(name: str, started: float, **attributes):
+    """
+    Add a span that began at started (time.perf_counter()) and ends now to the current request's trace.
+    """
+    state = _request.get()
+    if state is None or state["spans"] is None or len(state["spans"]) >= TRACE_MAX_SPANS:
+        return
+    state["spans"].append({
+        "name": name,
+        "start_ms": round((started - state["started"]) * 1000, 2),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        **attributes,
+    })
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a span in the current request's trace (no-op when the request isn't traced).
+    Yields a dict the caller can add attributes to.
+    """
+    if not tracing():
+        yield attributes
+        return
+    started = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        record_span(name, started, **attributes)
+
+
+def traced(name: str):
+    """
+    Decorator form of span() for sync and async functions.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def in_context(fn):
+    """
+    fn bound to the current context, for work handed to a thread pool (keeps the request's trace).
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+# --- Lookup pipeline ---
+
+def record_sources(provider: str, before: dict, after: dict):
+    """
+    Count the fields a merge step filled or changed, with the provider that supplied them.
+    """
+    if not after:
+        return
+    for field in SOURCE_FIELDS:
+        value = after.get(field)
+        if value and value != before.get(field):
+            inc("lookup_field_source_total", field=field, provider=provider)
+
+
+def records_sources(provider: str):
+    """
+    Decorator for merge steps merge(book_data, provider_data) -> book_data (which may change book_data in place).
+    """
+    def decorator(merge):
+        @functools.wraps(merge)
+        def wrapper(book_data, *args, **kwargs):
+            before = dict(book_data) if book_data else {}
+            merged = merge(book_data, *args, **kwargs)
+            record_sources(provider, before, merged)
+            return merged
+        return wrapper
+    return decorator
+
+
+# --- Database ---
+
+def instrument_engine(engine):
+    """
+    Time every statement the engine runs (db_query_duration_seconds) and count it for the current request.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        observe("db_query_duration_seconds", elapsed, operation=operation if operation in SQL_OPERATIONS else "other")
+        state = _request.get()
+        if state is not None:
+            state["queries"] += 1
+            state["db_seconds"] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if started:
+            started.pop()
@@ -1,6 +1,8 @@
-import sqlite3
 import re
-import os
+from sqlalchemy import func, select
+from database import SessionLocal, Book, engine, schema_lock
+from bookshelf import OTHER, rebuild_series
+import migrations
 
 def extract_volume_number(title):
     """タイトルから巻数を抽出"""
@@ -24,72 +26,47 @@ def extract_volume_number(title):
 
     return None
 
-db_path = os.getenv("DATABASE_PATH", "./db/library.db")
-print(f"Connecting to database at {db_path}...")
+print(f"Connecting to database at {engine.url.render_as_string(hide_password=True)}...")
 
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
+# volume_number / is_series_representative カラムを追加（不足分はモデルから）
+with schema_lock():
+    for step in migrations.migrate():
+        print(f"✅ {step}")
 
-# 既存のカラムを確認
-cursor.execute("PRAGMA table_info(books)")
-columns = [column[1] for column in cursor.fetchall()]
-print(f"Existing columns: {columns}")
-
-# volume_numberカラムを追加
-if 'volume_number' not in columns:
-    print("Adding 'volume_number' column...")
-    cursor.execute("ALTER TABLE books ADD COLUMN volume_number INTEGER")
-    conn.commit()
-    print("✅ Added 'volume_number' column.")
-else:
-    print("'volume_number' column already exists.")
-
-# is_series_representativeカラムを追加
-if 'is_series_representative' not in columns:
-    print("Adding 'is_series_representative' column...")
-    cursor.execute("ALTER TABLE books ADD COLUMN is_series_representative BOOLEAN DEFAULT 0")
-    conn.commit()
-    print("✅ Added 'is_series_representative' column.")
-else:
-    print("'is_series_representative' column already exists.")
+db = SessionLocal()
 
 # 既存の本のvolume_numberを自動設定
 print("\nExtracting volume numbers from titles...")
-cursor.execute("SELECT isbn, title FROM books")
-books = cursor.fetchall()
-
 updated_count = 0
-for isbn, title in books:
+for isbn, title in db.query(Book.isbn, Book.title).all():
     volume = extract_volume_number(title)
     if volume is not None:
-        cursor.execute("UPDATE books SET volume_number = ? WHERE isbn = ?", (volume, isbn))
+        db.query(Book).filter(Book.isbn == isbn).update({"volume_number": volume}, synchronize_session=False)
         updated_count += 1
         print(f"  {title} → Vol.{volume}")
 
-conn.commit()
+db.commit()
 print(f"\n✅ Updated {updated_count} books with volume numbers.")
 
 # シリーズごとに代表を設定（最小巻数の本）
+# 1回のUPDATEでまとめて設定する
 print("\nSetting series representatives...")
-cursor.execute("""
-    SELECT series_title, MIN(volume_number), isbn
-    FROM books
-    WHERE series_title IS NOT NULL AND series_title != 'Other' AND volume_number IS NOT NULL
-    GROUP BY series_title
-""")
-representatives = cursor.fetchall()
-
-for series_title, min_vol, isbn in representatives:
-    cursor.execute("""
-        UPDATE books
-        SET is_series_representative = 1
-        WHERE series_title = ? AND volume_number = ?
-        LIMIT 1
-    """, (series_title, min_vol))
-    print(f"  {series_title}: Vol.{min_vol} → Representative")
-
-conn.commit()
-print(f"\n✅ Set {len(representatives)} series representatives.")
-
-conn.close()
+ranked = (
+    select(
+        Book.isbn,
+        func.row_number().over(partition_by=Book.series_title, order_by=(Book.volume_number, Book.isbn)).label("rank"),
+    )
+    .where(Book.series_title.isnot(None), Book.series_title != OTHER, Book.volume_number.isnot(None))
+    .subquery()
+)
+representative_count = db.query(Book).filter(
+    Book.isbn.in_(select(ranked.c.isbn).where(ranked.c.rank == 1))
+).update({"is_series_representative": True}, synchronize_session=False)
+
+# 代表が変わったのでシリーズ集計を作り直す
+rebuild_series(db)
+
+db.commit()
+db.close()
+print(f"\n✅ Set {representative_count} series representatives.")
 print("\n🎉 Migration completed successfully!")
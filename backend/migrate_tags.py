@@ -0,0 +1,30 @@
+from database import SessionLocal, Book, Tag, BookTag, engine, schema_lock
+import migrations
+from tags import add_book_tags
+
+def migrate_db():
+    print(f"Connecting to database at {engine.url.render_as_string(hide_password=True)}...")
+
+    # Create normalized tag tables (and anything else missing)
+    with schema_lock():
+        migrations.migrate()
+    print("✅ Ensured 'tags' and 'book_tags' tables.")
+
+    db = SessionLocal()
+    try:
+        # Rebuild links from the comma-separated books.tags column
+        db.query(BookTag).delete(synchronize_session=False)
+        db.query(Tag).delete(synchronize_session=False)
+
+        rows = db.query(Book.isbn, Book.tags).filter(Book.tags.isnot(None), Book.tags != "").all()
+        add_book_tags(db, dict(rows))
+        db.commit()
+        tag_count = db.query(Tag).count()
+        link_count = db.query(BookTag).count()
+        print(f"✅ Migrated {tag_count} tags ({link_count} book links) from {len(rows)} books.")
+        print("\n🎉 Migration completed successfully!")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate_db()
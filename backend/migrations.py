@@ -0,0 +1,95 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from database import Base, engine, schema_lock, SessionLocal, Book
+from bookshelf import refresh_series
+import stats
+from title_parser import PLACEHOLDER_TITLE
+
+# Schema upgrades for existing databases, on SQLite and PostgreSQL alike.
+# create_all() only creates missing tables; columns and indexes added to the models since a
+# database was created are added here, by comparing the models with what the database reports.
+# Every step checks first, so running it again (every app start does) changes nothing.
+
+# Data fixes for columns added after books already existed
+BACKFILLS = [
+    # Existing rows count as last changed when they were created
+    "UPDATE books SET updated_at = created_at WHERE updated_at IS NULL",
+]
+
+
+def _add_column_sql(conn, table, column) -> str:
+    preparer = conn.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=conn.dialect)
+    # Added as nullable: existing rows have no value (NOT NULL would need a default for them)
+    return f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(column.name)} {column_type}"
+
+
+def migrate(bind=None) -> list:
+    """
+    Create missing tables, columns and indexes, then run the backfills. Returns what was done.
+    """
+    bind = bind or engine
+    done = []
+    # One connection for everything: the SQLite writer pool has a single one
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(conn)
+                done.append(f"created table {table.name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    conn.execute(text(_add_column_sql(conn, table, column)))
+                    done.append(f"added column {table.name}.{column.name}")
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    done.append(f"created index {index.name}")
+
+        for statement in BACKFILLS:
+            result = conn.execute(text(statement))
+            if result.rowcount:
+                done.append(f"backfilled {result.rowcount} rows: {statement}")
+    return done
+
+
+def clear_placeholder_series(db) -> int:
+    """
+    One-time data fix (run by this script, not at app start): books registered before placeholder titles
+    stopped getting a series still have PLACEHOLDER_TITLE as their series. Cleared like an edit, so
+    updated_at, the stats counters and the series table follow. Returns the number of books changed.
+    """
+    books = db.query(Book).filter(
+        Book.title == PLACEHOLDER_TITLE, Book.series_title == PLACEHOLDER_TITLE
+    ).all()
+    if not books:
+        return 0
+    before = [stats.snapshot(book) for book in books]
+    now = datetime.now()
+    for book in books:
+        book.series_title = None
+        book.updated_at = now
+    refresh_series(db, [PLACEHOLDER_TITLE, None])
+    stats.record(db, before=before, after=books)
+    return len(books)
+
+
+if __name__ == "__main__":
+    print(f"Migrating {engine.url.render_as_string(hide_password=True)}...")
+    with schema_lock():
+        steps = migrate()
+        db = SessionLocal()
+        try:
+            cleared = clear_placeholder_series(db)
+            db.commit()
+        finally:
+            db.close()
+        if cleared:
+            steps.append(f"cleared the placeholder series of {cleared} books")
+    for step in steps:
+        print(f"✅ {step}")
+    print("\n🎉 Migration completed successfully!" if steps else "⏭️  Schema already up to date.")
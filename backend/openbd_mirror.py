@@ -0,0 +1,335 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+import metrics
+import provider_client
+
+# Local copy of OpenBD bibliographic data, so most ISBN scans resolve without a network round-trip.
+# Records are stored trimmed to the fields parse_openbd_response() reads (summary + description),
+# keyed by ISBN in a WITHOUT ROWID table: a lookup is one B-tree probe.
+# ISBNs OpenBD lists in its coverage but answers null for are remembered in openbd_missing,
+# so a refresh doesn't ask for them again until they are older than --stale-days.
+#
+#   python openbd_mirror.py import dump.ndjson.gz   # load a bulk dump (JSON array or NDJSON, optionally gzipped)
+#   python openbd_mirror.py refresh                 # fetch ISBNs added to OpenBD's coverage since the last run
+#   python openbd_mirror.py refresh --stale-days 30 # also re-fetch records older than 30 days
+#   python openbd_mirror.py stats
+MIRROR_PATH = os.getenv("OPENBD_MIRROR_PATH", "./db/openbd_mirror.db")
+MIRROR_ENABLED = os.getenv("OPENBD_MIRROR_ENABLED", "1") != "0"
+
+# "1": a book found in the mirror is final, Rakuten/Google are not asked to fill gaps (no network at all)
+MIRROR_ONLY = os.getenv("OPENBD_MIRROR_ONLY", "0") == "1"
+
+# The lookups (utils.OPENBD_API_URL) and the refresh use the same endpoint setting
+OPENBD_API_URL = os.getenv("OPENBD_API_URL", "https://api.openbd.jp/v1/get")
+OPENBD_COVERAGE_URL = os.getenv("OPENBD_COVERAGE_URL", OPENBD_API_URL.rsplit("/", 1)[0] + "/coverage")
+
+# ISBNs per /v1/get request during refresh, and rows per transaction during import
+REFRESH_BATCH = int(os.getenv("OPENBD_MIRROR_REFRESH_BATCH", "500"))
+IMPORT_BATCH = 5000
+
+# Summary fields kept from each record
+SUMMARY_FIELDS = ("isbn", "title", "volume", "series", "publisher", "pubdate", "cover", "author")
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(MIRROR_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(MIRROR_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA busy_timeout=5000")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS openbd_records (
+                isbn TEXT PRIMARY KEY,
+                record TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS ix_openbd_records_updated_at ON openbd_records (updated_at)")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS openbd_missing (
+                isbn TEXT PRIMARY KEY,
+                checked_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        _conn.execute("CREATE TABLE IF NOT EXISTS mirror_meta (key TEXT PRIMARY KEY, value TEXT)")
+    return _conn
+
+
+@metrics.traced("mirror")
+def lookup(isbn: str):
+    """
+    Return the record for an ISBN in the shape of an OpenBD /v1/get response ([record]),
+    or None when the mirror doesn't have it (or is disabled / not imported).
+    """
+    if not MIRROR_ENABLED or (_conn is None and not os.path.exists(MIRROR_PATH)):
+        return None
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT record FROM openbd_records WHERE isbn = ?", (isbn,)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"OpenBD mirror read error: {e}")
+        return None
+    return [json.loads(row[0])] if row else None
+
+
+def compact_record(record: dict):
+    """
+    Trim a full OpenBD record (summary, ONIX, hanmoto) to what we read from it.
+    Returns (isbn, record) or None for an empty entry.
+    """
+    if not record or not record.get("summary"):
+        return None
+    summary = record["summary"]
+    isbn = summary.get("isbn")
+    if not isbn:
+        return None
+
+    compact = {"summary": {field: summary[field] for field in SUMMARY_FIELDS if summary.get(field)}}
+    text_content = record.get("onix", {}).get("CollateralDetail", {}).get("TextContent") or []
+    if text_content and text_content[0].get("Text"):
+        compact["onix"] = {"CollateralDetail": {"TextContent": [{"Text": text_content[0]["Text"]}]}}
+    return isbn, compact
+
+
+def _iter_json_array(f, chunk_size: int = 1 << 20):
+    """
+    Yield the elements of a (possibly huge) top-level JSON array without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    pos = buffer.index("[") + 1
+    while True:
+        # Skip separators; refill when the buffer runs out
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer):
+                break
+            buffer, pos = f.read(chunk_size), 0
+            if not buffer:
+                raise ValueError("Unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield element
+        pos = end
+
+
+def iter_dump(path: str):
+    """
+    Yield raw OpenBD records from a dump file: a JSON array of records (a saved /v1/get response)
+    or NDJSON with one record (or one /v1/get response) per line. .gz files are decompressed on the fly.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        # NDJSON when the first line is a complete JSON value, otherwise one (multi-line or huge) array
+        first_line = f.readline(1 << 20)
+        if not first_line:
+            return
+        try:
+            json.loads(first_line)
+            ndjson = True
+        except ValueError:
+            ndjson = False
+        f.seek(0)
+        if ndjson:
+            elements = (json.loads(line) for line in f if line.strip())
+        else:
+            elements = _iter_json_array(f)
+        for element in elements:
+            for record in (element if isinstance(element, list) else [element]):
+                yield record
+
+
+def _upsert(conn, rows: list) -> int:
+    """
+    Insert or update records; unchanged records are left alone. Returns the number of rows written.
+    """
+    before = conn.total_changes
+    conn.executemany("""
+        INSERT INTO openbd_records (isbn, record, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(isbn) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at
+        WHERE openbd_records.record != excluded.record
+    """, rows)
+    return conn.total_changes - before
+
+
+def _set_meta(conn, key: str, value):
+    conn.execute("INSERT OR REPLACE INTO mirror_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def import_dump(path: str) -> dict:
+    """
+    Load a bulk dump into the mirror. Safe to run again with a newer dump: only changed records are rewritten.
+    """
+    seen = written = 0
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        rows = []
+
+        def flush():
+            nonlocal written
+            conn.execute("BEGIN")
+            written += _upsert(conn, rows)
+            conn.execute("COMMIT")
+            rows.clear()
+
+        for record in iter_dump(path):
+            compact = compact_record(record)
+            if compact is None:
+                continue
+            isbn, data = compact
+            rows.append((isbn, json.dumps(data, ensure_ascii=False, separators=(",", ":")), now))
+            seen += 1
+            if len(rows) >= IMPORT_BATCH:
+                flush()
+                print(f"Imported {seen} records...")
+        if rows:
+            flush()
+        _set_meta(conn, "last_import", now)
+        _set_meta(conn, "last_import_source", os.path.basename(path))
+
+    return {"records": seen, "written": written}
+
+
+def _fetch_records(isbns: list) -> int:
+    """
+    Fetch records from /v1/get (one request per REFRESH_BATCH ISBNs) and store them.
+    ISBNs answered with null are stored as missing, with the time they were checked. Returns rows written.
+    """
+    written = 0
+    for start in range(0, len(isbns), REFRESH_BATCH):
+        batch = isbns[start:start + REFRESH_BATCH]
+        data = provider_client.get_json("openbd", OPENBD_API_URL, {"isbn": ",".join(batch)}, timeout=60)
+        if data is None:
+            print(f"OpenBD refresh: batch at {start} failed, stopping (run refresh again to resume)")
+            break
+        now = time.time()
+        rows = []
+        # The response has one entry per requested ISBN, in order
+        missing = [(isbn, now) for isbn, record in zip(batch, data) if not record]
+        for record in data:
+            compact = compact_record(record)
+            if compact is not None:
+                isbn, record_data = compact
+                rows.append((isbn, json.dumps(record_data, ensure_ascii=False, separators=(",", ":")), now))
+        with _lock:
+            conn = _get_conn()
+            conn.execute("BEGIN")
+            written += _upsert(conn, rows)
+            # Unchanged records count as checked now
+            conn.executemany("UPDATE openbd_records SET updated_at = ? WHERE isbn = ?", [(now, row[0]) for row in rows])
+            conn.executemany("DELETE FROM openbd_missing WHERE isbn = ?", [(row[0],) for row in rows])
+            conn.executemany("INSERT OR REPLACE INTO openbd_missing (isbn, checked_at) VALUES (?, ?)", missing)
+            conn.execute("COMMIT")
+        print(f"OpenBD refresh: {min(start + REFRESH_BATCH, len(isbns))}/{len(isbns)} ISBNs")
+    return written
+
+
+def refresh(stale_days: float = None, prune: bool = False) -> dict:
+    """
+    Incremental refresh against OpenBD's coverage list: fetch ISBNs the mirror doesn't have yet
+    (except those OpenBD answered null for), optionally re-fetch records and null answers older than
+    stale_days and drop ISBNs OpenBD no longer covers.
+    Progress is committed per batch, so an interrupted refresh continues where it stopped.
+    """
+    coverage = provider_client.get_json("openbd", OPENBD_COVERAGE_URL, timeout=120)
+    if coverage is None:
+        raise RuntimeError("Could not fetch the OpenBD coverage list")
+
+    with _lock:
+        conn = _get_conn()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS coverage (isbn TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM coverage")
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR IGNORE INTO coverage (isbn) VALUES (?)", ((isbn,) for isbn in coverage))
+        conn.execute("COMMIT")
+        missing = [row[0] for row in conn.execute("""
+            SELECT isbn FROM coverage
+            WHERE isbn NOT IN (SELECT isbn FROM openbd_records) AND isbn NOT IN (SELECT isbn FROM openbd_missing)
+        """)]
+        stale = []
+        if stale_days is not None:
+            cutoff = time.time() - stale_days * 86400
+            stale = [row[0] for row in conn.execute("""
+                SELECT isbn FROM openbd_records WHERE updated_at < ? AND isbn IN (SELECT isbn FROM coverage)
+                UNION
+                SELECT isbn FROM openbd_missing WHERE checked_at < ? AND isbn IN (SELECT isbn FROM coverage)
+            """, (cutoff, cutoff))]
+        pruned = 0
+        if prune:
+            pruned = conn.execute(
+                "DELETE FROM openbd_records WHERE isbn NOT IN (SELECT isbn FROM coverage)"
+            ).rowcount
+            conn.execute("DELETE FROM openbd_missing WHERE isbn NOT IN (SELECT isbn FROM coverage)")
+        conn.execute("DROP TABLE coverage")
+
+    written = _fetch_records(missing + stale)
+
+    with _lock:
+        _set_meta(_get_conn(), "last_refresh", time.time())
+
+    return {"coverage": len(coverage), "missing": len(missing), "stale": len(stale), "written": written, "pruned": pruned}
+
+
+def stats() -> dict:
+    if not os.path.exists(MIRROR_PATH):
+        return {"enabled": MIRROR_ENABLED, "records": 0}
+    with _lock:
+        conn = _get_conn()
+        records = conn.execute("SELECT COUNT(*) FROM openbd_records").fetchone()[0]
+        missing = conn.execute("SELECT COUNT(*) FROM openbd_missing").fetchone()[0]
+        meta = dict(conn.execute("SELECT key, value FROM mirror_meta").fetchall())
+    return {
+        "enabled": MIRROR_ENABLED,
+        "mirror_only": MIRROR_ONLY,
+        "records": records,
+        "missing": missing,
+        "bytes": os.path.getsize(MIRROR_PATH),
+        **meta,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local OpenBD mirror")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Load a bulk dump (JSON array or NDJSON, .gz ok)")
+    import_parser.add_argument("path")
+    refresh_parser = commands.add_parser("refresh", help="Fetch ISBNs added to OpenBD since the last run")
+    refresh_parser.add_argument("--stale-days", type=float, help="Also re-fetch records older than this")
+    refresh_parser.add_argument("--prune", action="store_true", help="Drop ISBNs OpenBD no longer covers")
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        result = import_dump(args.path)
+    elif args.command == "refresh":
+        result = refresh(args.stale_days, args.prune)
+    else:
+        result = stats()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+# On-demand request profiling. Off unless PROFILING_ENABLED=1: then nothing is installed at all
+# (no middleware, no SQL hooks, no endpoint wrappers), so a disabled profiler costs nothing.
+#
+# When enabled, a request is profiled if it carries the X-Profile header (with PROFILING_TOKEN as its
+# value when a token is configured) or is picked by PROFILING_SAMPLE_RATE. The profile combines
+# cProfile data of the event loop thread (async code; the loop runs other requests meanwhile, they
+# show up too) and of the worker thread running a sync endpoint, plus every SQL statement the request
+# ran. Profiles are written to PROFILING_DIR (JSON summary + .prof for pstats/snakeviz), the oldest
+# beyond PROFILING_MAX_PROFILES are removed. One request per process is profiled at a time,
+# since a thread has only one profiler.
+# The stored profiles (SQL parameters included) are only served with PROFILING_TOKEN set,
+# to requests carrying it in the header; without a token the /admin/profiles routes refuse everyone.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_HEADER = os.getenv("PROFILING_HEADER", "X-Profile")
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN") or None
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "./db/profiles")
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "50"))
+
+# Functions listed in the JSON summary, and SQL statements kept per profile
+TOP_FUNCTIONS = 40
+MAX_STATEMENTS = 500
+MAX_STATEMENT_LENGTH = 2000
+
+# Ids sort by time: 20250101-120000-123456-ab12
+PROFILE_ID = re.compile(r"^\d{8}-\d{6}-\d{6}-[0-9a-f]{4}$")
+
+_session = contextvars.ContextVar("profiling_session", default=None)
+_active = threading.Lock()
+
+
+class ProfileSession:
+    """
+    What one profiled request collects: a cProfile per thread and the SQL statements.
+    """
+
+    def __init__(self, trigger: str):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}"
+        self.trigger = trigger
+        self.profilers = []
+        self.statements = []
+        self.dropped_statements = 0
+        self.lock = threading.Lock()
+
+    def profiler(self) -> cProfile.Profile:
+        profiler = cProfile.Profile()
+        with self.lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def add_statement(self, statement: str, parameters, executemany: bool, elapsed: float):
+        with self.lock:
+            if len(self.statements) >= MAX_STATEMENTS:
+                self.dropped_statements += 1
+                return
+            self.statements.append({
+                "statement": statement[:MAX_STATEMENT_LENGTH],
+                "parameters": f"{len(parameters)} rows" if executemany else repr(parameters)[:500],
+                "duration_ms": round(elapsed * 1000, 3),
+            })
+
+
+def _trigger(header_value: str):
+    """
+    Why this request gets profiled ("header", "sample") or None.
+    """
+    if header_value is not None and (PROFILING_TOKEN is None or header_value == PROFILING_TOKEN):
+        return "header"
+    if PROFILING_SAMPLE_RATE and random.random() < PROFILING_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def authorized(header_value: str) -> bool:
+    """
+    Access to the stored profiles: the header must carry PROFILING_TOKEN. Without a token nobody has access.
+    """
+    if PROFILING_TOKEN is None or header_value is None:
+        return False
+    return hmac.compare_digest(header_value.encode(), PROFILING_TOKEN.encode())
+
+
+# --- Collection ---
+
+def _in_worker_thread(fn):
+    """
+    Sync endpoint wrapper: profile the worker thread while it runs a profiled request.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = _session.get()
+        if session is None:
+            return fn(*args, **kwargs)
+        profiler = session.profiler()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+    return wrapper
+
+
+async def _profile_request(request, call_next):
+    trigger = _trigger(request.headers.get(PROFILING_HEADER))
+    if trigger is None or not _active.acquire(blocking=False):
+        return await call_next(request)
+
+    session = ProfileSession(trigger)
+    token = _session.set(session)
+    profiler = session.profiler()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        profiler.enable()
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            profiler.disable()
+            _session.reset(token)
+    finally:
+        _active.release()
+        duration = time.perf_counter() - started
+        await run_in_threadpool(save, session, {
+            "method": request.method,
+            "path": request.url.path,
+            "query": request.url.query,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+        })
+    response.headers["X-Profile-Id"] = session.id
+    return response
+
+
+def install_engine(engine):
+    """
+    Record the SQL statements a profiled request runs on this engine.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _session.get() is not None:
+            conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        session = _session.get()
+        started = conn.info.get("profiling_started")
+        if session is not None and started:
+            session.add_statement(statement, parameters, executemany, time.perf_counter() - started.pop())
+
+
+def install(app, engine):
+    """
+    Hook the profiler into the app and the engine. Call after all routes are defined.
+    """
+    install_engine(engine)
+
+    # Sync endpoints run in the threadpool, out of reach of the event loop thread's profiler
+    for route in app.router.routes:
+        if isinstance(route, APIRoute) and not inspect.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = _in_worker_thread(route.dependant.call)
+
+    app.middleware("http")(_profile_request)
+    print(f"Request profiling enabled (header {PROFILING_HEADER}, sample rate {PROFILING_SAMPLE_RATE}), "
+          f"profiles in {PROFILING_DIR}")
+
+
+# --- Store ---
+
+def _path(profile_id: str, extension: str) -> str:
+    return os.path.join(PROFILING_DIR, f"{profile_id}.{extension}")
+
+
+def save(session: ProfileSession, request_info: dict):
+    """
+    Write the profile (summary JSON and pstats dump) and drop the oldest beyond PROFILING_MAX_PROFILES.
+    """
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    stats = None
+    for profiler in session.profilers:
+        profiler.create_stats()
+        if not profiler.stats:
+            continue
+        if stats is None:
+            stats = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+
+    top = ""
+    if stats is not None:
+        stats.dump_stats(_path(session.id, "prof"))
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        top = output.getvalue()
+
+    summary = {
+        "id": session.id,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "trigger": session.trigger,
+        **request_info,
+        "threads": len(session.profilers),
+        "sql_count": len(session.statements) + session.dropped_statements,
+        "sql_ms": round(sum(statement["duration_ms"] for statement in session.statements), 3),
+        "sql": session.statements,
+        "top_functions": top,
+    }
+    with open(_path(session.id, "json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False)
+    _rotate()
+
+
+def _rotate():
+    profile_ids = sorted(name[:-5] for name in os.listdir(PROFILING_DIR) if name.endswith(".json"))
+    for profile_id in profile_ids[:-PROFILING_MAX_PROFILES or None]:
+        for extension in ("json", "prof"):
+            try:
+                os.remove(_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> list:
+    """
+    Stored profiles, newest first (without SQL statements and function listing).
+    """
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILING_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILING_DIR, name), encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summary.pop("sql", None)
+        summary.pop("top_functions", None)
+        summary["has_pstats"] = os.path.exists(_path(summary["id"], "prof"))
+        profiles.append(summary)
+    return profiles
+
+
+def get_profile(profile_id: str):
+    """
+    Full summary of one profile, or None.
+    """
+    if not PROFILE_ID.match(profile_id) or not os.path.exists(_path(profile_id, "json")):
+        return None
+    with open(_path(profile_id, "json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def pstats_path(profile_id: str):
+    if not PROFILE_ID.match(profile_id) or not os.path.exists(_path(profile_id, "prof")):
+        return None
+    return _path(profile_id, "prof")
@@ -0,0 +1,383 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import httpx
+import requests
+import metrics
+
+# Policy for every call to OpenBD, Rakuten Books and Google Books:
+# - a token bucket per provider matching its quota
+# - bounded retries on 429/5xx/connection errors with jittered exponential backoff (Retry-After wins)
+# - a hard timeout per attempt, capped by the caller's deadline
+# - a circuit breaker: after PROVIDER_FAILURE_THRESHOLD consecutive failures the provider is skipped
+#   for PROVIDER_COOLDOWN seconds, then a single trial request decides whether it is back
+# Bucket and breaker state live in a small SQLite file, so all threads and all worker processes
+# share one quota and one view of provider health. Each attempt costs one short transaction before
+# the request (breaker + token) and one after (outcome); the async path runs them on a worker thread,
+# never on the event loop. If the state file can't be used (e.g. locked by another process for longer
+# than the timeout), the request goes out without rate limiting or breaker, like an uncached lookup.
+STATE_PATH = os.getenv("PROVIDER_STATE_PATH", "./db/provider_state.db")
+
+# Requests per second and burst size per provider.
+# Rakuten allows 1 request/second per application ID. OpenBD and Google Books publish no hard
+# per-second limit, these just keep bursts polite.
+PROVIDER_LIMITS = {
+    "openbd": (float(os.getenv("OPENBD_RATE", "10")), float(os.getenv("OPENBD_BURST", "10"))),
+    "rakuten": (float(os.getenv("RAKUTEN_RATE", "1")), float(os.getenv("RAKUTEN_BURST", "1"))),
+    "google": (float(os.getenv("GOOGLE_BOOKS_RATE", "5")), float(os.getenv("GOOGLE_BOOKS_BURST", "5"))),
+}
+DEFAULT_TIMEOUT = float(os.getenv("PROVIDER_DEFAULT_TIMEOUT", "5"))
+
+# Longest a request waits for a rate-limit token when the caller has no deadline of its own
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+
+MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("PROVIDER_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("PROVIDER_BACKOFF_CAP", "8"))
+
+FAILURE_THRESHOLD = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "5"))
+COOLDOWN = float(os.getenv("PROVIDER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()  # Guards the state connection
+_stats_lock = threading.Lock()
+_conn = None
+_stats = {}
+
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(STATE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(STATE_PATH, check_same_thread=False, isolation_level=None, timeout=5)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last updates on power loss only resets a bucket or breaker: no fsync per commit
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS provider_state (
+                provider TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                refilled_at REAL NOT NULL,
+                failures INTEGER NOT NULL DEFAULT 0,
+                open_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+    return _conn
+
+
+def _transaction(fn):
+    """
+    Run fn(conn, row) on the provider's state row under an exclusive write lock (threads and processes).
+    Raises sqlite3.Error when the state database can't be used.
+    """
+    def run(provider: str, *args):
+        with _lock:
+            conn = _get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, refilled_at, failures, open_until FROM provider_state WHERE provider = ?",
+                    (provider,)
+                ).fetchone()
+                if row is None:
+                    _, burst = PROVIDER_LIMITS.get(provider, (1.0, 1.0))
+                    row = (burst, time.time(), 0, 0.0)
+                    conn.execute(
+                        "INSERT INTO provider_state (provider, tokens, refilled_at, failures, open_until) VALUES (?, ?, ?, ?, ?)",
+                        (provider, *row)
+                    )
+                result = fn(conn, provider, row, *args)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                # SQLite may have rolled back already (e.g. after a failed COMMIT)
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+    return run
+
+
+@_transaction
+def _acquire(conn, provider, row, check_breaker: bool):
+    """
+    Circuit breaker check, then take a rate-limit token if one is available.
+    Returns False while the breaker is open, else 0 or the seconds until the next token.
+    While open, only one caller per cool-down gets a trial request through; after waiting for a token
+    that caller comes back with check_breaker=False, as it already holds the trial.
+    """
+    tokens, refilled_at, failures, open_until = row
+    now = time.time()
+    if check_breaker and failures >= FAILURE_THRESHOLD:
+        if now < open_until:
+            return False
+        # Half-open: let this caller try and keep everyone else out until it reports back
+        open_until = now + COOLDOWN
+
+    rate, burst = PROVIDER_LIMITS.get(provider, (1.0, 1.0))
+    tokens = min(burst, tokens + max(0.0, now - refilled_at) * rate)
+    wait = 0.0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        wait = (1 - tokens) / rate
+    conn.execute(
+        "UPDATE provider_state SET tokens = ?, refilled_at = ?, open_until = ? WHERE provider = ?",
+        (tokens, now, open_until, provider)
+    )
+    return wait
+
+
+@_transaction
+def _record(conn, provider, row, success: bool):
+    _, _, failures, _ = row
+    if success:
+        conn.execute("UPDATE provider_state SET failures = 0, open_until = 0 WHERE provider = ?", (provider,))
+        return
+    failures += 1
+    open_until = time.time() + COOLDOWN if failures >= FAILURE_THRESHOLD else 0
+    if failures == FAILURE_THRESHOLD:
+        print(f"{provider} failed {failures} times in a row, skipping it for {COOLDOWN}s")
+    conn.execute("UPDATE provider_state SET failures = ?, open_until = ? WHERE provider = ?", (failures, open_until, provider))
+
+
+def _report(provider: str, success: bool):
+    """
+    Record the outcome for the breaker; a state database error only loses this outcome.
+    """
+    try:
+        _record(provider, success)
+    except sqlite3.Error as e:
+        _count(provider, "state_error")
+        print(f"Provider state error, {provider} outcome not recorded: {e}")
+
+
+def _count(provider: str, outcome: str):
+    with _stats_lock:
+        counters = _stats.setdefault(provider, {})
+        counters[outcome] = counters.get(outcome, 0) + 1
+    metrics.inc("provider_events_total", provider=provider, event=outcome)
+
+
+def _attempt_done(provider: str, started: float, status):
+    """
+    Latency of one HTTP attempt (status code, "timeout" or "error"), also as a span of the request's trace.
+    """
+    elapsed = time.perf_counter() - started
+    metrics.observe("provider_request_duration_seconds", elapsed, provider=provider, status=str(status))
+    metrics.record_span(f"{provider}.http", started, status=status)
+
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """
+    Delay before retry number attempt (0-based): full jitter over an exponential window,
+    or the server's Retry-After when it asks for longer.
+    """
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def _budget_end(deadline: float = None) -> float:
+    """
+    Convert a time.monotonic() deadline (or none) into a time.time() moment, which the shared state uses.
+    """
+    if deadline is None:
+        return time.time() + RATE_LIMIT_MAX_WAIT
+    return time.time() + max(0.0, deadline - time.monotonic())
+
+
+def _attempt_timeout(timeout: float, budget_end: float) -> float:
+    return max(0.05, min(timeout, budget_end - time.time()))
+
+
+def _before_request(provider: str, budget_end: float, check_breaker: bool = True):
+    """
+    Breaker and rate limit checks. Returns None when the request may go out,
+    or the number of seconds to wait for a token, or False to give up.
+    Call again with check_breaker=False after waiting: the breaker was already passed.
+    """
+    try:
+        wait = _acquire(provider, check_breaker)
+    except sqlite3.Error as e:
+        _count(provider, "state_error")
+        print(f"Provider state error, {provider} request goes out unchecked: {e}")
+        return None
+    if wait is False:
+        _count(provider, "skipped_open")
+        return False
+    if wait and time.time() + wait > budget_end:
+        _count(provider, "skipped_rate_limit")
+        return False
+    return wait or None
+
+
+def get_json(provider: str, url: str, params: dict = None, timeout: float = None, deadline: float = None):
+    """
+    GET a provider API through the shared policy and return the JSON body.
+    Returns None when the provider is skipped, keeps failing, or answers with an error.
+    deadline is a time.monotonic() value the whole call (waits and retries included) must finish by.
+    """
+    timeout = timeout or DEFAULT_TIMEOUT
+    budget_end = _budget_end(deadline)
+
+    for attempt in range(MAX_RETRIES + 1):
+        wait = _before_request(provider, budget_end)
+        if wait:
+            with metrics.span(f"{provider}.rate_limit_wait"):
+                while wait:
+                    time.sleep(wait + random.uniform(0, 0.05))
+                    wait = _before_request(provider, budget_end, check_breaker=False)
+        if wait is False:
+            return None
+
+        retry_after = None
+        started = time.perf_counter()
+        status = "error"
+        try:
+            _count(provider, "requests")
+            response = requests.get(url, params=params, timeout=_attempt_timeout(timeout, budget_end))
+            status = response.status_code
+            if response.status_code not in RETRYABLE_STATUS:
+                _report(provider, True)
+                if response.status_code != 200:
+                    _count(provider, f"http_{response.status_code}")
+                    print(f"Error fetching from {provider}: HTTP {response.status_code}")
+                    return None
+                _count(provider, "success")
+                return response.json()
+            _count(provider, "rate_limited" if response.status_code == 429 else "server_error")
+            retry_after = response.headers.get("Retry-After")
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.Timeout as e:
+            # A slow provider won't get faster by asking again
+            status = "timeout"
+            _count(provider, "timeout")
+            _report(provider, False)
+            print(f"Error fetching from {provider}: timed out ({e})")
+            return None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            _count(provider, "error")
+            error = str(e)
+        finally:
+            _attempt_done(provider, started, status)
+
+        _report(provider, False)
+        delay = backoff_delay(attempt, retry_after)
+        if attempt == MAX_RETRIES or time.time() + delay > budget_end:
+            print(f"Error fetching from {provider}: {error} after {attempt + 1} attempts")
+            return None
+        print(f"Error fetching from {provider}: {error}. Retrying in {delay:.2f}s (attempt {attempt + 1}/{MAX_RETRIES + 1})")
+        _count(provider, "retries")
+        with metrics.span(f"{provider}.backoff", retry_after=retry_after):
+            time.sleep(delay)
+
+    return None
+
+
+async def get_json_async(client: httpx.AsyncClient, provider: str, url: str, params: dict = None,
+                         timeout: float = None, deadline: float = None):
+    """
+    Async counterpart of get_json() on a shared httpx.AsyncClient.
+    """
+    timeout = timeout or DEFAULT_TIMEOUT
+    budget_end = _budget_end(deadline)
+
+    for attempt in range(MAX_RETRIES + 1):
+        wait = await asyncio.to_thread(_before_request, provider, budget_end)
+        if wait:
+            with metrics.span(f"{provider}.rate_limit_wait"):
+                while wait:
+                    await asyncio.sleep(wait + random.uniform(0, 0.05))
+                    wait = await asyncio.to_thread(_before_request, provider, budget_end, False)
+        if wait is False:
+            return None
+
+        retry_after = None
+        attempt_timeout = _attempt_timeout(timeout, budget_end)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            _count(provider, "requests")
+            # wait_for makes the timeout hard: httpx's own timeout applies per network operation
+            response = await asyncio.wait_for(
+                client.get(url, params=params, timeout=attempt_timeout), timeout=attempt_timeout
+            )
+            status = response.status_code
+            if response.status_code not in RETRYABLE_STATUS:
+                await asyncio.to_thread(_report, provider, True)
+                if response.status_code != 200:
+                    _count(provider, f"http_{response.status_code}")
+                    print(f"Error fetching from {provider}: HTTP {response.status_code}")
+                    return None
+                _count(provider, "success")
+                return response.json()
+            _count(provider, "rate_limited" if response.status_code == 429 else "server_error")
+            retry_after = response.headers.get("Retry-After")
+            error = f"HTTP {response.status_code}"
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            status = "timeout"
+            _count(provider, "timeout")
+            await asyncio.to_thread(_report, provider, False)
+            print(f"Error fetching from {provider}: timed out ({e!r})")
+            return None
+        except (httpx.HTTPError, ValueError) as e:
+            _count(provider, "error")
+            error = str(e)
+        finally:
+            _attempt_done(provider, started, status)
+
+        await asyncio.to_thread(_report, provider, False)
+        delay = backoff_delay(attempt, retry_after)
+        if attempt == MAX_RETRIES or time.time() + delay > budget_end:
+            print(f"Error fetching from {provider}: {error} after {attempt + 1} attempts")
+            return None
+        print(f"Error fetching from {provider}: {error}. Retrying in {delay:.2f}s (attempt {attempt + 1}/{MAX_RETRIES + 1})")
+        _count(provider, "retries")
+        with metrics.span(f"{provider}.backoff", retry_after=retry_after):
+            await asyncio.sleep(delay)
+
+    return None
+
+
+def status() -> dict:
+    """
+    Breaker state and bucket level per provider (shared) plus this process's request counters.
+    """
+    now = time.time()
+    with _lock:
+        rows = _get_conn().execute(
+            "SELECT provider, tokens, refilled_at, failures, open_until FROM provider_state"
+        ).fetchall()
+    with _stats_lock:
+        counters = {provider: dict(c) for provider, c in _stats.items()}
+
+    result = {}
+    for provider, (rate, burst) in PROVIDER_LIMITS.items():
+        state = next((r for r in rows if r[0] == provider), None)
+        tokens = burst
+        breaker = "closed"
+        failures = 0
+        if state:
+            _, tokens, refilled_at, failures, open_until = state
+            tokens = min(burst, tokens + max(0.0, now - refilled_at) * rate)
+            if failures >= FAILURE_THRESHOLD:
+                breaker = "open" if now < open_until else "half_open"
+        result[provider] = {
+            "rate_per_second": rate,
+            "burst": burst,
+            "tokens": round(tokens, 2),
+            "circuit": breaker,
+            "consecutive_failures": failures,
+            "counters": counters.get(provider, {}),
+        }
+    return result
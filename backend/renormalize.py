@@ -0,0 +1,317 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import and_, bindparam, update
+from database import SessionLocal, ReadSessionLocal, Book, RenormalizeRun, RenormalizeChange
+import title_parser
+from title_parser import (
+    PLACEHOLDER_TITLE, SeriesTrie, normalize_title, clean_title, extract_volume_number, extract_series_title, format_book_title,
+)
+import bookshelf
+import series_index
+import stats
+
+# Library-wide re-normalization: re-run the title pipeline over every book after the heuristics
+# in title_parser.py improved, and fix the stored series/volume (and optionally title) values.
+#
+#   python renormalize.py --dry-run               # compute and show the diff, change nothing
+#   python renormalize.py                         # compute (or reuse the dry run's result) and apply
+#   python renormalize.py --fields title,series_title,volume_number --diff changes.tsv
+#
+# Books are read in ISBN order and parsed in a process pool, CHUNK_SIZE books per task. The result of
+# each chunk is stored in renormalize_changes together with the run's progress, so an interrupted
+# run continues where it stopped. Applying is a batched executemany in a single transaction; a book
+# edited after its change was computed is left alone.
+# Books are read on the read-only pool; the writer is only taken to store a chunk and to apply, so the
+# app keeps accepting writes during a run. A series title the title pipeline can't have produced from
+# the book's title (set by hand, or from an API) is never replaced.
+CHUNK_SIZE = int(os.getenv("RENORMALIZE_CHUNK_SIZE", "2000"))
+WORKERS = int(os.getenv("RENORMALIZE_WORKERS", str(os.cpu_count() or 2)))
+
+FIELDS = ("series_title", "volume_number", "title")
+DEFAULT_FIELDS = ("series_title", "volume_number")
+
+# Changes computed with another version of the parser are never resumed or applied
+with open(title_parser.__file__, "rb") as _source:
+    PARSER_VERSION = hashlib.sha256(_source.read()).hexdigest()[:16]
+
+# Books whose title is only a placeholder are left to the enrichment queue
+SKIP_TITLES = {PLACEHOLDER_TITLE}
+
+# Per-process series index, built once by the pool initializer
+_series = None
+
+
+def _init_worker(candidates: dict):
+    global _series
+    _series = SeriesTrie()
+    for series, count in candidates.items():
+        _series.add(series, count)
+
+
+def _candidates_chunk(titles: list) -> dict:
+    """
+    First pass: the series name each title would get on its own (before matching other books).
+    """
+    counts = {}
+    for title in titles:
+        candidate = clean_title(normalize_title(title))
+        if candidate:
+            counts[candidate] = counts.get(candidate, 0) + 1
+    return counts
+
+
+def derive(title: str, series_index_: SeriesTrie = None, series: str = None) -> dict:
+    """
+    What the pipeline derives from a stored title today: series (matched against the library's
+    re-derived series, unless given), volume number and the formatted title.
+    """
+    normalized = normalize_title(title)
+    volume = extract_volume_number(normalized)
+    if series is None:
+        series = extract_series_title(normalized, None, series_index_)
+    return {
+        "series_title": series,
+        "volume_number": volume,
+        "title": format_book_title(normalized, series, volume),
+    }
+
+
+def is_derived_series(series: str, title: str) -> bool:
+    """
+    Whether a stored series could come from the title pipeline (of this or an earlier version):
+    those are the cleaned title or a prefix of it. Anything else was set by hand or taken from an API.
+    """
+    if not series:
+        return True
+    series = normalize_title(series)
+    normalized = normalize_title(title)
+    return normalized.startswith(series) or clean_title(normalized).startswith(series)
+
+
+def _changes_chunk(rows: list, fields: tuple) -> tuple:
+    """
+    Second pass: (isbn, before, after) for each book of the chunk whose derived values differ,
+    and the number of books whose series was kept because it wasn't derived from the title.
+    """
+    changes = []
+    kept = 0
+    for isbn, title, *current in rows:
+        if not title or title in SKIP_TITLES:
+            continue
+        stored = dict(zip(FIELDS, current))
+        if is_derived_series(stored["series_title"], title):
+            derived = derive(title, _series)
+        else:
+            derived = derive(title, series=stored["series_title"])
+            kept += "series_title" in fields
+        if derived["volume_number"] is None:
+            # The parser doesn't see a volume: keep what is stored (set by hand or a special case)
+            derived["volume_number"] = stored["volume_number"]
+        before = {field: stored[field] for field in fields if stored[field] != derived[field]}
+        if before:
+            changes.append((isbn, before, {field: derived[field] for field in before}))
+    return changes, kept
+
+
+def _chunks(db, last_isbn: str = None):
+    """
+    Books in ISBN order, CHUNK_SIZE at a time, starting after last_isbn (keyset pagination).
+    Each chunk is read in its own (read) transaction, so a long run doesn't pin one old snapshot.
+    """
+    # isbn, the title to parse, then the stored values of FIELDS
+    columns = (Book.isbn, Book.title, Book.series_title, Book.volume_number, Book.title)
+    while True:
+        query = db.query(*columns)
+        if last_isbn is not None:
+            query = query.filter(Book.isbn > last_isbn)
+        rows = [tuple(row) for row in query.order_by(Book.isbn).limit(CHUNK_SIZE).all()]
+        db.rollback()
+        if not rows:
+            return
+        yield rows
+        last_isbn = rows[-1][0]
+
+
+def compute(db, run: RenormalizeRun, workers: int = WORKERS):
+    """
+    Compute (or finish computing) the changes of a run, committing after every chunk.
+    Books are read on a read-only session; db (the writer) only stores the chunks.
+    """
+    fields = tuple(run.fields.split(","))
+    read_db = ReadSessionLocal()
+    try:
+        titles = [row[0] for row in read_db.query(Book.title).filter(Book.title.isnot(None)).all()]
+        read_db.rollback()
+        started = time.monotonic()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            candidates = {}
+            title_chunks = [titles[i:i + CHUNK_SIZE] for i in range(0, len(titles), CHUNK_SIZE)]
+            for counts in pool.map(_candidates_chunk, title_chunks):
+                for series, count in counts.items():
+                    candidates[series] = candidates.get(series, 0) + count
+
+        kept = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(candidates,)) as pool:
+            chunks = _chunks(read_db, run.last_isbn)
+            # Keep at most two chunks per worker in flight so memory stays bounded
+            pending = []
+            for rows in chunks:
+                pending.append((rows[-1][0], pool.submit(_changes_chunk, rows, fields)))
+                if len(pending) >= workers * 2:
+                    kept += _store_chunk(db, run, *pending.pop(0))
+            for last_isbn, future in pending:
+                kept += _store_chunk(db, run, last_isbn, future)
+    finally:
+        read_db.close()
+
+    run.status = "computed"
+    db.commit()
+    print(f"Computed {run.changed} changes for {len(titles)} books in {time.monotonic() - started:.1f}s")
+    if kept:
+        print(f"Kept the series title of {kept} books (not derived from their title: set by hand or from an API)")
+
+
+def _store_chunk(db, run: RenormalizeRun, last_isbn: str, future) -> int:
+    """
+    Store one chunk's changes and the run's progress in a short write transaction.
+    """
+    changes, kept = future.result()
+    if changes:
+        db.bulk_insert_mappings(RenormalizeChange, [
+            {"run_id": run.id, "isbn": isbn, "before": json.dumps(before, ensure_ascii=False),
+             "after": json.dumps(after, ensure_ascii=False)}
+            for isbn, before, after in changes
+        ])
+    run.changed += len(changes)
+    run.last_isbn = last_isbn
+    db.commit()
+    return kept
+
+
+def iter_changes(db, run: RenormalizeRun):
+    query = db.query(RenormalizeChange).filter(RenormalizeChange.run_id == run.id).order_by(RenormalizeChange.isbn)
+    for change in query.yield_per(1000):
+        yield change.isbn, json.loads(change.before), json.loads(change.after)
+
+
+def write_diff(db, run: RenormalizeRun, path: str = None, preview: int = 20):
+    """
+    Print a summary and the first changes; with path, write every change as TSV (isbn, field, old, new).
+    """
+    per_field = {}
+    output = open(path, "w", encoding="utf-8") if path else None
+    try:
+        if output:
+            output.write("isbn\tfield\tbefore\tafter\n")
+        for number, (isbn, before, after) in enumerate(iter_changes(db, run)):
+            for field in before:
+                per_field[field] = per_field.get(field, 0) + 1
+                if output:
+                    output.write(f"{isbn}\t{field}\t{before[field]}\t{after[field]}\n")
+                if number < preview:
+                    print(f"  {isbn} {field}: {before[field]!r} -> {after[field]!r}")
+    finally:
+        if output:
+            output.close()
+    print(f"{run.changed} books would change: {per_field or 'nothing'}")
+
+
+def apply(db, run: RenormalizeRun) -> int:
+    """
+    Write the run's changes in one transaction. Each UPDATE only matches while the book still has
+    the values the change was computed from. Returns the number of books updated.
+    """
+    now = datetime.now()
+    table = Book.__table__
+    groups = {}
+    # The changes are read before taking the writer
+    read_db = ReadSessionLocal()
+    try:
+        for isbn, before, after in iter_changes(read_db, run):
+            params = {"_isbn": isbn, "_now": now}
+            params.update({f"_old_{field}": value for field, value in before.items()})
+            params.update({f"_new_{field}": value for field, value in after.items()})
+            groups.setdefault(tuple(sorted(before)), []).append(params)
+    finally:
+        read_db.close()
+
+    updated = 0
+    for fields, params in groups.items():
+        statement = (
+            update(table)
+            .where(and_(
+                table.c.isbn == bindparam("_isbn"),
+                *(table.c[field].is_not_distinct_from(bindparam(f"_old_{field}")) for field in fields),
+            ))
+            .values({**{field: bindparam(f"_new_{field}") for field in fields}, "updated_at": bindparam("_now")})
+        )
+        updated += db.execute(statement, params).rowcount
+
+    # Series and statistics are derived from these columns: recount them in the same transaction
+    bookshelf.rebuild_series(db)
+    stats.rebuild_stats(db)
+    run.status = "applied"
+    run.applied_at = now
+    db.commit()
+    series_index.invalidate()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-derive series/volume/title of every book with the current title parser")
+    parser.add_argument("--fields", default=",".join(DEFAULT_FIELDS),
+                        help=f"Comma-separated columns to re-derive (from {', '.join(FIELDS)})")
+    parser.add_argument("--dry-run", action="store_true", help="Compute and show the diff without changing books")
+    parser.add_argument("--diff", help="Write every change to this TSV file")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--restart", action="store_true", help="Discard an unfinished run instead of resuming it")
+    args = parser.parse_args()
+
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        parser.error(f"Unknown fields: {', '.join(sorted(unknown))}")
+    fields = ",".join(field for field in FIELDS if field in fields)
+
+    db = SessionLocal()
+    try:
+        run = db.query(RenormalizeRun).filter(
+            RenormalizeRun.status.in_(["computing", "computed"])
+        ).order_by(RenormalizeRun.id.desc()).first()
+        if run and (args.restart or run.fields != fields or run.parser_version != PARSER_VERSION):
+            run.status = "abandoned"
+            db.query(RenormalizeChange).filter(RenormalizeChange.run_id == run.id).delete(synchronize_session=False)
+            db.commit()
+            run = None
+        if run is None:
+            run = RenormalizeRun(fields=fields, parser_version=PARSER_VERSION, status="computing", changed=0)
+            db.add(run)
+            db.commit()
+        elif run.status == "computing":
+            print(f"Resuming run {run.id} after ISBN {run.last_isbn}")
+
+        if run.status == "computing":
+            compute(db, run, args.workers)
+        read_db = ReadSessionLocal()
+        try:
+            write_diff(read_db, run, args.diff)
+        finally:
+            read_db.close()
+
+        if args.dry_run:
+            print(f"Dry run: nothing changed. Run again without --dry-run to apply run {run.id}.")
+            return
+        updated = apply(db, run)
+        print(f"Updated {updated} books ({run.changed - updated} skipped because they changed meanwhile)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import json
+import os
+import zlib
+from datetime import date, datetime
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # orjson not installed: the standard json module (several times slower on big lists)
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli not installed: gzip only
+    brotli = None
+
+# Fast path for large list responses (GET /books): rows are encoded straight from column tuples,
+# without a Pydantic model per row, and compressed when the client accepts it.
+# Bodies below COMPRESS_MIN_SIZE are sent as is (compression would only cost time there).
+COMPRESS_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+# Rows per chunk of a streamed NDJSON response
+STREAM_CHUNK_ROWS = 1000
+
+# Preferred first when the client accepts both with the same weight
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """
+    Compact UTF-8 JSON; datetimes as ISO 8601 like Pydantic writes them.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def negotiate_encoding(accept_encoding: str):
+    """
+    Content coding to use for an Accept-Encoding header ("br", "gzip") or None for identity.
+    """
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if name:
+            weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return zlib.compress(body, GZIP_LEVEL, wbits=31)
+
+
+def rows_as_dicts(rows, field_names: list) -> list:
+    """
+    Result tuples -> dicts keyed by field_names (extra trailing columns such as the sort value are dropped).
+    """
+    count = len(field_names)
+    return [dict(zip(field_names, row[:count])) for row in rows]
+
+
+def json_response(content, accept_encoding: str = None, headers: dict = None) -> Response:
+    """
+    JSON response encoded with dumps(), compressed when it pays off and the client accepts it.
+    """
+    body = dumps(content)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _ndjson_chunks(items: list):
+    for start in range(0, len(items), STREAM_CHUNK_ROWS):
+        yield b"".join(dumps(item) + b"\n" for item in items[start:start + STREAM_CHUNK_ROWS])
+
+
+def _compressed_stream(chunks, encoding: str):
+    """
+    Compress a stream chunk by chunk, flushing after each so the client can parse lines as they arrive.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def ndjson_response(items: list, accept_encoding: str = None, headers: dict = None) -> StreamingResponse:
+    """
+    One JSON object per line, streamed in chunks of STREAM_CHUNK_ROWS (compressed if accepted).
+    """
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    chunks = _ndjson_chunks(items)
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding:
+        chunks = _compressed_stream(chunks, encoding)
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
@@ -0,0 +1,354 @@
+import html
+import unicodedata
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError
+from database import is_postgresql, like_contains
+
+# Full-text search over the local library.
+# On SQLite an FTS5 table (keyed on isbn through books_fts_keys) is kept in sync by triggers, so every
+# insert/update/delete through the ORM, the migration scripts or the sqlite3 CLI updates the index.
+# The trigram tokenizer handles Japanese text without a morphological analyzer.
+# On PostgreSQL the same columns get pg_trgm GIN indexes instead: terms are matched with ILIKE
+# (an index scan, any term length) and ranked by the columns they were found in, with the bm25 weights.
+FTS_COLUMNS = ["isbn", "title", "authors", "series_title", "label", "notes", "description", "tags"]
+
+# bm25 weights, same order as FTS_COLUMNS (isbn is UNINDEXED)
+FTS_WEIGHTS = [0.0, 10.0, 5.0, 4.0, 2.0, 1.0, 0.5, 3.0]
+
+# Trigram tokens need at least 3 characters; shorter terms fall back to LIKE
+MIN_TRIGRAM_LENGTH = 3
+
+# Counting every match of a very common term costs more than the search itself
+TOTAL_CAP = 1000
+
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+
+# highlight()/snippet() mark matches with these control characters; the text is HTML-escaped
+# afterwards and only then are they turned into HIGHLIGHT_OPEN/CLOSE
+_MATCH_OPEN = "\x02"
+_MATCH_CLOSE = "\x03"
+
+_fts_available = False
+
+
+def init_search_index(engine):
+    """
+    Create the FTS5 table, its key table and the sync triggers if they don't exist,
+    and fill the index on first run.
+    """
+    global _fts_available
+    if is_postgresql(engine):
+        _fts_available = False
+        _init_trigram_indexes(engine)
+        return
+    if engine.dialect.name != "sqlite":
+        _fts_available = False
+        return
+
+    columns = ", ".join(f"{c} UNINDEXED" if c == "isbn" else c for c in FTS_COLUMNS)
+    column_list = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    indexed_columns = ", ".join(FTS_COLUMNS)
+    new_key = "(SELECT id FROM books_fts_keys WHERE isbn = new.isbn)"
+    old_key = "(SELECT id FROM books_fts_keys WHERE isbn = old.isbn)"
+
+    try:
+        with engine.begin() as conn:
+            existing = conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+            )).scalar()
+            if existing and "content=" in existing:
+                # Index from before the key table (external content on the rowid of books): replace it
+                for trigger in ("books_fts_ai", "books_fts_ad", "books_fts_au"):
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+                conn.execute(text("DROP TABLE books_fts"))
+                existing = None
+
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS books_fts_keys (id INTEGER PRIMARY KEY, isbn TEXT NOT NULL UNIQUE)"
+            ))
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5({columns}, tokenize='trigram')"
+            ))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+                    INSERT OR IGNORE INTO books_fts_keys(isbn) VALUES (new.isbn);
+                    INSERT INTO books_fts(rowid, {column_list}) VALUES ({new_key}, {new_values});
+                END
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+                    DELETE FROM books_fts WHERE rowid = {old_key};
+                    DELETE FROM books_fts_keys WHERE isbn = old.isbn;
+                END
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF {indexed_columns} ON books BEGIN
+                    DELETE FROM books_fts WHERE rowid = {old_key};
+                    UPDATE books_fts_keys SET isbn = new.isbn WHERE isbn = old.isbn;
+                    INSERT INTO books_fts(rowid, {column_list}) VALUES ({new_key}, {new_values});
+                END
+            """))
+
+            # Index books that existed before the FTS table was created
+            if not existing:
+                _fill_index(conn)
+        _fts_available = True
+    except OperationalError as e:
+        # SQLite built without FTS5/trigram: search still works through LIKE
+        print(f"Full-text search index unavailable, falling back to LIKE: {e}")
+        _fts_available = False
+
+
+def _fill_index(conn):
+    """
+    Re-index every book. The FTS rows are keyed on books_fts_keys.id (an INTEGER PRIMARY KEY),
+    not on the implicit rowid of books, which VACUUM may renumber since books is keyed on isbn.
+    """
+    column_list = ", ".join(FTS_COLUMNS)
+    book_values = ", ".join(f"b.{c}" for c in FTS_COLUMNS)
+    conn.execute(text("DELETE FROM books_fts"))
+    conn.execute(text("DELETE FROM books_fts_keys WHERE isbn NOT IN (SELECT isbn FROM books)"))
+    conn.execute(text("INSERT OR IGNORE INTO books_fts_keys(isbn) SELECT isbn FROM books"))
+    conn.execute(text(f"""
+        INSERT INTO books_fts(rowid, {column_list})
+        SELECT k.id, {book_values} FROM books b JOIN books_fts_keys k ON k.isbn = b.isbn
+    """))
+
+
+def _init_trigram_indexes(engine):
+    """
+    PostgreSQL: trigram GIN index per searched column (needs the pg_trgm extension).
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for column in FTS_COLUMNS:
+                if column != "isbn":
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_books_{column}_trgm ON books USING gin ({column} gin_trgm_ops)"
+                    ))
+    except DBAPIError as e:
+        # No pg_trgm (or no right to create it): search still works, scanning the books table
+        print(f"Trigram search indexes unavailable, searching without them: {e}")
+
+
+def rebuild_search_index(engine):
+    """
+    Rebuild the whole FTS index from the books table.
+    """
+    if not _fts_available:
+        return
+    with engine.begin() as conn:
+        _fill_index(conn)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize full-width alphanumerics and spaces (NFKC) like the frontend search does.
+    """
+    return unicodedata.normalize("NFKC", query).strip()
+
+
+def to_fullwidth(value: str) -> str:
+    """
+    Convert ASCII letters and digits to their full-width forms (titles often use "ＧＣノベルズ").
+    """
+    return "".join(chr(ord(ch) + 0xFEE0) if ch.isascii() and ch.isalnum() else ch for ch in value)
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _highlight(value: str, terms: list) -> str:
+    """
+    Python-side highlighting for results found through the LIKE fallback.
+    The text is HTML-escaped; only the inserted marks are markup.
+    """
+    if not value:
+        return value
+    lowered = value.lower()
+    spans = []
+    for term in terms:
+        start = lowered.find(term.lower())
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lowered.find(term.lower(), start + len(term))
+    if not spans:
+        return html.escape(value)
+
+    spans.sort()
+    merged = [list(spans[0])]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    result = []
+    position = 0
+    for start, end in merged:
+        result.append(html.escape(value[position:start]))
+        result.append(f"{HIGHLIGHT_OPEN}{html.escape(value[start:end])}{HIGHLIGHT_CLOSE}")
+        position = end
+    result.append(html.escape(value[position:]))
+    return "".join(result)
+
+
+def search_books(db, query: str, status: str = None, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Search title, authors, series, label, notes, description and tags.
+    Terms are ANDed. Returns ranked results with highlighted title/authors/series and a snippet.
+    "total" stops counting at TOTAL_CAP.
+    """
+    raw_terms = query.split()
+    normalized_terms = normalize_query(query).split()
+    if not normalized_terms:
+        return {"total": 0, "results": []}
+
+    # The index holds titles as published, so each term matches as typed,
+    # NFKC-normalized and full-width (e.g. "GC" also finds "ＧＣ")
+    term_variants = []
+    for index, term in enumerate(normalized_terms):
+        variants = {term, to_fullwidth(term)}
+        if index < len(raw_terms):
+            variants.add(raw_terms[index])
+        term_variants.append(sorted(variants))
+
+    fts_terms = [v for v in term_variants if all(len(t) >= MIN_TRIGRAM_LENGTH for t in v)]
+    like_terms = [v for v in term_variants if v not in fts_terms]
+
+    postgres = is_postgresql(db)
+    operator = "ILIKE" if postgres else "LIKE"
+    params = {"limit": limit, "offset": offset}
+    like_clauses = [_like_clause(variants, params, f"like_{i}", operator) for i, variants in enumerate(like_terms)]
+    if status:
+        like_clauses.append("b.status = :status")
+        params["status"] = status
+
+    all_terms = [t for variants in term_variants for t in variants]
+    select_columns = "b.isbn, b.title, b.authors, b.series_title, b.cover_url, b.status, b.volume_number"
+
+    if _fts_available and fts_terms:
+        params["match"] = " AND ".join(
+            "(" + " OR ".join(_quote(t) for t in variants) + ")" for variants in fts_terms
+        )
+        params["open"] = _MATCH_OPEN
+        params["close"] = _MATCH_CLOSE
+        weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+        where = "books_fts MATCH :match" + "".join(f" AND {c}" for c in like_clauses)
+
+        rows = db.execute(text(f"""
+            SELECT {select_columns},
+                   highlight(books_fts, 1, :open, :close) AS title_hl,
+                   highlight(books_fts, 2, :open, :close) AS authors_hl,
+                   highlight(books_fts, 3, :open, :close) AS series_hl,
+                   snippet(books_fts, -1, :open, :close, '…', 16) AS snippet,
+                   bm25(books_fts, {weights}) AS rank
+            FROM books_fts JOIN books b ON b.isbn = books_fts.isbn
+            WHERE {where}
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        total = db.execute(text(f"""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM books_fts JOIN books b ON b.isbn = books_fts.isbn WHERE {where} LIMIT {TOTAL_CAP}
+            ) AS matches
+        """), params).scalar()
+
+        results = [{
+            "isbn": row["isbn"],
+            "title": row["title"],
+            "authors": row["authors"],
+            "series_title": row["series_title"],
+            "cover_url": row["cover_url"],
+            "status": row["status"],
+            "volume_number": row["volume_number"],
+            "rank": row["rank"],
+            "highlights": {
+                # highlight() works on trigram matches, LIKE-only terms are added in Python
+                "title": _highlight_short(row["title_hl"], like_terms),
+                "authors": _highlight_short(row["authors_hl"], like_terms),
+                "series_title": _highlight_short(row["series_hl"], like_terms),
+            },
+            "snippet": _highlight_short(row["snippet"], []),
+        } for row in rows]
+        return {"total": total, "results": results}
+
+    # LIKE fallback (short terms only, or no FTS5); ILIKE on PostgreSQL, ranked by weighted column hits
+    if fts_terms:
+        like_clauses.extend(_like_clause(variants, params, f"fts_{i}", operator) for i, variants in enumerate(fts_terms))
+    where = " AND ".join(like_clauses) or "1 = 1"
+    rank = _weighted_rank(term_variants, params) if postgres else "NULL"
+    rows = db.execute(text(f"""
+        SELECT {select_columns}, {rank} AS rank FROM books b
+        WHERE {where}
+        ORDER BY {"rank, " if postgres else ""}b.title
+        LIMIT :limit OFFSET :offset
+    """), params).mappings().all()
+    total = db.execute(text(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM books b WHERE {where} LIMIT {TOTAL_CAP}) AS matches"
+    ), params).scalar()
+
+    results = [{
+        "isbn": row["isbn"],
+        "title": row["title"],
+        "authors": row["authors"],
+        "series_title": row["series_title"],
+        "cover_url": row["cover_url"],
+        "status": row["status"],
+        "volume_number": row["volume_number"],
+        "rank": row["rank"],
+        "highlights": {
+            "title": _highlight(row["title"], all_terms),
+            "authors": _highlight(row["authors"], all_terms),
+            "series_title": _highlight(row["series_title"], all_terms),
+        },
+        "snippet": None,
+    } for row in rows]
+    return {"total": total, "results": results}
+
+
+def _like_clause(variants: list, params: dict, prefix: str, operator: str = "LIKE") -> str:
+    ors = []
+    for j, variant in enumerate(variants):
+        key = f"{prefix}_{j}"
+        params[key] = like_contains(variant)
+        ors.extend(f"b.{c} {operator} :{key} ESCAPE '\\'" for c in FTS_COLUMNS if c != "isbn")
+    return "(" + " OR ".join(ors) + ")"
+
+
+def _weighted_rank(term_variants: list, params: dict) -> str:
+    """
+    Rank for the ILIKE search: minus the FTS_WEIGHTS of the columns each term was found in
+    (lower ranks first, like bm25).
+    """
+    parts = []
+    for i, variants in enumerate(term_variants):
+        keys = []
+        for j, variant in enumerate(variants):
+            keys.append(f"rank_{i}_{j}")
+            params[keys[-1]] = like_contains(variant)
+        for column, weight in zip(FTS_COLUMNS, FTS_WEIGHTS):
+            if weight:
+                matched = " OR ".join(f"b.{column} ILIKE :{key} ESCAPE '\\'" for key in keys)
+                parts.append(f"CASE WHEN {matched} THEN {weight} ELSE 0 END")
+    return f"CAST(-({' + '.join(parts)}) AS FLOAT)"
+
+
+def _highlight_short(value: str, like_terms: list) -> str:
+    """
+    Turn highlight()/snippet() output into escaped HTML, adding marks for the LIKE-only terms.
+    """
+    if not value:
+        return value
+    # Avoid nesting marks inside the ones FTS5 already added
+    parts = value.split(_MATCH_OPEN)
+    terms = [t for variants in like_terms for t in variants]
+    result = [_highlight(parts[0], terms)]
+    for part in parts[1:]:
+        marked, _, rest = part.partition(_MATCH_CLOSE)
+        result.append(f"{HIGHLIGHT_OPEN}{html.escape(marked)}{HIGHLIGHT_CLOSE}{_highlight(rest, terms)}")
+    return "".join(result)
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from database import Series
+from title_parser import SeriesTrie
+from bookshelf import OTHER
+
+# Existing series titles, indexed once per process and kept up to date by the book routes,
+# so matching a new title doesn't re-query and re-sort every series in the library.
+# Changes made outside this process (migration scripts, other workers) are picked up
+# when the index is rebuilt after SERIES_INDEX_MAX_AGE seconds.
+SERIES_INDEX_MAX_AGE = float(os.getenv("SERIES_INDEX_MAX_AGE", "300"))
+
+_index = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def build_series_index(db) -> SeriesTrie:
+    """
+    Build a series index from the series table (one row per series, no scan of the books).
+    """
+    rows = db.query(Series.title, Series.volume_count).filter(Series.title != OTHER).all()
+
+    index = SeriesTrie()
+    for series, count in rows:
+        index.add(series, count)
+    return index
+
+
+def get_series_index(db) -> SeriesTrie:
+    """
+    The process-wide series index, built on first use and rebuilt once it is too old.
+    """
+    global _index, _built_at
+    with _lock:
+        if _index is None or time.monotonic() - _built_at > SERIES_INDEX_MAX_AGE:
+            _index = build_series_index(db)
+            _built_at = time.monotonic()
+        return _index
+
+
+def series_added(series: str):
+    """
+    Record a committed book of this series.
+    """
+    if _index is not None and series:
+        _index.add(series)
+
+
+def series_removed(series: str):
+    """
+    Record that a committed book of this series was deleted or moved to another series.
+    """
+    if _index is not None and series:
+        _index.remove(series)
+
+
+def series_changed(old_series: str, new_series: str):
+    if old_series != new_series:
+        series_removed(old_series)
+        series_added(new_series)
+
+
+def invalidate():
+    """
+    Drop the index so the next lookup rebuilds it (after bulk changes to the books table).
+    """
+    global _index
+    with _lock:
+        _index = None
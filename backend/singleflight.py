@@ -0,0 +1,123 @@
+import asyncio
+import copy
+import functools
+import inspect
+import threading
+from concurrent.futures import Future
+
+# Request coalescing: while a call for a key is running, identical calls wait for it and share
+# its result instead of starting their own upstream request. Works across the threadpool
+# (sync routes) and the event loop (async routes); both kinds wait on the same flight.
+# Only in-flight calls are shared, finished results live in metadata_cache.
+
+_lock = threading.Lock()
+_flights = {}
+_stats = {}
+_tasks = set()
+
+
+def _stat(name: str) -> dict:
+    return _stats.setdefault(name, {"calls": 0, "executed": 0, "coalesced": 0})
+
+
+def _join(name: str, key):
+    """
+    Returns (future, is_leader). The leader runs the call and resolves the future.
+    """
+    with _lock:
+        stat = _stat(name)
+        stat["calls"] += 1
+        future = _flights.get((name, key))
+        if future is not None:
+            stat["coalesced"] += 1
+            return future, False
+        future = Future()
+        _flights[(name, key)] = future
+        stat["executed"] += 1
+        return future, True
+
+
+def _land(name: str, key, future: Future, result=None, error: BaseException = None):
+    with _lock:
+        _flights.pop((name, key), None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        # Snapshot for the followers: callers mutate the returned dicts while merging
+        future.set_result(copy.deepcopy(result))
+
+
+def do(name: str, key, fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) unless a call with the same name/key is in flight; then wait for its result.
+    """
+    future, leader = _join(name, key)
+    if not leader:
+        return copy.deepcopy(future.result())
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException as e:
+        _land(name, key, future, error=e)
+        raise
+    _land(name, key, future, result)
+    return result
+
+
+async def do_async(name: str, key, fn, *args, **kwargs):
+    """
+    Async counterpart of do(): fn is a coroutine function.
+    The call runs as its own task, so a caller that stops waiting (deadline) doesn't cancel
+    it for the others, and the answer still reaches the cache.
+    """
+    future, leader = _join(name, key)
+    if not leader:
+        return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+
+    task = asyncio.ensure_future(fn(*args, **kwargs))
+    _tasks.add(task)
+
+    def landed(task):
+        _tasks.discard(task)
+        if task.cancelled():
+            _land(name, key, future, error=RuntimeError(f"{name} call for {key!r} was cancelled"))
+        elif task.exception() is not None:
+            _land(name, key, future, error=task.exception())
+        else:
+            _land(name, key, future, task.result())
+
+    task.add_done_callback(landed)
+    return await asyncio.shield(task)
+
+
+def coalesce(name: str, key=None):
+    """
+    Decorator form of do()/do_async(). The key defaults to the first argument (the ISBN);
+    pass key=lambda *args, **kwargs: ... to include more of the arguments.
+    Sync and async functions decorated with the same name share flights.
+    """
+    key_of = key or (lambda first, *args, **kwargs: first)
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await do_async(name, key_of(*args, **kwargs), fn, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return do(name, key_of(*args, **kwargs), fn, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def stats() -> dict:
+    """
+    Per name: calls, calls that ran ("executed") and calls that joined a running one ("coalesced").
+    """
+    with _lock:
+        return {
+            "in_flight": len(_flights),
+            "calls": {name: dict(stat) for name, stat in _stats.items()},
+        }
@@ -0,0 +1,155 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import func
+from database import Book, StatCounter, upsert
+
+# Library statistics behind GET /stats, kept as counters in stat_counters.
+# A book contributes +1 to a set of (dimension, key) counters (its status, the month it was added,
+# its author...). Every write path takes a snapshot of the books it changes before the change
+# and calls record() afterwards, in the same transaction; record() applies the difference.
+# Reading the stats is then a handful of indexed lookups, whatever the size of the library.
+
+# Book columns the counters are derived from
+STAT_COLUMNS = (
+    "status", "created_at", "reading_start_date", "reading_end_date",
+    "authors", "series_title", "label", "lent_to",
+)
+
+# Dimensions listed as "top N" in the response
+TOP_DIMENSIONS = ("author", "series", "label", "lent_to")
+DEFAULT_TOP = 10
+
+
+def _month(value) -> str:
+    return value.strftime("%Y-%m") if isinstance(value, datetime) else None
+
+
+def snapshot(book) -> dict:
+    """
+    The stat columns of a book (ORM object or dict), taken before changing or deleting it.
+    """
+    if isinstance(book, dict):
+        return {column: book.get(column) for column in STAT_COLUMNS}
+    return {column: getattr(book, column) for column in STAT_COLUMNS}
+
+
+def contributions(values: dict) -> list:
+    """
+    The (dimension, key) counters one book adds 1 to.
+    """
+    keys = [("total", ""), ("status", values["status"] or "unread")]
+    for dimension, column in (
+        ("added_month", "created_at"),
+        ("started_month", "reading_start_date"),
+        ("finished_month", "reading_end_date"),
+    ):
+        month = _month(values[column])
+        if month:
+            keys.append((dimension, month))
+    for dimension, column in (("author", "authors"), ("series", "series_title"), ("label", "label")):
+        if values[column]:
+            keys.append((dimension, values[column]))
+    if values["lent_to"]:
+        keys.append(("lent_to", values["lent_to"]))
+        keys.append(("lending", "lent"))
+    return keys
+
+
+def _apply(db, deltas: Counter):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    rows = [{"dimension": dimension, "key": key, "count": delta} for (dimension, key), delta in deltas.items()]
+    statement = upsert(db, StatCounter).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["dimension", "key"],
+        set_={"count": StatCounter.count + statement.excluded.count},
+    ))
+    db.query(StatCounter).filter(StatCounter.count <= 0).delete(synchronize_session=False)
+
+
+def record(db, before=(), after=()):
+    """
+    Move the counters from the books' old state (snapshots taken before the change; empty for new books)
+    to their new state (books or dicts after the change; empty for deleted books).
+    """
+    db.flush()
+    deltas = Counter()
+    for values in before:
+        deltas.subtract(contributions(values))
+    for book in after:
+        deltas.update(contributions(snapshot(book)))
+    _apply(db, deltas)
+
+
+def rebuild_stats(db):
+    """
+    Recount everything from the books table (first run, or after changes made outside the app).
+    """
+    counts = Counter()
+    columns = [getattr(Book, column) for column in STAT_COLUMNS]
+    for row in db.query(*columns).yield_per(1000):
+        counts.update(contributions(dict(zip(STAT_COLUMNS, row))))
+    db.query(StatCounter).delete(synchronize_session=False)
+    if counts:
+        db.bulk_insert_mappings(StatCounter, [
+            {"dimension": dimension, "key": key, "count": count} for (dimension, key), count in counts.items()
+        ])
+
+
+def init_stats(session_factory):
+    """
+    Fill the counters on first run (existing libraries).
+    """
+    db = session_factory()
+    try:
+        if db.query(StatCounter.key).first() is None and db.query(Book.isbn).first() is not None:
+            rebuild_stats(db)
+            db.commit()
+    finally:
+        db.close()
+
+
+def _dimension(db, dimension: str, limit: int = None) -> list:
+    query = db.query(StatCounter.key, StatCounter.count).filter(StatCounter.dimension == dimension)
+    if limit:
+        query = query.order_by(StatCounter.count.desc(), StatCounter.key).limit(limit)
+    else:
+        query = query.order_by(StatCounter.key)
+    return query.all()
+
+
+def get_stats(db, top: int = DEFAULT_TOP) -> dict:
+    """
+    Totals, per-status counts, monthly histograms, top authors/series/labels/borrowers and lending.
+    """
+    def count(dimension: str, key: str) -> int:
+        value = db.query(StatCounter.count).filter(
+            StatCounter.dimension == dimension, StatCounter.key == key
+        ).scalar()
+        return value or 0
+
+    this_month = datetime.now().strftime("%Y-%m")
+    overdue = db.query(func.count(Book.isbn)).filter(
+        Book.lent_to.isnot(None), Book.due_date < datetime.now()
+    ).scalar()
+
+    return {
+        "total": count("total", ""),
+        "by_status": dict(_dimension(db, "status")),
+        "added_this_month": count("added_month", this_month),
+        "finished_this_month": count("finished_month", this_month),
+        "monthly": {
+            "added": dict(_dimension(db, "added_month")),
+            "started": dict(_dimension(db, "started_month")),
+            "finished": dict(_dimension(db, "finished_month")),
+        },
+        "top": {
+            dimension: [{"name": key, "count": n} for key, n in _dimension(db, dimension, limit=top)]
+            for dimension in TOP_DIMENSIONS
+        },
+        "lending": {
+            "lent": count("lending", "lent"),
+            "overdue": overdue,
+        },
+    }
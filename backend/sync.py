@@ -0,0 +1,97 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from sqlalchemy import func
+from database import Book, DeletedBook
+
+# Incremental sync: clients keep the token from their last fetch and ask for what changed since.
+# The window re-sends rows changed shortly before the token, to cover transactions that were
+# still open (not yet visible) when the previous sync ran. Re-sent rows are plain upserts.
+SYNC_SAFETY_WINDOW = timedelta(seconds=int(os.getenv("SYNC_SAFETY_WINDOW", "5")))
+
+# Tombstones older than this are pruned; clients that last synced before that must re-fetch everything
+TOMBSTONE_RETENTION = timedelta(days=int(os.getenv("TOMBSTONE_RETENTION_DAYS", "90")))
+
+
+def make_sync_token(moment: datetime = None) -> str:
+    """
+    Opaque sync token for the given moment (defaults to now).
+    """
+    return (moment or datetime.now()).strftime("%Y%m%d%H%M%S%f")
+
+
+def parse_sync_token(token: str) -> datetime:
+    """
+    Parse a token produced by make_sync_token. Raises ValueError if malformed.
+    """
+    return datetime.strptime(token, "%Y%m%d%H%M%S%f")
+
+
+def record_deletion(db, isbn: str):
+    """
+    Leave a tombstone for a deleted book (call in the same transaction as the delete).
+    """
+    tombstone = db.get(DeletedBook, isbn)
+    if tombstone:
+        tombstone.deleted_at = datetime.now()
+    else:
+        db.add(DeletedBook(isbn=isbn, deleted_at=datetime.now()))
+
+
+def clear_deletion(db, isbns):
+    """
+    Drop tombstones of books that are being registered again.
+    """
+    isbns = list(isbns)
+    if isbns:
+        db.query(DeletedBook).filter(DeletedBook.isbn.in_(isbns)).delete(synchronize_session=False)
+
+
+def prune_tombstones(db):
+    cutoff = datetime.now() - TOMBSTONE_RETENTION
+    db.query(DeletedBook).filter(DeletedBook.deleted_at < cutoff).delete(synchronize_session=False)
+
+
+def get_changes(db, since: datetime) -> dict:
+    """
+    Books added/updated and ISBNs deleted since the given moment.
+    Returns full_resync=True when tombstones that old may already be pruned.
+    """
+    now = datetime.now()
+    token = make_sync_token(now)
+    if since < now - TOMBSTONE_RETENTION:
+        return {"token": token, "full_resync": True, "upserted": [], "deleted": []}
+
+    window_start = since - SYNC_SAFETY_WINDOW
+    upserted = db.query(Book).filter(Book.updated_at >= window_start).order_by(Book.updated_at).all()
+    deleted = [
+        row[0] for row in db.query(DeletedBook.isbn).filter(DeletedBook.deleted_at >= window_start).all()
+    ]
+    return {"token": token, "full_resync": False, "upserted": upserted, "deleted": deleted}
+
+
+def library_version(db):
+    """
+    Cheap fingerprint of the whole library: (book count, latest update, latest deletion).
+    """
+    count, last_updated = db.query(func.count(Book.isbn), func.max(Book.updated_at)).one()
+    last_deleted = db.query(func.max(DeletedBook.deleted_at)).scalar()
+    return count, last_updated, last_deleted
+
+
+def make_etag(version, query_string: str = "") -> str:
+    digest = hashlib.sha1(f"{version!r}|{query_string}".encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def last_modified(version):
+    """
+    HTTP-date for the Last-Modified header, or None for an empty library.
+    """
+    _, last_updated, last_deleted = version
+    moments = [m for m in (last_updated, last_deleted) if m]
+    if not moments:
+        return None
+    # Timestamps are stored as naive local time
+    return format_datetime(max(moments).astimezone(timezone.utc), usegmt=True)
@@ -0,0 +1,126 @@
+from sqlalchemy import func, select
+from database import Book, Tag, BookTag, lock_keys
+
+# Book.tags keeps the comma-separated string the frontend edits.
+# The tags/book_tags tables mirror it so tag filters and facet counts are index lookups.
+
+
+def parse_tags(tags_str: str) -> list:
+    """
+    Split a comma-separated tag string into unique, trimmed tag names (order preserved).
+    """
+    if not tags_str:
+        return []
+    names = []
+    for name in tags_str.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _get_or_create_tag_ids(db, names: list) -> dict:
+    if not names:
+        return {}
+    # Two workers creating the same new tag: the second waits, then finds it
+    lock_keys(db, "tag", names)
+    existing = dict(db.query(Tag.name, Tag.id).filter(Tag.name.in_(names)).all())
+    for name in names:
+        if name not in existing:
+            tag = Tag(name=name)
+            db.add(tag)
+            db.flush()
+            existing[name] = tag.id
+    return existing
+
+
+def sync_book_tags(db, isbn: str, tags_str: str):
+    """
+    Make book_tags for one book match its comma-separated tags string.
+    """
+    names = parse_tags(tags_str)
+    wanted = set(_get_or_create_tag_ids(db, names).values())
+    current = {row[0] for row in db.query(BookTag.tag_id).filter(BookTag.book_isbn == isbn).all()}
+
+    removed = current - wanted
+    if removed:
+        db.query(BookTag).filter(BookTag.book_isbn == isbn, BookTag.tag_id.in_(removed)).delete(synchronize_session=False)
+    for tag_id in wanted - current:
+        db.add(BookTag(book_isbn=isbn, tag_id=tag_id))
+    db.flush()
+
+    _delete_orphan_tags(db, removed)
+
+
+def add_book_tags(db, tags_by_isbn: dict):
+    """
+    Link tags of many newly inserted books at once ({isbn: comma-separated tags}).
+    """
+    names_by_isbn = {isbn: parse_tags(tags_str) for isbn, tags_str in tags_by_isbn.items()}
+    all_names = list(dict.fromkeys(name for names in names_by_isbn.values() for name in names))
+    tag_ids = _get_or_create_tag_ids(db, all_names)
+    links = [
+        {"book_isbn": isbn, "tag_id": tag_ids[name]}
+        for isbn, names in names_by_isbn.items() for name in names
+    ]
+    if links:
+        db.execute(BookTag.__table__.insert(), links)
+
+
+def remove_book_tags(db, isbn: str):
+    """
+    Drop tag links of a deleted book (SQLite doesn't enforce ON DELETE CASCADE by default).
+    """
+    tag_ids = {row[0] for row in db.query(BookTag.tag_id).filter(BookTag.book_isbn == isbn).all()}
+    db.query(BookTag).filter(BookTag.book_isbn == isbn).delete(synchronize_session=False)
+    db.flush()
+    _delete_orphan_tags(db, tag_ids)
+
+
+def _delete_orphan_tags(db, tag_ids):
+    if not tag_ids:
+        return
+    still_used = {
+        row[0] for row in db.query(BookTag.tag_id).filter(BookTag.tag_id.in_(tag_ids)).distinct().all()
+    }
+    orphans = set(tag_ids) - still_used
+    if orphans:
+        db.query(Tag).filter(Tag.id.in_(orphans)).delete(synchronize_session=False)
+
+
+def tag_filter(query, names: list, mode: str = "and"):
+    """
+    Restrict a query on Book to books having all (mode="and") or any (mode="or") of the tags.
+    """
+    if not names:
+        return query
+    return query.filter(Book.isbn.in_(tagged_isbns(names, mode)))
+
+
+def tagged_isbns(names: list, mode: str = "and"):
+    """
+    Subquery of ISBNs tagged with all/any of the given tag names.
+    """
+    subquery = (
+        select(BookTag.book_isbn)
+        .join(Tag, Tag.id == BookTag.tag_id)
+        .where(Tag.name.in_(names))
+        .group_by(BookTag.book_isbn)
+    )
+    if mode == "and":
+        subquery = subquery.having(func.count(func.distinct(BookTag.tag_id)) == len(set(names)))
+    return subquery
+
+
+def tag_facets(db, status: str = None, limit: int = None) -> list:
+    """
+    Tags with the number of books carrying each, most used first.
+    """
+    count = func.count(BookTag.book_isbn).label("count")
+    query = db.query(Tag.name, count).join(BookTag, BookTag.tag_id == Tag.id)
+    if status:
+        query = query.join(Book, Book.isbn == BookTag.book_isbn).filter(Book.status == status)
+    query = query.group_by(Tag.id, Tag.name).order_by(count.desc(), Tag.name)
+    if limit:
+        query = query.limit(limit)
+    return [{"name": name, "count": n} for name, n in query.all()]
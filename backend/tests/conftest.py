@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend modules read their settings at import time: point every store at a scratch directory
+# before any of them is imported, and make them importable as top-level modules like in the app.
+_scratch = tempfile.mkdtemp(prefix="library-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_scratch, 'library.db')}",
+    "METADATA_CACHE_PATH": os.path.join(_scratch, "metadata_cache.db"),
+    "PROVIDER_STATE_PATH": os.path.join(_scratch, "provider_state.db"),
+    "COVER_STORE_DIR": os.path.join(_scratch, "covers"),
+    "OPENBD_MIRROR_ENABLED": "0",
+    "ENRICHMENT_WORKERS": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402  (after the settings above)
+
+
+@pytest.fixture
+def library():
+    """
+    Empty library tables for the test (the scratch database is shared by the whole session).
+    """
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from book_query import SORT_KEYS
+from database import Book, SessionLocal
+
+pytestmark = pytest.mark.usefixtures("library")
+
+
+def _add_books():
+    # Two groups that tie on every sort key, so only the isbn tie-breaker separates them
+    db = SessionLocal()
+    for i in range(7):
+        db.add(Book(
+            isbn=f"978400000000{i}", title="同じ題名" if i < 4 else "別の題名",
+            authors=None if i % 2 else "著者", series_title=None, volume_number=None,
+            created_at=datetime(2024, 1, 1 if i < 4 else 2),
+        ))
+    db.commit()
+    db.close()
+
+
+def _page_through(client, sort: str, limit: int) -> list:
+    isbns = []
+    params = {"sort": sort, "limit": limit, "fields": "isbn"}
+    while True:
+        response = client.get("/books", params=params)
+        assert response.status_code == 200
+        page = [book["isbn"] for book in response.json()]
+        assert 0 < len(page) <= limit
+        isbns += page
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return isbns
+        params["cursor"] = cursor
+
+
+@pytest.mark.parametrize("sort", sorted(SORT_KEYS))
+def test_pages_through_ties_on_the_sort_key(sort):
+    _add_books()
+    client = TestClient(main.app)
+    everything = [book["isbn"] for book in client.get("/books", params={"sort": sort, "fields": "isbn"}).json()]
+    assert len(everything) == 7
+
+    for limit in (1, 2, 3):
+        assert _page_through(client, sort, limit) == everything
+
+
+def test_ties_follow_the_sort_direction_on_isbn():
+    _add_books()
+    isbns = _page_through(TestClient(main.app), "created_desc", 2)
+    assert isbns == [f"978400000000{i}" for i in (6, 5, 4, 3, 2, 1, 0)]
+
+
+def test_bad_cursor_is_rejected():
+    response = TestClient(main.app).get("/books", params={"sort": "title_asc", "limit": 2, "cursor": "not-a-cursor"})
+    assert response.status_code == 400
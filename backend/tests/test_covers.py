@@ -0,0 +1,114 @@
+import asyncio
+import os
+import socket
+
+import httpx
+import pytest
+
+import covers
+import http_client
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(covers, "COVER_STORE_DIR", str(tmp_path / "covers"))
+    return tmp_path
+
+
+def _serve(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+
+
+def _resolve(monkeypatch, hosts: dict):
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in hosts:
+            raise socket.gaierror(f"unknown host {host}")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (hosts[host], port))]
+    monkeypatch.setattr(covers.socket, "getaddrinfo", getaddrinfo)
+
+
+@pytest.mark.parametrize("isbn", ["../../../../tmp/evil", "..", "9784088831/../x", "", "978-4-08-883123-4/.."])
+def test_ref_path_rejects_non_isbn(store, isbn):
+    with pytest.raises(covers.CoverNotFound):
+        covers._ref_path(isbn)
+
+
+@pytest.mark.parametrize("isbn", ["9784088831234", "4-08-883123-X", "978-4-08-883123-4"])
+def test_ref_path_stays_in_store(store, isbn):
+    path = covers._ref_path(isbn)
+    assert os.path.dirname(path) == os.path.join(covers.COVER_STORE_DIR, "refs")
+
+
+def test_ensure_cover_writes_nothing_for_traversal_isbn(store):
+    with pytest.raises(covers.CoverNotFound):
+        asyncio.run(covers.ensure_cover("../../evil", "https://covers.example/a.jpg"))
+    assert not any(path.name.startswith("evil") for path in store.rglob("*"))
+    covers.remove_cover_ref("../../evil")
+
+
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd",
+    "ftp://covers.example/a.jpg",
+    "http://127.0.0.1/a.jpg",
+    "http://10.1.2.3/a.jpg",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/a.jpg",
+    "http://[::ffff:192.168.0.1]/a.jpg",
+])
+def test_check_url_refuses_local_targets(url):
+    with pytest.raises(covers.CoverNotFound):
+        asyncio.run(covers.check_url(url))
+
+
+def test_redirect_to_private_host_is_not_followed(store, monkeypatch):
+    _resolve(monkeypatch, {"public.example": "93.184.216.34", "internal.example": "10.0.0.5"})
+    requested = []
+
+    def handler(request):
+        requested.append(request.url.host)
+        if request.url.host == "public.example":
+            return httpx.Response(302, headers={"location": "http://internal.example/admin"})
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, content=b"secret")
+
+    _serve(monkeypatch, handler)
+    with pytest.raises(covers.CoverNotFound):
+        asyncio.run(covers._download("http://public.example/cover.jpg"))
+    assert requested == ["public.example"]
+
+
+def test_download_follows_public_redirect(store, monkeypatch):
+    _resolve(monkeypatch, {"a.example": "93.184.216.34", "b.example": "93.184.216.35"})
+
+    def handler(request):
+        if request.url.host == "a.example":
+            return httpx.Response(301, headers={"location": "http://b.example/real.jpg"})
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, content=b"jpeg")
+
+    _serve(monkeypatch, handler)
+    assert asyncio.run(covers._download("http://a.example/cover.jpg")) == (b"jpeg", "image/jpeg")
+
+
+def test_download_stops_reading_past_max_bytes(store, monkeypatch):
+    _resolve(monkeypatch, {"big.example": "93.184.216.34"})
+    monkeypatch.setattr(covers, "COVER_MAX_BYTES", 1000)
+    sent = []
+
+    async def body():
+        for _ in range(100):
+            sent.append(1)
+            yield b"x" * 500
+
+    # No Content-Length: the limit has to be enforced while reading
+    _serve(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "image/jpeg"}, content=body()))
+    with pytest.raises(covers.CoverNotFound, match="too large"):
+        asyncio.run(covers._download("http://big.example/huge.jpg"))
+    assert len(sent) < 10
+
+
+def test_download_refuses_declared_oversize(store, monkeypatch):
+    _resolve(monkeypatch, {"big.example": "93.184.216.34"})
+    monkeypatch.setattr(covers, "COVER_MAX_BYTES", 10)
+    _serve(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "image/jpeg"}, content=b"x" * 100))
+    with pytest.raises(covers.CoverNotFound, match="too large"):
+        asyncio.run(covers._download("http://big.example/huge.jpg"))
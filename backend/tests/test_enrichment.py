@@ -0,0 +1,80 @@
+import pytest
+
+import enrichment
+import migrations
+import stats
+from bookshelf import OTHER, get_shelves, refresh_series
+from database import Book, EnrichmentJob, ReadSessionLocal, SessionLocal, StatCounter
+from utils import combine_book_data
+
+pytestmark = pytest.mark.usefixtures("library")
+
+
+def _register_pending(isbn: str) -> int:
+    db = SessionLocal()
+    book = Book(**combine_book_data({"isbn": isbn, "status": "unread"}), enrichment_status="pending")
+    db.add(book)
+    enrichment.enqueue(db, isbn)
+    refresh_series(db, [book.series_title])
+    db.commit()
+    job_id = db.query(EnrichmentJob.id).filter(EnrichmentJob.isbn == isbn).scalar()
+    db.close()
+    return job_id
+
+
+def _shelves() -> dict:
+    db = ReadSessionLocal()
+    try:
+        return {shelf["series_title"]: shelf["volume_count"] for shelf in get_shelves(db)}
+    finally:
+        db.close()
+
+
+def test_placeholder_gets_no_series():
+    data = combine_book_data({"isbn": "9784000000001"})
+    assert data["title"] == enrichment.PENDING_TITLE
+    assert data.get("series_title") is None
+
+
+def test_pending_book_is_on_no_shelf_until_enriched():
+    job_id = _register_pending("9784000000001")
+    assert _shelves() == {}
+
+    enrichment.complete_job(job_id, "9784000000001", {"title": "魔法科高校の劣等生 (3)"})
+    assert _shelves() == {"魔法科高校の劣等生": 1}
+    db = ReadSessionLocal()
+    book = db.get(Book, "9784000000001")
+    db.close()
+    assert book.series_title == "魔法科高校の劣等生"
+    assert book.volume_number == 3
+
+
+def test_failed_book_lands_on_the_other_shelf():
+    job_id = _register_pending("9784000000001")
+    job = enrichment.claim_job()
+    assert job[0] == job_id
+    assert enrichment.fail_job(job_id, "9784000000001", enrichment.ENRICHMENT_MAX_ATTEMPTS, "No metadata found") == "failed"
+    assert _shelves() == {OTHER: 1}
+
+
+def test_old_placeholder_series_is_cleared():
+    db = SessionLocal()
+    book = Book(isbn="9784000000001", title=enrichment.PENDING_TITLE, series_title=enrichment.PENDING_TITLE,
+                status="unread", enrichment_status="failed")
+    db.add(book)
+    refresh_series(db, [book.series_title])
+    stats.record(db, after=[book])
+    db.commit()
+    updated_at = book.updated_at
+
+    assert migrations.clear_placeholder_series(db) == 1
+    db.commit()
+    assert book.series_title is None
+    assert book.updated_at != updated_at
+    db.close()
+    assert _shelves() == {OTHER: 1}
+    db = ReadSessionLocal()
+    try:
+        assert db.query(StatCounter).filter(StatCounter.dimension == "series").all() == []
+    finally:
+        db.close()
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import openbd_mirror
+import utils
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    monkeypatch.setattr(openbd_mirror, "MIRROR_PATH", os.path.join(tmp_path, "mirror.db"))
+    monkeypatch.setattr(openbd_mirror, "_conn", None)
+    requests = []
+
+    def get_json(provider, url, params=None, timeout=None):
+        requests.append((url, params))
+        if url == openbd_mirror.OPENBD_COVERAGE_URL:
+            return ["9784000000001", "9784000000002"]
+        return [
+            {"summary": {"isbn": isbn, "title": "本"}} if isbn == "9784000000001" else None
+            for isbn in params["isbn"].split(",")
+        ]
+
+    monkeypatch.setattr(openbd_mirror.provider_client, "get_json", get_json)
+    yield requests
+    openbd_mirror._conn.close()
+
+
+def test_lookups_and_refresh_share_the_endpoint_setting():
+    assert openbd_mirror.OPENBD_API_URL == utils.OPENBD_API_URL
+    assert openbd_mirror.OPENBD_COVERAGE_URL.endswith("/coverage")
+
+
+def test_null_answers_are_not_fetched_again(mirror):
+    first = openbd_mirror.refresh()
+    assert first["missing"] == 2
+    assert openbd_mirror.stats()["records"] == 1
+    assert openbd_mirror.stats()["missing"] == 1
+
+    mirror.clear()
+    second = openbd_mirror.refresh()
+    assert second["missing"] == 0
+    assert [url for url, _ in mirror] == [openbd_mirror.OPENBD_COVERAGE_URL]
+
+
+def test_stale_null_answers_are_fetched_again(mirror):
+    openbd_mirror.refresh()
+    mirror.clear()
+    result = openbd_mirror.refresh(stale_days=0)
+    assert result["stale"] == 2
+    assert sorted(mirror[1][1]["isbn"].split(",")) == ["9784000000001", "9784000000002"]
@@ -0,0 +1,14 @@
+import profiling
+
+
+def test_profiles_refused_without_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", None)
+    assert not profiling.authorized(None)
+    assert not profiling.authorized("anything")
+
+
+def test_profiles_need_the_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "s3cret")
+    assert profiling.authorized("s3cret")
+    assert not profiling.authorized("wrong")
+    assert not profiling.authorized(None)
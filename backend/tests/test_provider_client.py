@@ -0,0 +1,109 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+import pytest
+
+import provider_client
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._body = body if body is not None else {"ok": True}
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture(autouse=True)
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr(provider_client, "STATE_PATH", str(tmp_path / "provider_state.db"))
+    monkeypatch.setattr(provider_client, "_conn", None)
+    # 20 tokens/second, bucket of one: a caller without a token waits about 50ms
+    monkeypatch.setitem(provider_client.PROVIDER_LIMITS, "test", (20.0, 1.0))
+    monkeypatch.setattr(provider_client, "MAX_RETRIES", 0)
+    yield
+    if provider_client._conn is not None:
+        provider_client._conn.close()
+
+
+def _set_state(tokens: float, failures: int, open_until: float):
+    conn = provider_client._get_conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO provider_state (provider, tokens, refilled_at, failures, open_until) VALUES (?, ?, ?, ?, ?)",
+        ("test", tokens, time.time(), failures, open_until),
+    )
+
+
+def _failures() -> int:
+    return provider_client._get_conn().execute(
+        "SELECT failures FROM provider_state WHERE provider = 'test'"
+    ).fetchone()[0]
+
+
+def test_breaker_opens_after_threshold(monkeypatch):
+    monkeypatch.setattr(provider_client.requests, "get", lambda *a, **k: FakeResponse(503))
+    for _ in range(provider_client.FAILURE_THRESHOLD):
+        assert provider_client.get_json("test", "http://provider.example") is None
+    assert _failures() == provider_client.FAILURE_THRESHOLD
+    calls = []
+    monkeypatch.setattr(provider_client.requests, "get", lambda *a, **k: calls.append(1) or FakeResponse())
+    assert provider_client.get_json("test", "http://provider.example") is None
+    assert calls == []
+
+
+def test_half_open_trial_waits_for_token_and_probes(monkeypatch):
+    # Cool-down over, but the bucket is empty: the trial caller has to wait for a token first
+    _set_state(0.0, provider_client.FAILURE_THRESHOLD, time.time() - 1)
+    calls = []
+    monkeypatch.setattr(provider_client.requests, "get", lambda *a, **k: calls.append(1) or FakeResponse())
+
+    assert provider_client.get_json("test", "http://provider.example") == {"ok": True}
+    assert calls == [1]
+    assert _failures() == 0
+
+
+def test_half_open_admits_a_single_trial(monkeypatch):
+    _set_state(1.0, provider_client.FAILURE_THRESHOLD, time.time() - 1)
+    budget_end = time.time() + 5
+    assert provider_client._before_request("test", budget_end) is None
+    # Everyone else is kept out until the trial reports back
+    assert provider_client._before_request("test", budget_end) is False
+
+
+def test_async_half_open_trial_waits_for_token_and_probes():
+    _set_state(0.0, provider_client.FAILURE_THRESHOLD, time.time() - 1)
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.host)
+        return httpx.Response(200, json={"ok": True})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await provider_client.get_json_async(client, "test", "http://provider.example/")
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert calls == ["provider.example"]
+    assert _failures() == 0
+
+
+def test_locked_state_database_lets_the_request_through(monkeypatch):
+    provider_client._get_conn()
+    # Another process holds the write lock longer than this connection waits
+    monkeypatch.setattr(provider_client, "_conn", sqlite3.connect(
+        provider_client.STATE_PATH, check_same_thread=False, isolation_level=None, timeout=0.05
+    ))
+    other = sqlite3.connect(provider_client.STATE_PATH, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    monkeypatch.setattr(provider_client.requests, "get", lambda *a, **k: FakeResponse())
+    try:
+        assert provider_client.get_json("test", "http://provider.example") == {"ok": True}
+        assert provider_client._stats["test"]["state_error"] == 2
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert not provider_client._conn.in_transaction
@@ -0,0 +1,99 @@
+import pytest
+from sqlalchemy import text
+
+import database
+import search
+from book_query import apply_book_filters
+from database import Book, ReadSessionLocal, SessionLocal
+
+
+@pytest.fixture(autouse=True)
+def search_index(library):
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS books_fts"))
+        conn.execute(text("DROP TABLE IF EXISTS books_fts_keys"))
+    search.init_search_index(database.engine)
+    assert search._fts_available
+
+
+def _add(*books):
+    db = SessionLocal()
+    db.add_all(books)
+    db.commit()
+    db.close()
+
+
+def _search(query: str) -> dict:
+    db = ReadSessionLocal()
+    try:
+        return search.search_books(db, query)
+    finally:
+        db.close()
+
+
+def test_fts_highlights_are_escaped():
+    _add(Book(isbn="9784000000001", title="<script>alert(1)</script> 魔法使いの旅", authors="A & B"))
+    result = _search("魔法使い")["results"][0]
+    assert result["highlights"]["title"] == (
+        "&lt;script&gt;alert(1)&lt;/script&gt; <mark>魔法使い</mark>の旅"
+    )
+    assert result["highlights"]["authors"] == "A &amp; B"
+    assert "<script>" not in result["snippet"]
+
+
+def test_like_highlights_are_escaped():
+    _add(Book(isbn="9784000000001", title="<b>猫</b>の本"))
+    result = _search("猫")["results"][0]
+    assert result["highlights"]["title"] == "&lt;b&gt;<mark>猫</mark>&lt;/b&gt;の本"
+
+
+def test_index_follows_isbn_across_vacuum():
+    _add(*[Book(isbn=f"97840000000{i:02d}", title=f"ダミー書籍 {i}") for i in range(20)])
+    _add(Book(isbn="9784999999999", title="探している本"))
+    db = SessionLocal()
+    db.query(Book).filter(Book.title.like("ダミー%")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+    with database.engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+    results = _search("探している")["results"]
+    assert [r["isbn"] for r in results] == ["9784999999999"]
+
+    db = SessionLocal()
+    db.get(Book, "9784999999999").title = "見つけた本"
+    db.commit()
+    db.close()
+    assert _search("探している")["results"] == []
+    assert [r["isbn"] for r in _search("見つけた")["results"]] == ["9784999999999"]
+
+
+def test_old_external_content_index_is_replaced():
+    _add(Book(isbn="9784000000001", title="古い索引の本"))
+    with database.engine.begin() as conn:
+        for trigger in ("books_fts_ai", "books_fts_ad", "books_fts_au"):
+            conn.execute(text(f"DROP TRIGGER {trigger}"))
+        conn.execute(text("DROP TABLE books_fts"))
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE books_fts USING fts5(isbn UNINDEXED, title, "
+            "content='books', content_rowid='rowid', tokenize='trigram')"
+        ))
+    search.init_search_index(database.engine)
+    assert [r["isbn"] for r in _search("古い索引")["results"]] == ["9784000000001"]
+
+
+def test_like_fallback_matches_wildcards_literally():
+    _add(Book(isbn="9784000000001", title="100%の本"), Book(isbn="9784000000002", title="100円の本"),
+         Book(isbn="9784000000003", title="a_b"), Book(isbn="9784000000004", title="axb"))
+    assert [r["isbn"] for r in _search("0%")["results"]] == ["9784000000001"]
+    assert [r["isbn"] for r in _search("_")["results"]] == ["9784000000003"]
+
+
+def test_author_filter_matches_wildcards_literally():
+    _add(Book(isbn="9784000000001", title="本", authors="A_B"), Book(isbn="9784000000002", title="本", authors="AxB"))
+    db = ReadSessionLocal()
+    try:
+        isbns = [book.isbn for book in apply_book_filters(db.query(Book), author="a_b")]
+    finally:
+        db.close()
+    assert isbns == ["9784000000001"]
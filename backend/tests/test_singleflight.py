@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import http_client
+import provider_client
+import singleflight
+import utils
+from title_parser import SeriesTrie
+
+
+def _openbd_record(isbn: str) -> list:
+    return [{"summary": {"isbn": isbn, "title": "魔法科高校の劣等生 (1)", "author": "佐島勤", "cover": "http://c/1"}}]
+
+
+def test_concurrent_async_lookups_make_one_upstream_call(monkeypatch):
+    calls = []
+
+    async def get_json_async(client, provider, url, params=None, **kwargs):
+        calls.append(provider)
+        await asyncio.sleep(0.05)
+        return _openbd_record(params["isbn"]) if provider == "openbd" else None
+
+    monkeypatch.setattr(provider_client, "get_json_async", get_json_async)
+
+    async def run():
+        # Different series index objects (e.g. before and after a rebuild) still share the flight
+        return await asyncio.gather(
+            http_client.fetch_book_data_async("9784000000101", SeriesTrie()),
+            http_client.fetch_book_data_async("9784000000101", None),
+        )
+
+    executed = singleflight._stat("book")["executed"]
+    first, second = asyncio.run(run())
+    assert first == second
+    assert first["title"]
+    assert calls.count("openbd") == 1
+    assert singleflight._stat("book")["executed"] == executed + 1
+
+
+def test_concurrent_sync_lookups_make_one_upstream_call(monkeypatch):
+    calls = []
+    started = threading.Event()
+
+    def get_json(provider, url, params=None, **kwargs):
+        calls.append(provider)
+        started.set()
+        threading.Event().wait(0.05)
+        return _openbd_record(params["isbn"]) if provider == "openbd" else None
+
+    monkeypatch.setattr(provider_client, "get_json", get_json)
+    executed = singleflight._stat("book")["executed"]
+    results = []
+    threads = [
+        threading.Thread(target=lambda series=series: results.append(utils.fetch_book_data("9784000000102", series)))
+        for series in (SeriesTrie(), SeriesTrie())
+    ]
+    threads[0].start()
+    started.wait(1)
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+    assert results[0] == results[1]
+    assert calls.count("openbd") == 1
+    assert singleflight._stat("book")["executed"] == executed + 1
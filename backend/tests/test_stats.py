@@ -0,0 +1,58 @@
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import stats
+from database import ReadSessionLocal, SessionLocal, StatCounter
+
+pytestmark = pytest.mark.usefixtures("library")
+
+
+def _counters() -> Counter:
+    db = ReadSessionLocal()
+    try:
+        return Counter({(row.dimension, row.key): row.count for row in db.query(StatCounter) if row.count})
+    finally:
+        db.close()
+
+
+def _assert_matches_recount(client):
+    incremental = _counters()
+    served = client.get("/stats").json()
+    db = SessionLocal()
+    stats.rebuild_stats(db)
+    db.commit()
+    db.close()
+    assert incremental == _counters()
+    assert served == client.get("/stats").json()
+
+
+def test_counters_follow_create_update_and_delete():
+    client = TestClient(main.app)
+    for isbn, series in (("9784000000001", "シリーズA"), ("9784000000002", "シリーズA"), ("9784000000003", None)):
+        response = client.post("/books", json={
+            "isbn": isbn, "title": "本", "authors": "著者A", "series_title": series, "label": "レーベル",
+        })
+        assert response.status_code == 201
+    _assert_matches_recount(client)
+    assert client.get("/stats").json()["total"] == 3
+
+    response = client.put("/books/9784000000001", json={
+        "status": "read", "authors": "著者B", "series_title": "シリーズB",
+        "reading_start_date": "2024-03-01T00:00:00", "reading_end_date": "2024-04-02T00:00:00",
+        "lent_to": "友人",
+    })
+    assert response.status_code == 200
+    _assert_matches_recount(client)
+    assert client.get("/stats").json()["lending"]["lent"] == 1
+
+    response = client.put("/books/9784000000001", json={"lent_to": None, "reading_end_date": None, "status": "reading"})
+    assert response.status_code == 200
+    _assert_matches_recount(client)
+
+    assert client.delete("/books/9784000000002").status_code == 204
+    assert client.delete("/books/9784000000001").status_code == 204
+    _assert_matches_recount(client)
+    assert client.get("/stats").json()["total"] == 1
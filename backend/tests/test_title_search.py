@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+import http_client
+import main
+
+
+def test_one_failing_provider_does_not_fail_the_search(monkeypatch):
+    async def rakuten_get(params):
+        raise RuntimeError("unexpected payload")
+
+    async def google_get(params):
+        return {"items": [{"volumeInfo": {
+            "title": "本", "industryIdentifiers": [{"type": "ISBN_13", "identifier": "9784000000001"}],
+        }}]}
+
+    monkeypatch.setenv("RAKUTEN_APP_ID", "test")
+    monkeypatch.setattr(http_client, "rakuten_get", rakuten_get)
+    monkeypatch.setattr(http_client, "google_get", google_get)
+    response = TestClient(main.app).get("/search/title", params={"query": "本"})
+    assert response.status_code == 200
+    assert [book["isbn"] for book in response.json()] == ["9784000000001"]
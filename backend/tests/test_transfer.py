@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+
+import transfer
+from database import Book, ReadSessionLocal, SessionLocal
+
+
+@pytest.fixture(autouse=True)
+def hand_set_book(library):
+    db = SessionLocal()
+    db.add(Book(isbn="9784000000001", title="手動シリーズ (2)", series_title="手動シリーズ（自分で設定）",
+                volume_number=2, status="reading", notes="old notes"))
+    db.commit()
+    db.close()
+
+
+def _import(text: str, fmt: str = "csv", on_duplicate: str = "update") -> dict:
+    lines = list(transfer.import_books(io.BytesIO(text.encode("utf-8")), fmt, on_duplicate))
+    return json.loads(lines[-1])
+
+
+def _book(isbn: str) -> Book:
+    db = ReadSessionLocal()
+    try:
+        return db.get(Book, isbn)
+    finally:
+        db.close()
+
+
+def test_update_without_status_column_keeps_status_and_series():
+    report = _import("isbn,notes\n9784000000001,new notes\n")
+    assert report["updated"] == 1 and report["failed"] == 0
+    book = _book("9784000000001")
+    assert book.notes == "new notes"
+    assert book.status == "reading"
+    assert book.series_title == "手動シリーズ（自分で設定）"
+    assert book.volume_number == 2
+
+
+def test_update_with_title_does_not_rederive_series():
+    _import("isbn,title\n9784000000001,別のタイトル (3)\n")
+    book = _book("9784000000001")
+    assert book.title == "別のタイトル (3)"
+    assert book.series_title == "手動シリーズ（自分で設定）"
+    assert book.volume_number == 2
+
+
+def test_bookmeter_update_keeps_status():
+    _import("isbn,読了日\n9784000000001,2024/05/01\n", fmt="bookmeter")
+    book = _book("9784000000001")
+    assert book.status == "reading"
+    assert book.reading_end_date.year == 2024
+
+
+def test_update_writes_columns_present_in_row():
+    _import("isbn,status,series_title\n9784000000001,読了,新シリーズ\n")
+    book = _book("9784000000001")
+    assert book.status == "done"
+    assert book.series_title == "新シリーズ"
+
+
+def test_insert_gets_default_status_and_derived_series():
+    report = _import("isbn,title\n9784000000002,冒険の書 (1)\n", on_duplicate="skip")
+    assert report["created"] == 1
+    book = _book("9784000000002")
+    assert book.status == "unread"
+    assert book.series_title == "冒険の書"
+    assert book.volume_number == 1
+
+
+def test_bookmeter_insert_defaults_to_done():
+    _import("isbn,title\n9784000000003,読んだ本\n", fmt="bookmeter", on_duplicate="skip")
+    assert _book("9784000000003").status == "done"
+
+
+def test_skip_leaves_existing_book_alone():
+    report = _import("isbn,notes\n9784000000001,ignored\n", on_duplicate="skip")
+    assert report["skipped"] == 1
+    assert _book("9784000000001").notes == "old notes"
@@ -0,0 +1,538 @@
+import re
+import threading
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Title parsing engine: volume number, series title, subtitle and display title.
+# All patterns are compiled once at import and the pure per-title functions are memoized,
+# since the lookup pipeline, batch imports and re-normalization call them several times per book.
+# Results must stay identical to bench/reference_title_utils.py (checked by bench/bench_title_parser.py).
+
+# Full-width digits and dots -> half-width
+FULLWIDTH_TABLE = str.maketrans({
+    '０': '0', '１': '1', '２': '2', '３': '3', '４': '4',
+    '５': '5', '６': '6', '７': '7', '８': '8', '９': '9',
+    '．': '.', '。': '.'
+})
+
+# Volume number extraction patterns (ordered by priority)
+# Updated to support decimals (e.g., 8.5)
+VOLUME_PATTERNS = [
+    # Japanese patterns
+    r'[（(](\d+(?:\.\d+)?)[)）]',          # （1）, (8.5) - number only in parentheses
+    r'第(\d+(?:\.\d+)?)[巻話集号]',         # 第1巻, 第8.5巻
+    r'(\d+(?:\.\d+)?)[巻話集号]$',          # 1巻, 8.5巻 (at end)
+    r'[Vv][Oo][Ll]\.?\s*(\d+(?:\.\d+)?)',  # Vol.1, Vol.8.5
+    r'[#＃](\d+(?:\.\d+)?)',               # #1, #8.5
+    r'[【\[](\d+(?:\.\d+)?)[】\]]',         # 【1】, [8.5]
+    r'(?<!\d)\.\s*(\d+(?:\.\d+)?)',        # . 5, . 8.5 (with space or not) - Lower priority to avoid matching .5 in 13.5
+    r'\s+(\d+(?:\.\d+)?)$',                # "Title 1", "Title 8.5" (number at end)
+    r'\s+(\d{1,3}(?:\.\d+)?)\s+',          # "Title 1 Subtitle" (number in middle, max 3 digits)
+]
+VOLUME_REGEXES = [re.compile(p) for p in VOLUME_PATTERNS]
+
+# Title stored for a book nothing is known about yet (lookup pending or found nothing).
+# It is not a real title: no series is derived from it.
+PLACEHOLDER_TITLE = "Unknown Title"
+
+# Label prefixes removed from titles
+TITLE_LABELS = ['GC NOVELS']
+
+ENGLISH_SUBTITLE_RE = re.compile(r'\s*[=＝]\s*[A-Za-z].*$')
+LEADING_VOLUME_RE = re.compile(r'^\s*\d+\s+')
+PAREN_SUBTITLE_RE = re.compile(r'\s*[（(][^）)]+[)）]\s*')
+BRACKET_PART_RE = re.compile(r'\s*[［\[][上中下前後][］\]]\s*')
+SIDE_STORY_RES = [
+    re.compile(p, re.IGNORECASE) for p in [
+        r'\s*APPEND.*$',
+        r'\s*SS.*$',
+        r'\s*Side\s*Story.*$',
+        r'\s*外伝.*$',
+    ]
+]
+# Volume number patterns and everything after them (anything after the volume number is a subtitle)
+VOLUME_SUFFIX_RES = [
+    re.compile(p) for p in [
+        r'\.\s*\d+.*$',                     # .1 ... -> remove all after
+        r'\s*第\d+[巻話集号].*$',            # 第1巻 ...
+        r'\s+\d+[巻話集号].*$',             # 1巻 ...
+        r'\s+\d+\s+.*$',                    # 1 Subtitle (digit followed by space and text)
+        r'\s*[Vv][Oo][Ll]\.?\s*\d+.*$',     # Vol.1 ...
+        r'\s*[#＃]\d+.*$',                  # #1 ...
+        r'\s*[【\[]\d+[】\]].*$',            # 【1】 ...
+    ]
+]
+TRAILING_NUMBER_RE = re.compile(r'\s+\d+$')
+WHITESPACE_RE = re.compile(r'\s+')
+TRAILING_PUNCT_RE = re.compile(r'[\s\.\-－―:：]+$')
+
+SERIES_TRAILING_NUMBER_RE = re.compile(r'\s*\d+(?:\.\d+)?$')
+SERIES_TRAILING_MARKER_RE = re.compile(r'\s*第?\d+[巻話集号]?$')
+
+# Existing series containing these are side stories, never a base series
+SIDE_STORY_KEYWORDS = ["番外編", "外伝", "短編", "特典", "SS", "スピンオフ"]
+
+# Labels that should NOT be used as series titles
+LABEL_KEYWORDS = [
+    "文庫", "コミックス", "BOOKS", "ノベルズ", "ノベルス",
+    "GC NOVELS", "GCノベルズ", "GC ノベルズ", "ＧＣノベルズ",
+    "電撃文庫", "角川文庫", "講談社文庫", "集英社文庫",
+    "MF文庫", "GA文庫", "ファンタジア文庫", "スニーカー文庫",
+    "富士見ファンタジア", "HJ文庫", "オーバーラップ文庫",
+]
+
+AUTHOR_BIRTH_YEAR_RE = re.compile(r'[,，\s]*\d{4}[-−–—]?\s*$')
+AUTHOR_PUBLISHERS = ['マイクロマガジン社', 'KADOKAWA', '講談社', '集英社', '小学館']
+
+# Decorated volume numbers removed from subtitles
+SUBTITLE_VOLUME_RES = [
+    re.compile(p) for p in [
+        r'\.\s*\d+(?:\.\d+)?',
+        r'[（(]\d+(?:\.\d+)?[)）]',
+        r'第\d+(?:\.\d+)?[巻話集号]',
+        r'\d+(?:\.\d+)?[巻話集号]',
+        r'[Vv][Oo][Ll]\.?\s*\d+(?:\.\d+)?',
+        r'[#＃]\d+(?:\.\d+)?',
+        r'[【\[]\d+(?:\.\d+)?[】\]]',
+        r'\s+\d+(?:\.\d+)?$', # Trailing number
+        r'GC NOVELS' # Label name
+    ]
+]
+LEADING_SUBTITLE_PUNCT_RE = re.compile(r'^[\s\.\-－:：]+')
+TRAILING_SUBTITLE_PUNCT_RE = re.compile(r'[\s\.\-－:：]+$')
+EMPTY_PARENS_RE = re.compile(r'[（(]\s*[)）]')
+LEFTOVER_DECIMAL_PARENS_RE = re.compile(r'[（(]\s*\d+\.\s*[)）]')
+
+CACHE_SIZE = 8192
+
+
+class ParsedTitle(NamedTuple):
+    normalized_title: str
+    volume_number: Optional[float]
+    series_title: str
+    subtitle: str
+    display_title: str
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def extract_volume_number(title: str) -> float | None:
+    """
+    Extract volume number from a book title.
+    Returns None if no volume number is found.
+    Supports integers and floats (e.g., 8.5).
+    """
+    if not title:
+        return None
+
+    # Normalize full-width characters for easier matching
+    normalized_title = title.translate(FULLWIDTH_TABLE)
+
+    for pattern in VOLUME_REGEXES:
+        match = pattern.search(normalized_title)
+        if match:
+            try:
+                return float(match.group(1))
+            except (ValueError, IndexError):
+                continue
+    return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_title(title: str) -> str:
+    """
+    Clean a book title to extract series name only.
+    Removes volume numbers, subtitles (both Japanese and English), and side story keywords.
+    """
+    if not title:
+        return title
+
+    cleaned = title
+
+    # Remove common label prefixes
+    for label in TITLE_LABELS:
+        cleaned = cleaned.replace(label, '')
+
+    # Remove volume number at the start (e.g. "10 Series Title")
+    cleaned = LEADING_VOLUME_RE.sub('', cleaned)
+
+    # Remove English subtitle patterns (= followed by English text)
+    cleaned = ENGLISH_SUBTITLE_RE.sub('', cleaned)
+
+    # Remove Japanese subtitles in parentheses (like 入学編 上, 夏休み編+1)
+    cleaned = PAREN_SUBTITLE_RE.sub('', cleaned)
+
+    # Remove square bracket patterns like ［上］, ［下］, [上], [下]
+    cleaned = BRACKET_PART_RE.sub('', cleaned)
+
+    # Remove side story keywords (APPEND, SS, etc.) and everything after
+    for pattern in SIDE_STORY_RES:
+        cleaned = pattern.sub('', cleaned)
+
+    # Remove volume number patterns and everything after them
+    for pattern in VOLUME_SUFFIX_RES:
+        cleaned = pattern.sub('', cleaned)
+
+    # Special case: "Title 15" (Digit at end or followed by text)
+    # Be careful not to cut "1984" or "2001 Space Odyssey"
+    # But for series extraction, usually a trailing number is a volume.
+    cleaned = TRAILING_NUMBER_RE.sub('', cleaned)
+
+    # Clean up extra whitespace
+    cleaned = WHITESPACE_RE.sub(' ', cleaned).strip()
+
+    # Remove trailing punctuation
+    cleaned = TRAILING_PUNCT_RE.sub('', cleaned).strip()
+
+    return cleaned
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_title(title: str) -> str:
+    """
+    Normalize a book title for display.
+    Removes English subtitles but keeps volume numbers and Japanese subtitles.
+    Also removes duplicate content that may appear in titles.
+    """
+    if not title:
+        return title
+
+    # Step 1: Remove English subtitles (anything after = sign)
+    normalized = ENGLISH_SUBTITLE_RE.sub('', title)
+
+    # Step 2: Remove duplicated text (e.g., "APPEND1 APPEND1" -> "APPEND1")
+    words = normalized.split()
+    seen = []
+    result_words = []
+    for word in words:
+        # Check if this word/phrase was just seen (handle "APPEND1 APPEND1")
+        if word not in seen or word.isdigit():
+            result_words.append(word)
+            seen.append(word)
+        # Reset seen list if word is significantly different (not a repeat)
+        if len(seen) > 3:
+            seen = seen[-3:]
+    normalized = ' '.join(result_words)
+
+    # Step 3: Clean up extra whitespace
+    normalized = WHITESPACE_RE.sub(' ', normalized).strip()
+
+    # Step 4: Clean trailing punctuation
+    normalized = TRAILING_PUNCT_RE.sub('', normalized).strip()
+
+    return normalized
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_series_title(series_title: str) -> str:
+    """
+    Clean a series title by removing trailing volume numbers.
+    For example: "新約とある魔術の禁書目録10" -> "新約とある魔術の禁書目録"
+    """
+    if not series_title:
+        return series_title
+
+    # Remove trailing digits (volume numbers)
+    cleaned = SERIES_TRAILING_NUMBER_RE.sub('', series_title)
+
+    # Remove trailing volume markers like 巻, 話, etc.
+    cleaned = SERIES_TRAILING_MARKER_RE.sub('', cleaned)
+
+    return cleaned.strip()
+
+
+def is_base_series_candidate(series: str) -> bool:
+    """
+    Check if an existing series name can ever be used as a base series, whatever the title.
+    """
+    # Skip if series is too short (likely garbage data)
+    if len(series) < 3:
+        return False
+
+    # Skip if series contains side-story indicators (these shouldn't be base series)
+    return not any(kw in series for kw in SIDE_STORY_KEYWORDS)
+
+
+def is_valid_base_series(series: str, title: str, cleaned: str) -> bool:
+    """
+    Check if an existing series name can be used as the base series for a title.
+    """
+    if not is_base_series_candidate(series):
+        return False
+
+    # Skip if series is the same as or very close to the title (garbage data)
+    if series == title or series == cleaned:
+        return False
+
+    # Skip if series length is more than 80% of title (likely full title as series)
+    return len(series) <= len(title) * 0.8
+
+
+class SeriesTrie:
+    """
+    Prefix tree of existing series titles, so the longest series a title starts with
+    is found in one walk over the title instead of testing every series.
+    Counts the books of each series: a series leaves the tree with its last book.
+    """
+
+    _END = ""  # Node key marking a complete series (never a single character)
+
+    def __init__(self, series=()):
+        self._root = {}
+        self._counts = {}
+        self._lock = threading.RLock()
+        for name in series:
+            self.add(name)
+
+    def add(self, series: str, count: int = 1):
+        if not series:
+            return
+        with self._lock:
+            if series in self._counts:
+                self._counts[series] += count
+                return
+            self._counts[series] = count
+            # Names that can never be a base series are counted but not indexed
+            if not is_base_series_candidate(series):
+                return
+            node = self._root
+            for char in series:
+                node = node.setdefault(char, {})
+            node[self._END] = series
+
+    def remove(self, series: str):
+        with self._lock:
+            count = self._counts.get(series)
+            if count is None:
+                return
+            if count > 1:
+                self._counts[series] = count - 1
+                return
+            del self._counts[series]
+
+            path = []
+            node = self._root
+            for char in series:
+                child = node.get(char)
+                if child is None:
+                    return
+                path.append((node, char))
+                node = child
+            node.pop(self._END, None)
+            # Drop branches no other series uses
+            for parent, char in reversed(path):
+                if parent[char]:
+                    break
+                del parent[char]
+
+    def prefixes(self, text: str) -> list:
+        """
+        Indexed series that text starts with, shortest first.
+        """
+        found = []
+        with self._lock:
+            node = self._root
+            for char in text:
+                node = node.get(char)
+                if node is None:
+                    break
+                if self._END in node:
+                    found.append(node[self._END])
+        return found
+
+    def longest_match(self, title: str, cleaned: str) -> str | None:
+        """
+        Longest valid base series that the title (or its cleaned form) starts with.
+        """
+        best = None
+        for text in (title, cleaned or ""):
+            for series in reversed(self.prefixes(text)):
+                if best is not None and len(series) <= len(best):
+                    break
+                if is_valid_base_series(series, title, cleaned):
+                    best = series
+                    break
+        return best
+
+    def __contains__(self, series) -> bool:
+        return series in self._counts
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._counts))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def series_from_api_title(series_from_api: str) -> str | None:
+    """
+    Series name from the API's series field, or None if it looks like a publisher label.
+    """
+    # Check if series_from_api contains any label keyword
+    for keyword in LABEL_KEYWORDS:
+        if keyword in series_from_api:
+            return None
+
+    # Also reject if series_from_api is very short (likely just a label abbreviation)
+    if len(series_from_api) <= 10 and series_from_api == series_from_api.upper():
+        return None
+
+    # Clean any trailing volume numbers from the API series
+    return clean_series_title(series_from_api) or None
+
+
+def extract_series_title(title: str, series_from_api: str = None, existing_series: list = None) -> str:
+    """
+    Get series title:
+    1. First try to match against existing series in the database
+    2. If no match, prefer API-provided series name
+    3. Fall back to cleaned title
+
+    Args:
+        title: The book title to extract series from
+        series_from_api: Series name provided by API (may be label name)
+        existing_series: Existing series titles from the database (SeriesTrie or list)
+    """
+    # Always try to clean the title first to get a candidate series name
+    cleaned = clean_title(title)
+
+    # Try to match against existing series first (if provided)
+    if isinstance(existing_series, SeriesTrie):
+        series = existing_series.longest_match(title, cleaned)
+        if series:
+            return series
+    elif existing_series:
+        valid_series = [s for s in existing_series if is_valid_base_series(s, title, cleaned)]
+
+        # Sort by length descending to match longest first (more specific)
+        for series in sorted(valid_series, key=len, reverse=True):
+            # Check if title starts with this series name
+            if title.startswith(series) or cleaned.startswith(series):
+                # Found a matching existing series!
+                return series
+
+    # If API provided a series title, check if it's better
+    if series_from_api:
+        api_series = series_from_api_title(series_from_api)
+        if api_series:
+            return api_series
+
+    return cleaned
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_author_name(author_str: str) -> str:
+    """
+    Clean up author name string.
+    Removes birth years, publisher names, and secondary authors (illustrators) if separated by /.
+    """
+    if not author_str:
+        return author_str
+
+    cleaned = author_str
+
+    # Take only the first author if multiple are separated by /
+    if '/' in cleaned:
+        cleaned = cleaned.split('/')[0]
+
+    # Remove birth year patterns like ",1975-" or " 1975-"
+    # Include various dash types and allow trailing whitespace
+    cleaned = AUTHOR_BIRTH_YEAR_RE.sub('', cleaned)
+
+    # Replace commas with space (Handle "Surname, Name" format)
+    cleaned = cleaned.replace(',', ' ').replace('，', ' ')
+
+    # Remove specific publisher names that might get mixed in (heuristic)
+    for pub in AUTHOR_PUBLISHERS:
+        cleaned = cleaned.replace(pub, '')
+
+    # Clean up extra whitespace
+    cleaned = WHITESPACE_RE.sub(' ', cleaned).strip()
+
+    return cleaned
+
+
+def _volume_display(volume_number: float) -> str:
+    vol_str = str(volume_number)
+    if vol_str.endswith(".0"):
+        vol_str = str(int(volume_number))
+    return vol_str
+
+
+@lru_cache(maxsize=256)
+def _exact_volume_re(vol_str: str):
+    # vol_str is used unescaped on purpose ("8.5" also matches "8_5"), as it always was
+    return re.compile(rf'\b{vol_str}\b')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def extract_subtitle(title: str, series_title: str, volume_number: float | None) -> str:
+    """
+    Subtitle part of a title: what remains after removing the series name and the decorated volume number.
+    """
+    # Extract subtitle by removing series name
+    subtitle = title.replace(series_title, "")
+
+    # Normalize full-width for cleaning
+    cleaned_subtitle = subtitle.translate(FULLWIDTH_TABLE)
+
+    # Remove volume number from subtitle if it exists
+    if volume_number is not None:
+        # Remove exact volume number
+        cleaned_subtitle = _exact_volume_re(_volume_display(volume_number)).sub('', cleaned_subtitle)
+
+        # Remove patterns like (10), . 5, etc.
+        for pattern in SUBTITLE_VOLUME_RES:
+            cleaned_subtitle = pattern.sub('', cleaned_subtitle)
+
+    # Clean up whitespace and punctuation
+    cleaned_subtitle = LEADING_SUBTITLE_PUNCT_RE.sub('', cleaned_subtitle)
+    cleaned_subtitle = TRAILING_SUBTITLE_PUNCT_RE.sub('', cleaned_subtitle)
+
+    # Remove empty parentheses
+    cleaned_subtitle = EMPTY_PARENS_RE.sub('', cleaned_subtitle)
+    # Remove leftover "13." type patterns inside parentheses if any
+    cleaned_subtitle = LEFTOVER_DECIMAL_PARENS_RE.sub('', cleaned_subtitle)
+
+    return cleaned_subtitle.strip()
+
+
+def compose_title(series_title: str, volume_number: float | None, subtitle: str) -> str:
+    """
+    Standard display format: "{Series} {Volume} {Subtitle}"
+    """
+    new_title = series_title
+    if volume_number is not None:
+        new_title += f" {_volume_display(volume_number)}"
+    if subtitle:
+        new_title += f" {subtitle}"
+    return new_title
+
+
+def format_book_title(title: str, series_title: str, volume_number: float | None) -> str:
+    """
+    Format book title to a standard format: "{Series} {Volume} {Subtitle}"
+    Removes decorations from volume number and cleans up subtitle.
+    """
+    if not title or not series_title:
+        return title
+    return compose_title(series_title, volume_number, extract_subtitle(title, series_title, volume_number))
+
+
+def parse_title(title: str, series_from_api: str = None, existing_series: list = None) -> ParsedTitle:
+    """
+    Run the whole pipeline for one title and return every derived part together:
+    normalized title, volume number, series title, subtitle and formatted display title.
+    """
+    normalized = normalize_title(title)
+    if not normalized:
+        return ParsedTitle(normalized, None, normalized, "", normalized)
+
+    volume = extract_volume_number(normalized)
+    series = extract_series_title(normalized, series_from_api, existing_series)
+    if not series:
+        return ParsedTitle(normalized, volume, series, "", normalized)
+
+    subtitle = extract_subtitle(normalized, series, volume)
+    return ParsedTitle(normalized, volume, series, subtitle, compose_title(series, volume, subtitle))
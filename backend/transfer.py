@@ -0,0 +1,416 @@
+import codecs
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import datetime
+from sqlalchemy import Boolean, DateTime, Float, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from database import SessionLocal, ReadSessionLocal, Book, EnrichmentJob
+from sync import clear_deletion
+from tags import add_book_tags, sync_book_tags
+from utils import combine_book_data
+from bookshelf import refresh_series
+import enrichment
+import series_index
+import stats
+
+# Bulk import (POST /import) and export (GET /export) of the whole library.
+# Both sides stream: the upload is spooled to a temp file and read row by row, rows are written
+# in batches (one executemany + commit per batch), and the export walks the table in chunks
+# of EXPORT_BATCH_SIZE rows. Memory use stays flat no matter how many books there are.
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Uploads larger than this are spooled to disk instead of memory
+IMPORT_SPOOL_BYTES = int(os.getenv("IMPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# At most this many row errors are listed in the final import report
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_FORMATS = ("csv", "ndjson", "booklog", "bookmeter")
+EXPORT_FORMATS = ("csv", "ndjson")
+
+COLUMNS = [column.name for column in Book.__table__.columns]
+EXPORT_COLUMNS = [name for name in COLUMNS if name != "enrichment_status"]
+IMPORT_COLUMNS = set(EXPORT_COLUMNS) - {"updated_at"}
+DATETIME_COLUMNS = {column.name for column in Book.__table__.columns if isinstance(column.type, DateTime)}
+FLOAT_COLUMNS = {column.name for column in Book.__table__.columns if isinstance(column.type, Float)}
+BOOLEAN_COLUMNS = {column.name for column in Book.__table__.columns if isinstance(column.type, Boolean)}
+
+# Header names used by other reading-log services (and common spellings) -> our column
+COLUMN_ALIASES = {
+    "isbn": ("isbn13", "isbn-13", "isbn/asin", "asin", "13桁isbn", "isbnコード"),
+    "title": ("タイトル", "書名", "書籍名"),
+    "authors": ("author", "著者", "著者名", "作者名"),
+    "publisher": ("出版社", "出版社名"),
+    "published_date": ("発売日", "出版日", "発行日", "発行年"),
+    "reading_start_date": ("読書開始日", "読み始めた日"),
+    "reading_end_date": ("読了日", "読み終わった日"),
+    "created_at": ("登録日", "登録日時"),
+    "notes": ("感想", "レビュー", "メモ", "読書メモ"),
+    "rating": ("評価",),
+    "tags": ("タグ",),
+    "status": ("読書状況", "ステータス", "状態"),
+}
+HEADER_NAMES = {name: name for name in COLUMNS}
+HEADER_NAMES.update({alias: column for column, aliases in COLUMN_ALIASES.items() for alias in aliases})
+
+# Reading states of other services -> our status values
+STATUS_ALIASES = {
+    "読みたい": "wishlist",
+    "いま読んでる": "reading",
+    "読んでる": "reading",
+    "読書中": "reading",
+    "読み終わった": "done",
+    "読んだ": "done",
+    "読了": "done",
+    "積読": "purchased_unread",
+    "積読本": "purchased_unread",
+    "中断": "paused",
+    "未設定": "unread",
+}
+STATUSES = {"wishlist", "ordered", "purchased_unread", "reading", "done", "paused", "unread"}
+
+# Booklog's export has no header row; fields by position
+BOOKLOG_COLUMNS = {
+    1: "_item_id",
+    2: "isbn",
+    4: "rating",
+    5: "status",
+    6: "notes",
+    7: "tags",
+    8: "_memo",
+    9: "created_at",
+    10: "reading_end_date",
+    11: "title",
+    12: "authors",
+    13: "publisher",
+    14: "published_date",
+}
+
+DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d", "%Y%m%d")
+
+
+async def receive_upload(chunks):
+    """
+    Spool an uploaded body (async iterator of bytes) to a temp file without holding it in memory.
+    """
+    upload = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in chunks:
+        upload.write(chunk)
+    upload.seek(0)
+    return upload
+
+
+def normalize_isbn(value: str) -> str:
+    """
+    ISBN-13 digits for an ISBN-10/13 in any notation (hyphens, spaces). Raises ValueError otherwise.
+    """
+    digits = re.sub(r"[^0-9Xx]", "", value or "").upper()
+    if len(digits) == 10:
+        body = "978" + digits[:9]
+        check = (10 - sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(body)) % 10) % 10
+        return body + str(check)
+    if len(digits) == 13 and digits.isdigit():
+        return digits
+    raise ValueError(f"Not an ISBN: {value!r}")
+
+
+def parse_datetime(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+
+def normalize_record(raw: dict) -> dict:
+    """
+    Turn one imported row (any supported format) into Book column values. Raises ValueError for bad rows.
+    Only the columns present in the row are returned (defaults are applied when inserting).
+    """
+    values = {}
+    for key, value in raw.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        values[key] = value
+
+    isbn = values.pop("isbn", None) or values.pop("_item_id", None)
+    record = {"isbn": normalize_isbn(str(isbn)) if isbn else None}
+    if not record["isbn"]:
+        raise ValueError("Missing ISBN")
+
+    # Booklog keeps a public review and a private memo
+    memo = values.pop("_memo", None)
+    if memo:
+        values["notes"] = f"{values['notes']}\n\n{memo}" if values.get("notes") else memo
+
+    for key, value in values.items():
+        if key not in IMPORT_COLUMNS:
+            continue
+        if key in DATETIME_COLUMNS:
+            value = parse_datetime(str(value))
+        elif key in FLOAT_COLUMNS:
+            value = float(value)
+        elif key in BOOLEAN_COLUMNS:
+            value = value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes")
+        elif key == "status":
+            value = STATUS_ALIASES.get(value, value)
+            if value not in STATUSES:
+                raise ValueError(f"Unknown status: {value!r}")
+        elif key == "rating":
+            value = str(value)
+            if value == "0":
+                continue
+        elif key == "tags":
+            if isinstance(value, list):
+                value = ",".join(map(str, value))
+            value = ",".join(tag.strip() for tag in re.split(r"[,、]", value) if tag.strip())
+        else:
+            value = str(value)
+        record[key] = value
+
+    return record
+
+
+def _open_text(upload):
+    """
+    Text view of an upload: UTF-8 (with or without BOM), falling back to Shift_JIS (cp932) as Excel and Booklog write it.
+    """
+    head = upload.read(65536)
+    upload.seek(0)
+    encoding = "utf-8-sig"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        encoding = "cp932"
+    return io.TextIOWrapper(upload, encoding=encoding, newline="")
+
+
+def iter_records(text, fmt: str):
+    """
+    Yield (row number, raw row dict) for each row of an upload; a row that can't be parsed yields its exception.
+    """
+    if fmt == "ndjson":
+        for number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                yield number, row if isinstance(row, dict) else ValueError("Not a JSON object")
+            except ValueError as e:
+                yield number, e
+        return
+
+    reader = csv.reader(text)
+    if fmt == "booklog":
+        for number, row in enumerate(reader, 1):
+            if not row:
+                continue
+            raw = {name: row[index] for index, name in BOOKLOG_COLUMNS.items() if index < len(row)}
+            # Tolerate a header row
+            if number == 1 and not re.search(r"\d", raw.get("isbn", "") + raw.get("_item_id", "")):
+                continue
+            yield number, raw
+        return
+
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [HEADER_NAMES.get(name.strip().lower(), HEADER_NAMES.get(name.strip())) for name in header]
+    if "isbn" not in columns:
+        raise ValueError("CSV header has no ISBN column")
+    for number, row in enumerate(reader, 2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield number, {column: cell for column, cell in zip(columns, row) if column}
+
+
+def _write_batch(db, records: list, on_duplicate: str, counts: dict, default_status: str = "unread") -> list:
+    """
+    Insert (or update) one batch of normalized records and commit. Returns ISBNs queued for enrichment.
+    New books get the default status and the derived series/volume; an existing book (on_duplicate="update")
+    only gets the columns present in its row, so a file without a status or series column leaves those alone.
+    """
+    by_isbn = {}
+    for record in records:
+        if record["isbn"] in by_isbn:
+            # Repeated within the batch: the first row wins
+            counts["skipped"] += 1
+        else:
+            by_isbn[record["isbn"]] = record
+    # ISBN -> stat columns (series, status, ...) of the books already in the library
+    stat_columns = [getattr(Book, column) for column in stats.STAT_COLUMNS]
+    existing = {
+        row[0]: dict(zip(stats.STAT_COLUMNS, row[1:]))
+        for row in db.query(Book.isbn, *stat_columns).filter(Book.isbn.in_(list(by_isbn))).all()
+    }
+
+    now = datetime.now()
+    inserts, updates, pending = [], [], []
+    for isbn, record in by_isbn.items():
+        if isbn in existing:
+            if on_duplicate != "update":
+                counts["skipped"] += 1
+                continue
+            # Normalized like new books (title, authors), without the derived columns the row doesn't have
+            data = {key: value for key, value in combine_book_data(record).items() if key in record}
+            data["updated_at"] = now
+            updates.append({key: value for key, value in data.items() if key in COLUMNS})
+            continue
+
+        data = combine_book_data({"status": default_status, **record})
+        if not record.get("title"):
+            data["enrichment_status"] = "pending"
+            pending.append(isbn)
+        data.setdefault("created_at", now)
+        data["updated_at"] = now
+        data.setdefault("is_series_representative", False)
+        inserts.append({column: data.get(column) for column in COLUMNS})
+
+    if inserts:
+        db.execute(Book.__table__.insert(), inserts)
+        add_book_tags(db, {row["isbn"]: row["tags"] for row in inserts if row["tags"]})
+        clear_deletion(db, [row["isbn"] for row in inserts])
+    if pending:
+        db.execute(EnrichmentJob.__table__.insert(), [
+            {"isbn": isbn, "status": "queued", "attempts": 0, "run_after": now, "created_at": now, "updated_at": now}
+            for isbn in pending
+        ])
+    if updates:
+        db.execute(update(Book), updates)
+        for data in updates:
+            if "tags" in data:
+                sync_book_tags(db, data["isbn"], data["tags"])
+    refresh_series(db, {row["series_title"] for row in inserts} | {
+        series
+        for data in updates
+        for series in (existing[data["isbn"]]["series_title"], data.get("series_title", existing[data["isbn"]]["series_title"]))
+    })
+    stats.record(
+        db,
+        before=[existing[data["isbn"]] for data in updates],
+        after=inserts + [{**existing[data["isbn"]], **data} for data in updates],
+    )
+    db.commit()
+
+    counts["created"] += len(inserts)
+    counts["updated"] += len(updates)
+    return pending
+
+
+def import_books(upload, fmt: str, on_duplicate: str = "skip"):
+    """
+    Import an uploaded file, yielding NDJSON progress lines (one per batch) and a final report.
+    on_duplicate: "skip" keeps books already in the library, "update" overwrites the imported fields.
+    """
+    counts = {"processed": 0, "created": 0, "updated": 0, "skipped": 0, "failed": 0}
+    errors = []
+    default_status = "done" if fmt == "bookmeter" else "unread"
+
+    def fail(number, error):
+        counts["failed"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": number, "error": str(error)})
+
+    def line(kind: str, **extra) -> str:
+        return json.dumps({"type": kind, **counts, **extra}, ensure_ascii=False) + "\n"
+
+    db = SessionLocal()
+    queued = False
+    try:
+        batch = []
+        batch_rows = []
+
+        def flush():
+            nonlocal queued
+            try:
+                queued = bool(_write_batch(db, batch, on_duplicate, counts, default_status)) or queued
+            except SQLAlchemyError as e:
+                db.rollback()
+                for number in batch_rows:
+                    fail(number, e)
+            batch.clear()
+            batch_rows.clear()
+
+        try:
+            for number, raw in iter_records(_open_text(upload), fmt):
+                counts["processed"] += 1
+                if isinstance(raw, Exception):
+                    fail(number, raw)
+                    continue
+                try:
+                    batch.append(normalize_record(raw))
+                    batch_rows.append(number)
+                except (ValueError, TypeError) as e:
+                    fail(number, e)
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    flush()
+                    yield line("progress")
+            if batch:
+                flush()
+        except (ValueError, csv.Error, UnicodeDecodeError) as e:
+            # The file itself is unreadable (bad header, broken quoting...): keep what was imported so far
+            if batch:
+                flush()
+            yield line("done", errors=errors, error=str(e))
+            return
+    finally:
+        db.close()
+        upload.close()
+        if counts["created"] or counts["updated"]:
+            series_index.invalidate()
+        if queued:
+            enrichment.notify()
+
+    yield line("done", errors=errors)
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_books(fmt: str):
+    """
+    Yield the whole library as CSV (with header, UTF-8 BOM for Excel) or NDJSON, EXPORT_BATCH_SIZE rows per chunk.
+    Reads one snapshot on the read pool, so writes go on while the export streams.
+    """
+    db = ReadSessionLocal()
+    try:
+        columns = [Book.__table__.c[name] for name in EXPORT_COLUMNS]
+        result = db.execute(
+            select(*columns).order_by(Book.isbn).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write("\ufeff")
+            writer.writerow(EXPORT_COLUMNS)
+            for rows in result.partitions():
+                writer.writerows([_export_value(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for rows in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, map(_export_value, row))), ensure_ascii=False) + "\n"
+                    for row in rows
+                )
+    finally:
+        db.close()
@@ -22,6 +22,7 @@ export default function Home() {
 
   const {
     books,
+    isSearchActive,
     groupedBooks,
     loading,
     message,
@@ -34,6 +35,7 @@ export default function Home() {
     setViewMode,
     fetchBooks,
     registerBook,
+    registerBooks,
     addBook,
     deleteBook,
     updateBook
@@ -185,9 +187,7 @@ export default function Home() {
   };
 
   const handleSeriesBulkRegister = async (isbns: string[]) => {
-    for (const isbn of isbns) {
-      await registerBook(isbn);
-    }
+    await registerBooks(isbns);
     setIsSeriesBulkOpen(false);
     setSeriesBulkBook(null);
   };
@@ -481,6 +481,8 @@ export default function Home() {
           <div className="animate-in fade-in duration-500">
             <BookshelfView
               books={filteredBooks}
+              status={statusFilter}
+              isSearchActive={isSearchActive}
               onBookClick={openEditModal}
             />
           </div>
@@ -3,6 +3,7 @@
 import { useState } from 'react';
 import Image from 'next/image';
 import { Book } from '@/types';
+import { localCoverUrl } from '@/utils/imageHelper';
 
 interface Book3DSpineProps {
   book: Book;
@@ -52,7 +53,7 @@ export function Book3DSpine({ book, onClick }: Book3DSpineProps) {
         >
           {book.cover_url && (
             <Image
-              src={book.cover_url}
+              src={localCoverUrl(book, 'thumb') ?? book.cover_url}
               alt={book.title}
               fill
               className="object-cover"
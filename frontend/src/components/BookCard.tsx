@@ -2,7 +2,7 @@
 
 import Image from 'next/image';
 import { Book } from '@/types';
-import { optimizeBookCover } from '@/utils/imageHelper';
+import { localCoverUrl } from '@/utils/imageHelper';
 
 interface BookCardProps {
   book: Book;
@@ -12,7 +12,7 @@ interface BookCardProps {
 }
 
 export function BookCard({ book, onDelete, onEdit, compact = false }: BookCardProps) {
-  const optimizedCover = optimizeBookCover(book.cover_url);
+  const optimizedCover = localCoverUrl(book, 'card');
 
   return (
     <div className="group relative flex flex-col">
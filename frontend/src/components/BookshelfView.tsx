@@ -1,10 +1,14 @@
 "use client";
 
-import { useState, useMemo } from 'react';
-import { Book } from '@/types';
+import { useState, useEffect, useMemo } from 'react';
+import axios from 'axios';
+import { Book, Shelf } from '@/types';
+import { localCoverUrl } from '@/utils/imageHelper';
 
 interface BookshelfViewProps {
   books: Book[];
+  status?: string | null;
+  isSearchActive?: boolean;
   onBookClick: (book: Book) => void;
 }
 
@@ -14,55 +18,63 @@ const deriveSeriesTitle = (book: Book): string => {
   if (book.series_title) {
     return book.series_title;
   }
-  const dotIndex = book.title.indexOf('.');
-  if (dotIndex !== -1) {
-    return book.title.substring(0, dotIndex).trim();
-  }
   return "Other";
 };
 
-export function BookshelfView({ books, onBookClick }: BookshelfViewProps) {
-  const [selectedSeries, setSelectedSeries] = useState<string | null>(null);
-
-  // シリーズごとにグルーピング
-  const seriesGroups = useMemo(() => {
-    const groups: Record<string, Book[]> = {};
-    books.forEach(book => {
-      const series = deriveSeriesTitle(book);
-      if (!groups[series]) groups[series] = [];
-      groups[series].push(book);
-    });
-    return groups;
-  }, [books]);
-
-  // 各シリーズの代表本を取得
-  const seriesRepresentatives = useMemo(() => {
-    const reps: Record<string, Book> = {};
-    Object.entries(seriesGroups).forEach(([series, seriesBooks]) => {
-      // is_series_representative=true の本を探す
-      let representative = seriesBooks.find(b => b.is_series_representative);
-
-      // なければ最小の volume_number の本
-      if (!representative) {
-        const withVolume = seriesBooks.filter(b => b.volume_number !== undefined && b.volume_number !== null);
-        if (withVolume.length > 0) {
-          representative = withVolume.sort((a, b) => (a.volume_number || 0) - (b.volume_number || 0))[0];
-        }
-      }
-
-      // それでもなければ最初の本
-      if (!representative) {
-        representative = seriesBooks[0];
-      }
+// 絞り込み中の本だけで棚を組み立てる（バックエンドの get_shelves と同じ集計・並び順）
+const groupShelves = (books: Book[]): Shelf[] => {
+  const groups = new Map<string, Book[]>();
+  for (const book of books) {
+    const series = deriveSeriesTitle(book);
+    groups.set(series, [...(groups.get(series) ?? []), book]);
+  }
+  const shelves = [...groups.entries()].map(([series, seriesBooks]): Shelf => {
+    const volumes = seriesBooks
+      .map(book => book.volume_number)
+      .filter((volume): volume is number => volume != null);
+    // 代表本: 指定された本、なければ最小巻
+    const representative = seriesBooks.find(book => book.is_series_representative)
+      ?? [...seriesBooks].sort((a, b) => (a.volume_number ?? 999) - (b.volume_number ?? 999))[0];
+    return {
+      series_title: series,
+      volume_count: seriesBooks.length,
+      min_volume: volumes.length ? Math.min(...volumes) : undefined,
+      max_volume: volumes.length ? Math.max(...volumes) : undefined,
+      read_count: seriesBooks.filter(book => book.status === 'done').length,
+      representative_isbn: representative.isbn,
+      representative_title: representative.title,
+      cover_url: representative.cover_url,
+      updated_at: representative.updated_at,
+    };
+  });
+  return shelves.sort((a, b) =>
+    Number(a.series_title === 'Other') - Number(b.series_title === 'Other')
+    || (a.series_title < b.series_title ? -1 : a.series_title > b.series_title ? 1 : 0));
+};
 
-      reps[series] = representative;
-    });
-    return reps;
-  }, [seriesGroups]);
+export function BookshelfView({ books, status, isSearchActive = false, onBookClick }: BookshelfViewProps) {
+  const [selectedSeries, setSelectedSeries] = useState<string | null>(null);
+  const [serverShelves, setServerShelves] = useState<Shelf[]>([]);
+
+  // シリーズごとの集計（冊数・代表本）はバックエンドの series テーブルから取得する
+  // books が変わったとき（登録・更新・同期後）に取り直す
+  // 検索中はバックエンドの棚だと一覧で隠れている本まで数えてしまうので、books から組み立てる
+  useEffect(() => {
+    if (isSearchActive) return;
+    const params = status ? { status } : {};
+    axios.get('/api/bookshelf', { params })
+      .then(res => setServerShelves(res.data.shelves))
+      .catch(error => console.error("Failed to load bookshelf", error));
+  }, [books, status, isSearchActive]);
+
+  const shelves = useMemo(
+    () => (isSearchActive ? groupShelves(books) : serverShelves),
+    [isSearchActive, books, serverShelves]
+  );
 
   // 第2階層: シリーズ詳細ビュー
   if (selectedSeries) {
-    const seriesBooks = seriesGroups[selectedSeries];
+    const seriesBooks = books.filter(book => deriveSeriesTitle(book) === selectedSeries);
     // 巻数順にソート
     const sortedBooks = [...seriesBooks].sort((a, b) => {
       const volA = a.volume_number ?? 999;
@@ -97,7 +109,7 @@ export function BookshelfView({ books, onBookClick }: BookshelfViewProps) {
               <div className="relative aspect-[2/3] bg-gradient-to-br from-gray-200 to-gray-300 dark:from-gray-700 dark:to-gray-800 rounded-lg overflow-hidden shadow-md transition-all duration-300 hover:shadow-xl hover:scale-105">
                 {book.cover_url ? (
                   <img
-                    src={book.cover_url}
+                    src={localCoverUrl(book, 'card') ?? book.cover_url}
                     alt={book.title}
                     className="w-full h-full object-cover"
                   />
@@ -125,21 +137,18 @@ export function BookshelfView({ books, onBookClick }: BookshelfViewProps) {
     );
   }
 
-  // 第1階層: シリーズ一覧（代表本のみ）
-  const sortedSeries = Object.keys(seriesGroups).sort((a, b) => {
-    if (a === 'Other') return 1;
-    if (b === 'Other') return -1;
-    return a.localeCompare(b, undefined, { numeric: true, sensitivity: 'base' });
-  });
-
+  // 第1階層: シリーズ一覧（代表本のみ、並び順はバックエンドで "Other" が最後）
   return (
     <div className="space-y-8">
       <h2 className="text-2xl font-bold">📚 My Bookshelf</h2>
 
       <div className="grid grid-cols-2 sm:grid-cols-3 md:grid-cols-4 lg:grid-cols-5 xl:grid-cols-6 gap-6">
-        {sortedSeries.map((series) => {
-          const representative = seriesRepresentatives[series];
-          const count = seriesGroups[series].length;
+        {shelves.map((shelf) => {
+          const series = shelf.series_title;
+          const count = shelf.volume_count;
+          const coverSrc = shelf.representative_isbn
+            ? localCoverUrl({ isbn: shelf.representative_isbn, cover_url: shelf.cover_url, updated_at: shelf.updated_at }, 'card')
+            : null;
 
           return (
             <div
@@ -149,16 +158,16 @@ export function BookshelfView({ books, onBookClick }: BookshelfViewProps) {
             >
               {/* 本の表紙 */}
               <div className="relative aspect-[2/3] bg-gradient-to-br from-gray-200 to-gray-300 dark:from-gray-700 dark:to-gray-800 rounded-lg overflow-hidden shadow-lg transition-all duration-300 hover:shadow-2xl hover:scale-105">
-                {representative.cover_url ? (
+                {shelf.cover_url ? (
                   <img
-                    src={representative.cover_url}
-                    alt={representative.title}
+                    src={coverSrc ?? shelf.cover_url}
+                    alt={shelf.representative_title}
                     className="w-full h-full object-cover"
                   />
                 ) : (
                   <div className="w-full h-full flex items-center justify-center p-4">
                     <p className="text-sm font-medium text-center text-gray-600 dark:text-gray-300 line-clamp-6">
-                      {representative.title}
+                      {shelf.representative_title}
                     </p>
                   </div>
                 )}
@@ -4,7 +4,7 @@ import { useState } from 'react';
 import Image from 'next/image';
 import { Book } from '@/types';
 import { generateSpineStyle } from '@/utils/spineGenerator';
-import { optimizeBookCover } from '@/utils/imageHelper';
+import { localCoverUrl } from '@/utils/imageHelper';
 
 interface SpineBookProps {
   book: Book;
@@ -14,7 +14,7 @@ interface SpineBookProps {
 export function SpineBook({ book, onClick }: SpineBookProps) {
   const style = generateSpineStyle(book);
   const [isHovered, setIsHovered] = useState(false);
-  const optimizedCover = optimizeBookCover(book.cover_url);
+  const optimizedCover = localCoverUrl(book, 'card');
 
   return (
     <div 
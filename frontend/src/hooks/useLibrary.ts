@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo } from 'react';
+import { useState, useEffect, useMemo, useRef } from 'react';
 import axios from 'axios';
 import { Book, SortOption, ViewMode } from '@/types';
 
@@ -39,12 +39,16 @@ export const useLibrary = () => {
   // Next.jsのRewrite機能により、バックエンドへ転送される
   const API_BASE_URL = '/api';
 
+  // 差分同期用トークン（GET /books のレスポンスヘッダーから取得）
+  const syncTokenRef = useRef<string | null>(null);
+
   const fetchBooks = async () => {
     setLoading(true);
     setError("");
     try {
       const res = await axios.get(`${API_BASE_URL}/books`);
       setBooks(res.data);
+      syncTokenRef.current = res.headers['x-sync-token'] ?? null;
     } catch (error) {
       console.error("Failed to fetch books", error);
       if (axios.isAxiosError(error)) {
@@ -64,17 +68,55 @@ export const useLibrary = () => {
     }
   };
 
+  // 前回取得以降に追加・更新・削除された本だけを取得して反映する
+  const syncBooks = async () => {
+    if (!syncTokenRef.current) {
+      await fetchBooks();
+      return;
+    }
+    try {
+      const res = await axios.get(`${API_BASE_URL}/books/changes`, {
+        params: { since: syncTokenRef.current }
+      });
+      if (res.data.full_resync) {
+        await fetchBooks();
+        return;
+      }
+      const upserted: Book[] = res.data.upserted;
+      const deleted: string[] = res.data.deleted;
+      setBooks(prev => {
+        const byIsbn = new Map(prev.map(book => [book.isbn, book]));
+        deleted.forEach(isbn => byIsbn.delete(isbn));
+        upserted.forEach(book => byIsbn.set(book.isbn, book));
+        return Array.from(byIsbn.values());
+      });
+      syncTokenRef.current = res.data.token;
+    } catch (error) {
+      console.error("Failed to sync books", error);
+      await fetchBooks();
+    }
+  };
+
   useEffect(() => {
     fetchBooks();
   }, []);
 
+  // バックグラウンドでの書誌情報取得が終わったら差分を取り込む
+  useEffect(() => {
+    const events = new EventSource(`${API_BASE_URL}/books/events`);
+    events.addEventListener('enriched', () => {
+      syncBooks();
+    });
+    return () => events.close();
+  }, []);
+
   const registerBook = async (isbn: string) => {
     setLoading(true);
     setMessage(`Scanning ISBN: ${isbn}...`);
     try {
       await axios.post(`${API_BASE_URL}/books`, { isbn });
       setMessage(`Registered: ${isbn}`);
-      await fetchBooks();
+      await syncBooks();
       return true; // 成功
     } catch (error: any) {
       if (error.response && error.response.status === 400) {
@@ -89,12 +131,32 @@ export const useLibrary = () => {
     }
   };
 
+  // 複数ISBNをまとめて登録（1リクエスト・1トランザクション）
+  const registerBooks = async (isbns: string[]) => {
+    setLoading(true);
+    setMessage(`Registering ${isbns.length} books...`);
+    try {
+      const res = await axios.post(`${API_BASE_URL}/books/batch`, { isbns });
+      const { created, duplicates, failed } = res.data;
+      setMessage(`Registered: ${created} / Already registered: ${duplicates} / Failed: ${failed}`);
+      await syncBooks();
+      return failed === 0;
+    } catch (error) {
+      console.error("Failed to register books", error);
+      setMessage("Failed to register.");
+      return false;
+    } finally {
+      setLoading(false);
+      setTimeout(() => setMessage(""), 3000);
+    }
+  };
+
   const addBook = async (bookData: Partial<Book>) => {
     setLoading(true);
     try {
       await axios.post(`${API_BASE_URL}/books`, bookData);
       setMessage(`Added: ${bookData.title}`);
-      await fetchBooks();
+      await syncBooks();
       return true;
     } catch (error: any) {
       console.error("Failed to add book", error);
@@ -114,7 +176,7 @@ export const useLibrary = () => {
     if(!confirm("Are you sure you want to delete this book?")) return;
     try {
       await axios.delete(`${API_BASE_URL}/books/${isbn}`);
-      fetchBooks();
+      syncBooks();
     } catch (error) {
       console.error("Failed to delete", error);
     }
@@ -123,7 +185,7 @@ export const useLibrary = () => {
   const updateBook = async (isbn: string, data: Partial<Book>) => {
     try {
       await axios.put(`${API_BASE_URL}/books/${isbn}`, data);
-      await fetchBooks();
+      await syncBooks();
       setMessage(`Updated: ${data.title || isbn}`);
     } catch (error) {
       console.error("Failed to update", error);
@@ -209,6 +271,8 @@ export const useLibrary = () => {
 
   return {
     books: processedBooks,
+    // 検索で絞り込み中か（books がライブラリ全体ではない）
+    isSearchActive: debouncedSearch !== '',
     groupedBooks,
     loading,
     message,
@@ -222,7 +286,9 @@ export const useLibrary = () => {
     expandedAuthors,
     toggleAuthor,
     fetchBooks,
+    syncBooks,
     registerBook,
+    registerBooks,
     addBook,
     deleteBook,
     updateBook
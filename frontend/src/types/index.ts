@@ -7,6 +7,8 @@ export interface Book {
   location?: string;
   series_title?: string;
   created_at: string;
+  updated_at?: string;
+  enrichment_status?: string;  // pending, failed (metadata lookup running in the background)
 
   // Wishlist & Reading tracking
   purchased_date?: string;
@@ -35,6 +37,47 @@ export interface Book {
   description?: string;
 }
 
+// GET /bookshelf: one shelf per series (aggregated on the backend)
+export interface Shelf {
+  series_title: string;
+  volume_count: number;
+  min_volume?: number;
+  max_volume?: number;
+  read_count: number;
+  representative_isbn?: string;
+  representative_title?: string;
+  cover_url?: string;
+  updated_at?: string;
+}
+
+// GET /stats: counters maintained by the backend
+export interface StatsEntry {
+  name: string;
+  count: number;
+}
+
+export interface LibraryStats {
+  total: number;
+  by_status: Record<string, number>;
+  added_this_month: number;
+  finished_this_month: number;
+  monthly: {
+    added: Record<string, number>;
+    started: Record<string, number>;
+    finished: Record<string, number>;
+  };
+  top: {
+    author: StatsEntry[];
+    series: StatsEntry[];
+    label: StatsEntry[];
+    lent_to: StatsEntry[];
+  };
+  lending: {
+    lent: number;
+    overdue: number;
+  };
+}
+
 export type BookStatus = 'wishlist' | 'ordered' | 'purchased_unread' | 'reading' | 'done' | 'paused' | 'unread';
 export type SortOption = 'created_desc' | 'created_asc' | 'title_asc' | 'author_asc';
 export type ViewMode = 'grid' | 'author_group' | 'series_group' | 'bookshelf' | 'stats';
@@ -24,3 +24,17 @@ export const optimizeBookCover = (url?: string): string | null => {
   // 4. 版元ドットコム等はそのまま返す
   return newUrl;
 };
+
+export type CoverSize = 'spine' | 'thumb' | 'card' | 'original';
+
+// バックエンドのローカル表紙キャッシュ (/covers/{isbn}) のURL
+// v に updated_at を付けて、表紙が変わらない限りブラウザキャッシュをそのまま使う
+export const localCoverUrl = (
+  book: { isbn: string; cover_url?: string; updated_at?: string },
+  size: CoverSize = 'thumb'
+): string | null => {
+  if (!book.cover_url) return null;
+  const params = new URLSearchParams({ size });
+  if (book.updated_at) params.set('v', book.updated_at);
+  return `/api/covers/${encodeURIComponent(book.isbn)}?${params.toString()}`;
+};